@@ -0,0 +1,3 @@
+"""
+Load-test and micro-benchmark suite for the joke API. See ``python -m benchmarks --help``.
+"""
@@ -0,0 +1,293 @@
+"""
+Runs the benchmark suite: ``python -m benchmarks --help``.
+
+Each corpus size runs in a fresh child process, so that startup cost and peak RSS are measured for
+that size alone. The parent collects the children's results into one JSON document.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+SEED_CHUNK_SIZE = 10000
+SEED_USERS = 100
+SEED_MAX_RATINGS = 10000
+SEED_MAX_LOCALIZATIONS = 10000
+SEED_LANGUAGES = ("es", "de")
+
+
+def parse_size(value: str) -> int:
+    multipliers = {"k": 1000, "m": 1000000}
+    suffix = value[-1].lower()
+    if suffix in multipliers:
+        return int(float(value[:-1]) * multipliers[suffix])
+    return int(value)
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+async def seed(size: int, rng: random.Random, reset: bool) -> Dict[str, Any]:
+    """
+    Writes the corpus through the Prisma client, so that either backend is seeded the same way.
+    """
+    import bcrypt
+    import prisma
+    import prisma.models
+
+    from benchmarks.load import BENCH_PASSWORD, PROFILE_EMAIL
+    from project.password_hashing import BCRYPT_ROUNDS
+
+    Joke = prisma.models.Joke.prisma()
+    User = prisma.models.User.prisma()
+    if reset:
+        await User.delete_many()
+        await Joke.delete_many()
+    elif await Joke.count() or await User.count():
+        raise SystemExit("Refusing to seed a non-empty database; pass --reset to wipe it first")
+
+    password = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode()
+    users = [
+        {"id": f"00000000-0000-4000-8000-{i:012d}", "email": f"bench-user-{i}@example.com"}
+        for i in range(SEED_USERS)
+    ]
+    users.append({"id": "00000000-0000-4000-9000-000000000000", "email": PROFILE_EMAIL})
+    await User.create_many(data=[{**user, "password": password} for user in users])
+
+    joke_ids = []
+    for start in range(0, size, SEED_CHUNK_SIZE):
+        rows = [
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "content": f"Joke {i}: why did the chicken cross the road? To get to {i + 1}.",
+            }
+            for i in range(start, min(size, start + SEED_CHUNK_SIZE))
+        ]
+        await Joke.create_many(data=rows)
+        joke_ids.extend(row["id"] for row in rows)
+
+    now = datetime.now(timezone.utc)
+    ratings = [
+        {
+            "jokeId": rng.choice(joke_ids),
+            "userId": rng.choice(users)["id"],
+            "score": rng.randint(1, 5),
+            "createdAt": now - timedelta(days=rng.randrange(30), seconds=rng.randrange(86400)),
+        }
+        for _ in range(min(size, SEED_MAX_RATINGS))
+    ]
+    for start in range(0, len(ratings), SEED_CHUNK_SIZE):
+        await prisma.models.Rating.prisma().create_many(
+            data=ratings[start : start + SEED_CHUNK_SIZE]
+        )
+    localizations = [
+        {
+            "jokeId": joke_id,
+            "language": language,
+            "content": prisma.Json({"content": f"[{language}] joke {joke_id}"}),
+        }
+        for joke_id in joke_ids[:SEED_MAX_LOCALIZATIONS]
+        for language in SEED_LANGUAGES
+    ]
+    for start in range(0, len(localizations), SEED_CHUNK_SIZE):
+        await prisma.models.Localization.prisma().create_many(
+            data=localizations[start : start + SEED_CHUNK_SIZE]
+        )
+    return {
+        "joke_ids": joke_ids,
+        "user_ids": [user["id"] for user in users],
+        "login_email": users[0]["email"],
+        "profile_user_id": users[-1]["id"],
+    }
+
+
+async def run_child(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.database == "fake":
+        from benchmarks import fake_prisma
+
+        fake_prisma.install(seed=args.seed, latency=args.latency / 1000)
+
+    from benchmarks.load import SCENARIOS, BenchContext, run_scenario
+    from benchmarks.micro import run_micro_benchmarks
+    from project.server import app, db_client
+    from project.sessions import session_signer
+
+    rng = random.Random(args.seed)
+    result: Dict[str, Any] = {"size": args.size, "rss_bytes": {}}
+
+    start = time.perf_counter()
+    await db_client.connect()
+    seeded = await seed(args.size, rng, args.reset)
+    await db_client.disconnect()
+    result["seed_seconds"] = time.perf_counter() - start
+    result["rss_bytes"]["peak_after_seed"] = peak_rss_bytes()
+
+    lifespan = app.router.lifespan_context(app)
+    start = time.perf_counter()
+    await lifespan.__aenter__()
+    try:
+        result["startup_seconds"] = time.perf_counter() - start
+        result["rss_bytes"]["peak_after_startup"] = peak_rss_bytes()
+
+        context = BenchContext(
+            rng=rng,
+            joke_ids=seeded["joke_ids"],
+            user_ids=seeded["user_ids"],
+            login_email=seeded["login_email"],
+            session_token=session_signer.issue(seeded["profile_user_id"]),
+        )
+        scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+        result["scenarios"] = []
+        if not args.skip_load:
+            for scenario in scenarios:
+                logging.getLogger("benchmarks").info("Running %s", scenario.name)
+                result["scenarios"].append(
+                    await run_scenario(
+                        app, scenario, context, args.requests, args.concurrency, args.warmup
+                    )
+                )
+        result["micro"] = []
+        if not args.skip_micro:
+            result["micro"] = await run_micro_benchmarks(
+                seeded["profile_user_id"], args.micro_scale
+            )
+    finally:
+        await lifespan.__aexit__(None, None, None)
+    result["rss_bytes"]["peak"] = peak_rss_bytes()
+    return result
+
+
+def run_parent(args: argparse.Namespace, argv: List[str]) -> Dict[str, Any]:
+    runs = []
+    for size in args.sizes:
+        command = [sys.executable, "-m", "benchmarks", *argv, "--child", "--size", str(size)]
+        # A snapshot left by another size or run would be mapped instead of the seeded corpus.
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, JOKE_SNAPSHOT_PATH=os.path.join(directory, "jokes.snapshot"))
+            # All load comes from one client address, which any rate limits would throttle.
+            env.setdefault("RATE_LIMITS", "")
+            completed = subprocess.run(command, stdout=subprocess.PIPE, check=True, env=env)
+        runs.append(json.loads(completed.stdout))
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": args.database,
+            "joke_index_mode": os.getenv("JOKE_INDEX_MODE", "memory"),
+            "rate_limits": os.getenv("RATE_LIMITS", ""),
+            "latency_ms": args.latency,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "bcrypt_rounds": int(os.getenv("BCRYPT_ROUNDS", "12")),
+        },
+        "runs": runs,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Load-tests every route of the app in-process and runs micro-benchmarks.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [parse_size(size) for size in value.split(",")],
+        default=[1000, 100000, 1000000],
+        help="Comma-separated corpus sizes, e.g. 1k,100k,1M (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--database",
+        choices=("fake", "postgres"),
+        default="fake",
+        help="'fake' uses the deterministic in-memory Prisma stand-in; 'postgres' uses the "
+        "generated client against DATABASE_URL, which must point at a throwaway database",
+    )
+    parser.add_argument(
+        "--reset", action="store_true", help="Delete all users and jokes before seeding"
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Simulated round trip per fake query, in milliseconds (default: %(default)s)",
+    )
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per scenario")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for data and request mix")
+    parser.add_argument(
+        "--only",
+        type=lambda value: set(value.split(",")),
+        default=None,
+        help="Comma-separated scenario names to run",
+    )
+    parser.add_argument("--skip-load", action="store_true", help="Skip the HTTP scenarios")
+    parser.add_argument("--skip-micro", action="store_true", help="Skip the micro-benchmarks")
+    parser.add_argument(
+        "--micro-scale", type=float, default=1.0, help="Multiplier for micro-benchmark call counts"
+    )
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv: List[str]) -> None:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.child else logging.WARNING,
+        stream=sys.stderr,
+        format="%(asctime)s %(name)s %(levelname)s %(message)s",
+    )
+    # The app logs every buffered write and reconcile; keep the benchmark output readable.
+    logging.getLogger("project").setLevel(logging.WARNING)
+    if args.child:
+        json.dump(asyncio.run(run_child(args)), sys.stdout)
+        return
+    report = run_parent(args, argv)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
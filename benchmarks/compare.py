@@ -0,0 +1,55 @@
+"""
+Compares two benchmark reports: ``python -m benchmarks.compare BASELINE.json CANDIDATE.json``.
+
+Prints throughput and latency percentiles side by side for every scenario and micro-benchmark
+present in both reports, with the relative change.
+"""
+import argparse
+import json
+from typing import Any, Dict, Iterator, Tuple
+
+
+def _rows(report: Dict[str, Any]) -> Iterator[Tuple[Tuple[int, str], Dict[str, float]]]:
+    for run in report["runs"]:
+        for scenario in run.get("scenarios", []):
+            yield (run["size"], scenario["name"]), {
+                "rps": scenario["throughput_rps"],
+                "p50_ms": scenario["latency_ms"]["p50"],
+                "p99_ms": scenario["latency_ms"]["p99"],
+            }
+        for micro in run.get("micro", []):
+            yield (run["size"], f"micro:{micro['name']}"), {
+                "p50_us": micro["per_call_us"]["p50"],
+            }
+        yield (run["size"], "peak_rss_mib"), {"mib": run["rss_bytes"]["peak"] / 2**20}
+
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+    with open(args.baseline) as baseline_file, open(args.candidate) as candidate_file:
+        baseline = dict(_rows(json.load(baseline_file)))
+        candidate = dict(_rows(json.load(candidate_file)))
+    print(f"{'size':>8}  {'benchmark':<42} {'metric':<7} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    for key, before in baseline.items():
+        after = candidate.get(key)
+        if after is None:
+            continue
+        size, name = key
+        for metric, value in before.items():
+            print(
+                f"{size:>8}  {name:<42} {metric:<7} {value:>12.3f} {after[metric]:>12.3f} "
+                f"{_change(value, after[metric]):>9}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,785 @@
+"""
+Deterministic in-memory stand-in for the generated Prisma client.
+
+``install()`` registers fake ``prisma``, ``prisma.models``, ``prisma.enums`` and ``prisma.errors``
+modules in ``sys.modules`` so that the FastAPI app and the service functions can run without
+Postgres or a generated client. It must be called before anything under ``project`` is imported.
+Only the subset of the query API used by this project is implemented.
+
+IDs come from a seeded random generator and timestamps from a strictly increasing clock, so two runs
+with the same seed see byte-identical data. An optional fixed ``latency`` is awaited on every
+query to approximate a network round trip.
+"""
+import asyncio
+import bisect
+import contextlib
+import enum
+import random
+import sys
+import types
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class Role(str, enum.Enum):
+    ADMIN = "ADMIN"
+    USER = "USER"
+    EDITOR = "EDITOR"
+
+
+class SubmissionStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    ACCEPTED = "ACCEPTED"
+    REJECTED = "REJECTED"
+
+
+class Json:
+    """
+    Stand-in for ``prisma.Json``, which wraps values written to Json columns.
+    """
+
+    def __init__(self, data: Any) -> None:
+        self.data = data
+
+
+def _stored(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, Json):
+        return value.data
+    return value
+
+
+class Record:
+    def __init__(self, **fields: Any) -> None:
+        self.__dict__.update(fields)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.__dict__!r})"
+
+
+MODEL_DEFAULTS: Dict[str, Dict[str, Callable[[], Any]]] = {
+    "User": {"role": lambda: Role.USER},
+    "Joke": {"submittedBy": lambda: None, "contentHash": lambda: None},
+    "Submission": {"content": lambda: None, "jokeId": lambda: None, "reason": lambda: None},
+    "Rating": {},
+    "Localization": {},
+}
+UPDATED_AT_MODELS = {"User", "Joke", "Submission", "Localization"}
+UNIQUE_FIELDS: Dict[str, List[str]] = {"User": ["email"], "Joke": ["contentHash"]}
+COMPOUND_UNIQUES: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "Localization": {"jokeId_language": ("jokeId", "language")}
+}
+FOREIGN_KEYS = {
+    "Rating": {"jokeId": "Joke", "userId": "User"},
+    "Submission": {"jokeId": "Joke", "userId": "User"},
+    "Localization": {"jokeId": "Joke"},
+}
+# Composite indexes from schema.prisma that ordered reads can walk instead of sorting the table.
+INDEXES: Dict[str, List[Tuple[str, ...]]] = {"Joke": [("createdAt", "id")]}
+# Child model -> foreign key column, for rows removed together with their joke.
+CASCADES = {"Rating": "jokeId", "Localization": "jokeId"}
+# Child model -> foreign key column cleared when its joke is removed.
+SET_NULLS = {"Submission": "jokeId"}
+
+
+class FakeDatabase:
+    def __init__(self, seed: int = 0, latency: float = 0.0) -> None:
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {
+            name: {} for name in MODEL_DEFAULTS
+        }
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._clock = 0
+        self._versions: Dict[str, int] = {name: 0 for name in MODEL_DEFAULTS}
+        # Maintained from first use on, so unique checks are lookups rather than table scans.
+        self._uniques: Dict[Tuple[str, Tuple[str, ...]], Dict[Tuple[Any, ...], str]] = {}
+        self._sorted: Dict[Tuple[str, Tuple[str, ...]], Tuple[int, List[Any], List[Dict[str, Any]]]] = {}
+        # Rows as they were before each write of the open transaction, oldest first.
+        self._undo: Optional[List[Tuple[str, str, Optional[Dict[str, Any]]]]] = None
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(int=self._rng.getrandbits(128), version=4))
+
+    def now(self) -> datetime:
+        # A strictly increasing clock keeps createdAt/updatedAt ordering deterministic.
+        self._clock += 1
+        return datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(
+            microseconds=self._clock
+        )
+
+    def changed(self, model: str) -> None:
+        """
+        Marks a table's row set as changed, invalidating its sorted view.
+        """
+        self._versions[model] += 1
+
+    def sorted_rows(
+        self, model: str, fields: Tuple[str, ...] = ("id",)
+    ) -> Tuple[List[Any], List[Dict[str, Any]]]:
+        """
+        Returns the table's sort keys and rows ordered by ``fields``, re-sorting only after rows
+        were added or removed. Keys are plain values for a single field and tuples otherwise.
+        """
+        cached = self._sorted.get((model, fields))
+        if cached is None or cached[0] != self._versions[model]:
+            if fields == ("id",):
+                key = lambda row: row["id"]
+            else:
+                key = lambda row: tuple(row[field] for field in fields)
+            rows = sorted(self.tables[model].values(), key=key)
+            cached = (self._versions[model], [key(row) for row in rows], rows)
+            self._sorted[(model, fields)] = cached
+        return cached[1], cached[2]
+
+    def unique_map(self, model: str, fields: Tuple[str, ...]) -> Dict[Tuple[Any, ...], str]:
+        """
+        Returns the map from a unique key's values to the ID of the row holding them.
+        """
+        unique = self._uniques.get((model, fields))
+        if unique is None:
+            unique = {}
+            for row in self.tables[model].values():
+                key = tuple(row.get(field) for field in fields)
+                if None not in key:
+                    unique[key] = row["id"]
+            self._uniques[(model, fields)] = unique
+        return unique
+
+    def track(self, model: str, row: Dict[str, Any], present: bool) -> None:
+        """
+        Records that a row was stored (``present``) or removed, in the unique maps built so far.
+        """
+        for fields in _unique_keys(model):
+            unique = self._uniques.get((model, fields))
+            if unique is None:
+                continue
+            key = tuple(row.get(field) for field in fields)
+            if None in key:
+                continue
+            if present:
+                unique[key] = row["id"]
+            elif unique.get(key) == row["id"]:
+                del unique[key]
+
+    def journal(self, model: str, row_id: str) -> None:
+        """
+        Saves a row, or its absence, before a write inside a transaction, so that a rollback only
+        has to restore the rows the transaction wrote rather than copy the whole database.
+        """
+        if self._undo is not None:
+            row = self.tables[model].get(row_id)
+            self._undo.append((model, row_id, None if row is None else dict(row)))
+
+    def begin(self) -> None:
+        self._undo = []
+
+    def commit(self) -> None:
+        self._undo = None
+
+    def rollback(self) -> None:
+        undo, self._undo = self._undo or [], None
+        for model, row_id, saved in reversed(undo):
+            table = self.tables[model]
+            if saved is None:
+                table.pop(row_id, None)
+            elif row_id in table:
+                table[row_id].clear()
+                table[row_id].update(saved)
+            else:
+                table[row_id] = saved
+        # Rebuilt from the restored rows on next use.
+        self._uniques.clear()
+        for model in self.tables:
+            self.changed(model)
+
+    async def roundtrip(self) -> None:
+        await asyncio.sleep(self.latency)
+
+
+def _unique_keys(model: str) -> List[Tuple[str, ...]]:
+    keys = [(field,) for field in UNIQUE_FIELDS.get(model, [])]
+    keys.extend(COMPOUND_UNIQUES.get(model, {}).values())
+    return keys
+
+
+DATABASE = FakeDatabase()
+_builtin_sum = sum
+
+
+def _match_value(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict):
+        for op, operand in condition.items():
+            if isinstance(operand, enum.Enum):
+                operand = operand.value
+            if op == "equals" and value != operand:
+                return False
+            if op == "not":
+                if isinstance(operand, dict):
+                    if _match_value(value, operand):
+                        return False
+                elif value == operand:
+                    return False
+            if op == "in" and value not in operand:
+                return False
+            if op == "not_in" and value in operand:
+                return False
+            if op in ("gt", "gte", "lt", "lte"):
+                if value is None:
+                    return False
+                if op == "gt" and not value > operand:
+                    return False
+                if op == "gte" and not value >= operand:
+                    return False
+                if op == "lt" and not value < operand:
+                    return False
+                if op == "lte" and not value <= operand:
+                    return False
+            if op == "contains" and (value is None or operand not in value):
+                return False
+            if op == "startswith" and (value is None or not value.startswith(operand)):
+                return False
+        return True
+    if isinstance(condition, enum.Enum):
+        condition = condition.value
+    if isinstance(value, enum.Enum):
+        value = value.value
+    return value == condition
+
+
+def _matches(row: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "AND":
+            if not all(_matches(row, c) for c in _as_list(condition)):
+                return False
+        elif key == "OR":
+            if not any(_matches(row, c) for c in _as_list(condition)):
+                return False
+        elif key == "NOT":
+            if any(_matches(row, c) for c in _as_list(condition)):
+                return False
+        elif not _match_value(row.get(key), condition):
+            return False
+    return True
+
+
+def _as_list(value: Any) -> List[Any]:
+    return value if isinstance(value, list) else [value]
+
+
+def _by_id(order: Any) -> bool:
+    return not order or _as_list(order) == [{"id": "asc"}]
+
+
+def _index_fields(model: str, order: Any) -> Optional[Tuple[str, ...]]:
+    # An ascending order on the columns of a composite index, e.g. [{"createdAt": "asc"}, ...].
+    if not order:
+        return None
+    fields = []
+    for clause in _as_list(order):
+        if len(clause) != 1 or list(clause.values()) != ["asc"]:
+            return None
+        fields.extend(clause)
+    fields_tuple = tuple(fields)
+    return fields_tuple if fields_tuple in INDEXES.get(model, []) else None
+
+
+def _lower_bound(keys: List[Tuple[Any, ...]], where: Optional[Dict[str, Any]], field: str) -> int:
+    # Seeks to a gt/gte bound on the index's leading column, as an index range scan would.
+    condition = (where or {}).get(field)
+    if not isinstance(condition, dict):
+        return 0
+    if "gte" in condition:
+        return bisect.bisect_left(keys, (condition["gte"],))
+    if "gt" in condition:
+        start = bisect.bisect_left(keys, (condition["gt"],))
+        while start < len(keys) and keys[start][0] == condition["gt"]:
+            start += 1
+        return start
+    return 0
+
+
+def _sort(rows: List[Dict[str, Any]], order: Any) -> List[Dict[str, Any]]:
+    for clause in reversed(_as_list(order)):
+        for field, direction in reversed(list(clause.items())):
+            rows = sorted(
+                rows,
+                key=lambda r: (r.get(field) is None, r.get(field)),
+                reverse=direction == "desc",
+            )
+    return rows
+
+
+_RECORD_TYPES: Dict[str, type] = {}
+
+
+class Actions:
+    def __init__(self, model: str) -> None:
+        self.model = model
+
+    @property
+    def table(self) -> Dict[str, Dict[str, Any]]:
+        return DATABASE.tables[self.model]
+
+    def _record(self, row: Dict[str, Any]) -> Record:
+        record_type = _RECORD_TYPES.get(self.model)
+        if record_type is None:
+            record_type = _RECORD_TYPES[self.model] = type(self.model, (Record,), {})
+        return record_type(**row)
+
+    def _flatten(self, where: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # A compound unique key such as {"jokeId_language": {...}} filters on each of its fields.
+        compounds = COMPOUND_UNIQUES.get(self.model)
+        if not where or not compounds or not any(key in compounds for key in where):
+            return where
+        flat: Dict[str, Any] = {}
+        for key, condition in where.items():
+            if key in compounds:
+                flat.update(condition)
+            else:
+                flat[key] = condition
+        return flat
+
+    def _candidates(self, where: Optional[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        # Lookups by primary or unique key skip the table scan, as an index would.
+        if not where:
+            return None
+        if "id" not in where:
+            for field in UNIQUE_FIELDS.get(self.model, []):
+                if isinstance(where.get(field), str):
+                    owner = DATABASE.unique_map(self.model, (field,)).get((where[field],))
+                    return [] if owner is None else [self.table[owner]]
+            return None
+        condition = where["id"]
+        if isinstance(condition, str):
+            keys = [condition]
+        elif isinstance(condition, dict) and set(condition) == {"in"}:
+            keys = condition["in"]
+        else:
+            return None
+        table = self.table
+        return [table[key] for key in dict.fromkeys(keys) if key in table]
+
+    def _query(
+        self,
+        where: Optional[Dict[str, Any]] = None,
+        order: Any = None,
+        cursor: Optional[Dict[str, Any]] = None,
+        skip: Optional[int] = None,
+        take: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        where = self._flatten(where)
+        candidates = self._candidates(where)
+        start = 0
+        if candidates is not None:
+            rows = sorted(
+                (r for r in candidates if _matches(r, where)), key=lambda r: r["id"]
+            )
+            if not _by_id(order):
+                rows = _sort(rows, order)
+        elif order is None and cursor is None and skip is None and take is None:
+            # Nothing depends on the row order, so skip sorting, as the database would.
+            rows = [r for r in self.table.values() if _matches(r, where)]
+        elif cursor is None and (fields := _index_fields(self.model, order)) is not None:
+            keys, ordered = DATABASE.sorted_rows(self.model, fields)
+            wanted = None if take is None else (skip or 0) + take
+            rows = []
+            for position in range(_lower_bound(keys, where, fields[0]), len(ordered)):
+                row = ordered[position]
+                if _matches(row, where):
+                    rows.append(row)
+                    if wanted is not None and len(rows) == wanted:
+                        break
+        elif _by_id(order):
+            ids, rows = DATABASE.sorted_rows(self.model)
+            if cursor and set(cursor) == {"id"}:
+                start = bisect.bisect_left(ids, cursor["id"])
+                if start == len(ids) or ids[start] != cursor["id"]:
+                    return []
+                cursor = None
+            if where:
+                rows = [r for r in rows[start:] if _matches(r, where)]
+                start = 0
+        else:
+            rows = _sort([r for r in self.table.values() if _matches(r, where)], order)
+        if cursor:
+            for i, row in enumerate(rows):
+                if _matches(row, cursor):
+                    start = i
+                    break
+            else:
+                return []
+        start += skip or 0
+        end = len(rows) if take is None else start + take
+        return rows[start:end]
+
+    def _check_unique(self, row: Dict[str, Any]) -> None:
+        for fields in _unique_keys(self.model):
+            key = tuple(row.get(field) for field in fields)
+            if None in key:
+                continue
+            owner = DATABASE.unique_map(self.model, fields).get(key)
+            if owner is not None and owner != row["id"]:
+                names = ",".join(f"`{field}`" for field in fields)
+                raise UniqueViolationError(f"Unique constraint failed on the fields: ({names})")
+
+    def _check_foreign_keys(self, row: Dict[str, Any]) -> None:
+        for field, model in FOREIGN_KEYS.get(self.model, {}).items():
+            value = row.get(field)
+            if value is not None and value not in DATABASE.tables[model]:
+                raise ForeignKeyViolationError(
+                    f"Foreign key constraint failed on the field: `{field}`"
+                )
+
+    def _build(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        row = {key: factory() for key, factory in MODEL_DEFAULTS[self.model].items()}
+        row["id"] = DATABASE.new_id()
+        row["createdAt"] = DATABASE.now()
+        if self.model in UPDATED_AT_MODELS:
+            row["updatedAt"] = row["createdAt"]
+        for key, value in data.items():
+            if isinstance(value, dict) and "connect" in value:
+                continue
+            row[key] = _stored(value)
+        return row
+
+    def _insert(self, row: Dict[str, Any]) -> None:
+        DATABASE.journal(self.model, row["id"])
+        self.table[row["id"]] = row
+        DATABASE.track(self.model, row, True)
+        DATABASE.changed(self.model)
+
+    def _remove(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            DATABASE.journal(self.model, row["id"])
+            del self.table[row["id"]]
+            DATABASE.track(self.model, row, False)
+        DATABASE.changed(self.model)
+        if self.model != "Joke" or not rows:
+            return
+        gone = {row["id"] for row in rows}
+        for child, column in CASCADES.items():
+            table = DATABASE.tables[child]
+            for key in [k for k, r in table.items() if r.get(column) in gone]:
+                DATABASE.journal(child, key)
+                DATABASE.track(child, table.pop(key), False)
+            DATABASE.changed(child)
+        for child, column in SET_NULLS.items():
+            for row in DATABASE.tables[child].values():
+                if row.get(column) in gone:
+                    DATABASE.journal(child, row["id"])
+                    row[column] = None
+            DATABASE.changed(child)
+
+    async def find_many(self, take=None, skip=None, where=None, cursor=None, order=None, include=None, distinct=None):
+        await DATABASE.roundtrip()
+        return [self._record(r) for r in self._query(where, order, cursor, skip, take)]
+
+    async def find_first(self, skip=None, where=None, cursor=None, order=None, include=None):
+        await DATABASE.roundtrip()
+        rows = self._query(where, order, cursor, skip, 1)
+        return self._record(rows[0]) if rows else None
+
+    async def find_unique(self, where, include=None):
+        await DATABASE.roundtrip()
+        rows = self._query(where, take=1)
+        return self._record(rows[0]) if rows else None
+
+    async def count(self, where=None, **kwargs):
+        await DATABASE.roundtrip()
+        if not where:
+            return len(self.table)
+        return len(self._query(where))
+
+    async def create(self, data, include=None):
+        await DATABASE.roundtrip()
+        row = self._build(data)
+        self._check_foreign_keys(row)
+        self._check_unique(row)
+        self._insert(row)
+        return self._record(row)
+
+    async def create_many(self, data, skip_duplicates=False):
+        await DATABASE.roundtrip()
+        rows = [self._build(item) for item in data]
+        for row in rows:
+            self._check_foreign_keys(row)
+        # Validate the whole batch before writing anything, so a failure inserts no rows.
+        keys = _unique_keys(self.model)
+        batch: Dict[Tuple[str, ...], set] = {fields: set() for fields in keys}
+        accepted = []
+        for row in rows:
+            values = [(fields, tuple(row.get(f) for f in fields)) for fields in keys]
+            duplicate = row["id"] in self.table or any(
+                None not in key
+                and (key in DATABASE.unique_map(self.model, fields) or key in batch[fields])
+                for fields, key in values
+            )
+            if duplicate:
+                if skip_duplicates:
+                    continue
+                raise UniqueViolationError("Unique constraint failed")
+            for fields, key in values:
+                batch[fields].add(key)
+            accepted.append(row)
+        for row in accepted:
+            DATABASE.journal(self.model, row["id"])
+            self.table[row["id"]] = row
+            DATABASE.track(self.model, row, True)
+        DATABASE.changed(self.model)
+        return len(accepted)
+
+    def _apply(self, row: Dict[str, Any], data: Dict[str, Any]) -> None:
+        updated = dict(row)
+        for key, value in data.items():
+            if isinstance(value, dict) and "increment" in value:
+                value = updated.get(key, 0) + value["increment"]
+            updated[key] = _stored(value)
+        if self.model in UPDATED_AT_MODELS and "updatedAt" not in data:
+            updated["updatedAt"] = DATABASE.now()
+        self._check_unique(updated)
+        DATABASE.journal(self.model, row["id"])
+        DATABASE.track(self.model, row, False)
+        row.update(updated)
+        DATABASE.track(self.model, row, True)
+
+    async def update(self, where, data, include=None):
+        await DATABASE.roundtrip()
+        rows = self._query(where, take=1)
+        if not rows:
+            return None
+        self._apply(rows[0], data)
+        return self._record(rows[0])
+
+    async def update_many(self, where, data):
+        await DATABASE.roundtrip()
+        rows = self._query(where)
+        for row in rows:
+            self._apply(row, data)
+        return len(rows)
+
+    async def upsert(self, where, data, include=None):
+        await DATABASE.roundtrip()
+        rows = self._query(where, take=1)
+        if rows:
+            self._apply(rows[0], data["update"])
+            return self._record(rows[0])
+        row = self._build(data["create"])
+        self._check_foreign_keys(row)
+        self._check_unique(row)
+        self._insert(row)
+        return self._record(row)
+
+    async def delete(self, where, include=None):
+        await DATABASE.roundtrip()
+        rows = self._query(where, take=1)
+        if not rows:
+            return None
+        self._remove(rows)
+        return self._record(rows[0])
+
+    async def delete_many(self, where=None):
+        await DATABASE.roundtrip()
+        rows = self._query(where)
+        self._remove(rows)
+        return len(rows)
+
+    async def group_by(self, by, where=None, sum=None, count=None, avg=None, order=None, take=None, **kwargs):
+        await DATABASE.roundtrip()
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in self.table.values():
+            if _matches(row, where):
+                groups.setdefault(tuple(row.get(f) for f in by), []).append(row)
+        results = []
+        for key, rows in groups.items():
+            result: Dict[str, Any] = dict(zip(by, key))
+            if sum:
+                result["_sum"] = {f: _builtin_sum(r[f] for r in rows) for f in sum}
+            if count:
+                result["_count"] = (
+                    {"_all": len(rows)} if count is True else {f: len(rows) for f in count}
+                )
+            if avg:
+                result["_avg"] = {f: _builtin_sum(r[f] for r in rows) / len(rows) for f in avg}
+            results.append(result)
+        return results
+
+
+class PrismaError(Exception):
+    pass
+
+
+class DataError(PrismaError):
+    pass
+
+
+class UniqueViolationError(DataError):
+    pass
+
+
+class ForeignKeyViolationError(DataError):
+    pass
+
+
+class RecordNotFoundError(DataError):
+    pass
+
+
+class ClientNotConnectedError(PrismaError):
+    pass
+
+
+class Prisma:
+    def __init__(self, auto_register: bool = False, **kwargs: Any) -> None:
+        self._connected = False
+        self.options = kwargs
+
+    async def connect(self, timeout: Any = None) -> None:
+        await DATABASE.roundtrip()
+        self._connected = True
+
+    async def disconnect(self, timeout: Any = None) -> None:
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    @contextlib.asynccontextmanager
+    async def tx(self, max_wait: Any = None, timeout: Any = None):
+        DATABASE.begin()
+        try:
+            yield self
+        except BaseException:
+            DATABASE.rollback()
+            raise
+        DATABASE.commit()
+
+    async def query_raw(self, query: str, *args: Any) -> List[Dict[str, Any]]:
+        await DATABASE.roundtrip()
+        if query.strip().upper().startswith("SELECT 1"):
+            return [{"?column?": 1}]
+        handler = RAW_HANDLERS.get(query.strip().split()[0].upper())
+        if handler is None:
+            raise PrismaError(f"Unsupported raw query in fake client: {query}")
+        return handler(query, *args)
+
+    async def execute_raw(self, query: str, *args: Any) -> int:
+        await DATABASE.roundtrip()
+        handler = RAW_HANDLERS.get(query.strip().split()[0].upper())
+        return 0 if handler is None else len(handler(query, *args))
+
+
+def _claim_submissions(query: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    The moderation queue's ``SELECT ... FOR UPDATE SKIP LOCKED``. There is only one writer here, so
+    nothing is ever locked.
+    """
+    if '"Submission"' not in query:
+        raise PrismaError(f"Unsupported raw query in fake client: {query}")
+    pending = sorted(
+        (row for row in DATABASE.tables["Submission"].values() if row["status"] == "PENDING"),
+        key=lambda row: (row["createdAt"], row["id"]),
+    )
+    return [
+        {
+            "id": row["id"],
+            "userId": row["userId"],
+            "content": row["content"],
+            "submittedAt": row["createdAt"].timestamp(),
+        }
+        for row in pending[:limit]
+    ]
+
+
+def _decide_submissions(
+    query: str, ids: List[str], statuses: List[str], joke_ids: List[Any], reasons: List[Any]
+) -> List[Dict[str, Any]]:
+    """
+    The moderation queue's ``UPDATE ... FROM unnest(...)`` recording a batch of decisions.
+    """
+    if '"Submission"' not in query:
+        raise PrismaError(f"Unsupported raw query in fake client: {query}")
+    table = DATABASE.tables["Submission"]
+    updated = []
+    for submission_id, status, joke_id, reason in zip(ids, statuses, joke_ids, reasons):
+        row = table.get(submission_id)
+        if row is None:
+            continue
+        if joke_id is not None and joke_id not in DATABASE.tables["Joke"]:
+            raise ForeignKeyViolationError("Foreign key constraint failed on the field: `jokeId`")
+        DATABASE.journal("Submission", submission_id)
+        row.update(status=status, jokeId=joke_id, reason=reason, updatedAt=DATABASE.now())
+        updated.append(row)
+    DATABASE.changed("Submission")
+    return updated
+
+
+# First SQL keyword -> handler, for raw queries that a feature needs the fake client to answer.
+RAW_HANDLERS: Dict[str, Callable[..., List[Dict[str, Any]]]] = {
+    "SELECT": _claim_submissions,
+    "UPDATE": _decide_submissions,
+}
+
+
+def _model(name: str) -> type:
+    # Queries inside a transaction pass its client, which is the only client here.
+    return type(
+        name, (Record,), {"prisma": classmethod(lambda cls, client=None: Actions(name))}
+    )
+
+
+def install(seed: int = 0, latency: float = 0.0) -> FakeDatabase:
+    """
+    Registers the fake client modules and returns a fresh, empty database.
+    """
+    global DATABASE
+    DATABASE = FakeDatabase(seed=seed, latency=latency)
+    root = types.ModuleType("prisma")
+    models = types.ModuleType("prisma.models")
+    enums = types.ModuleType("prisma.enums")
+    errors = types.ModuleType("prisma.errors")
+    for name in MODEL_DEFAULTS:
+        setattr(models, name, _model(name))
+    enums.Role = Role
+    enums.SubmissionStatus = SubmissionStatus
+    for error in (
+        PrismaError,
+        DataError,
+        UniqueViolationError,
+        ForeignKeyViolationError,
+        RecordNotFoundError,
+        ClientNotConnectedError,
+    ):
+        setattr(errors, error.__name__, error)
+    root.Prisma = Prisma
+    root.Json = Json
+    root.models = models
+    root.enums = enums
+    root.errors = errors
+    sys.modules.update(
+        {"prisma": root, "prisma.models": models, "prisma.enums": enums, "prisma.errors": errors}
+    )
+    return DATABASE
+
+
+def database() -> FakeDatabase:
+    return DATABASE
+
+
+def seed_rows(model: str, rows: List[Dict[str, Any]]) -> List[str]:
+    """
+    Inserts rows directly into a fake table, bypassing constraint checks, and returns their IDs.
+    """
+    actions = Actions(model)
+    table = DATABASE.tables[model]
+    ids = []
+    for data in rows:
+        row = actions._build(data)
+        table[row["id"]] = row
+        DATABASE.track(model, row, True)
+        ids.append(row["id"])
+    DATABASE.changed(model)
+    return ids
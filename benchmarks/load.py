@@ -0,0 +1,415 @@
+"""
+Concurrent load against every route of the FastAPI app, driven in-process over ASGI.
+
+Requests are handed straight to the ASGI callable, so the numbers include routing, validation, the
+service function, the database client and response serialization, but no sockets or HTTP parsing.
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+BENCH_PASSWORD = "bench-password"
+PROFILE_EMAIL = "example_user_email@example.com"
+
+
+@dataclass
+class BenchContext:
+    """
+    Seeded data and state shared by the scenarios of one run.
+    """
+
+    rng: random.Random
+    joke_ids: List[str]
+    user_ids: List[str]
+    login_email: str
+    session_token: str
+    added_ids: List[str] = field(default_factory=list)
+    bulk_tags: List[str] = field(default_factory=list)
+    list_cursor: Optional[str] = None
+    daily_etag: Optional[str] = None
+    sequence: int = 0
+
+    def next(self) -> int:
+        self.sequence += 1
+        return self.sequence
+
+    def joke_id(self) -> str:
+        return self.rng.choice(self.joke_ids)
+
+
+@dataclass
+class Scenario:
+    """
+    One kind of request. ``path`` and ``body`` are called for every request so that each can
+    target different rows; ``limit`` caps the request count, e.g. for bcrypt-bound routes or routes
+    that consume rows created by an earlier scenario. ``request_headers`` adds headers that depend
+    on what earlier responses returned.
+    """
+
+    name: str
+    method: str
+    route: str
+    path: Callable[[BenchContext], str]
+    body: Optional[Callable[[BenchContext], bytes]] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    expected: Tuple[int, ...] = (200,)
+    limit: Optional[Callable[[BenchContext], int]] = None
+    warmup: bool = True
+    authenticated: bool = False
+    on_response: Optional[Callable[[BenchContext, int, bytes], None]] = None
+    request_headers: Optional[Callable[[BenchContext], Dict[str, str]]] = None
+
+
+async def call(
+    app: Any, method: str, path: str, headers: Dict[str, str], body: bytes = b""
+) -> Tuple[int, bytes]:
+    """
+    Sends one HTTP request to an ASGI app and returns its status code and full body.
+    """
+    raw_path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": unquote(raw_path),
+        "raw_path": raw_path.encode(),
+        "query_string": query_string.encode(),
+        "root_path": "",
+        "headers": [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers.items()
+        ]
+        + [(b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    sent = False
+    status = 0
+    chunks: List[bytes] = []
+
+    async def receive() -> Dict[str, Any]:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client never disconnects; streaming responses cancel this wait when they finish.
+        await asyncio.Event().wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Dict[str, Any]) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    milliseconds = 1000
+    return {
+        "mean": (sum(ordered) / len(ordered) * milliseconds) if ordered else 0.0,
+        "p50": percentile(ordered, 0.50) * milliseconds,
+        "p95": percentile(ordered, 0.95) * milliseconds,
+        "p99": percentile(ordered, 0.99) * milliseconds,
+        "max": (ordered[-1] * milliseconds) if ordered else 0.0,
+    }
+
+
+async def run_scenario(
+    app: Any,
+    scenario: Scenario,
+    context: BenchContext,
+    requests: int,
+    concurrency: int,
+    warmup: int,
+) -> Dict[str, Any]:
+    total = requests
+    if scenario.limit is not None:
+        total = min(total, scenario.limit(context))
+
+    headers = dict(scenario.headers)
+    if scenario.authenticated:
+        headers["authorization"] = f"Bearer {context.session_token}"
+
+    async def one() -> Tuple[int, float]:
+        path = scenario.path(context)
+        body = scenario.body(context) if scenario.body is not None else b""
+        sent_headers = headers
+        if scenario.request_headers is not None:
+            sent_headers = {**headers, **scenario.request_headers(context)}
+        start = time.perf_counter()
+        status, payload = await call(app, scenario.method, path, sent_headers, body)
+        elapsed = time.perf_counter() - start
+        if scenario.on_response is not None:
+            scenario.on_response(context, status, payload)
+        return status, elapsed
+
+    if scenario.warmup:
+        for _ in range(min(warmup, total)):
+            await one()
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    remaining = iter(range(total))
+
+    async def worker() -> None:
+        for _ in remaining:
+            status, elapsed = await one()
+            latencies.append(elapsed)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, total)))))
+    elapsed = time.perf_counter() - start
+    errors = sum(count for status, count in statuses.items() if status not in scenario.expected)
+    return {
+        "name": scenario.name,
+        "method": scenario.method,
+        "route": scenario.route,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "seconds": elapsed,
+        "throughput_rps": total / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": summarize_latencies(latencies),
+    }
+
+
+def _keep_added_id(context: BenchContext, status: int, payload: bytes) -> None:
+    if status == 200:
+        joke_id = json.loads(payload).get("jokeId")
+        if joke_id:
+            context.added_ids.append(joke_id)
+
+
+def _keep_list_cursor(context: BenchContext, status: int, payload: bytes) -> None:
+    # Walk the catalogue page by page, starting over after the last one.
+    if status == 200:
+        context.list_cursor = json.loads(payload).get("nextCursor")
+
+
+def _keep_daily_etag(context: BenchContext, status: int, payload: bytes) -> None:
+    if status == 200:
+        from project.fetch_daily_joke_service import etag
+
+        context.daily_etag = etag(payload)
+
+
+def _daily_if_none_match(context: BenchContext) -> Dict[str, str]:
+    return {"if-none-match": context.daily_etag or '"none"'}
+
+
+def _duplicate_submission(context: BenchContext) -> str:
+    # Word for word the content of a seeded joke, so that moderation rejects it.
+    i = context.rng.randrange(len(context.joke_ids))
+    content = f"Joke {i}: why did the chicken cross the road? To get to {i + 1}."
+    return f"/jokes/submit?content={quote(content)}"
+
+
+def _list_page(context: BenchContext) -> str:
+    if context.list_cursor is None:
+        return "/jokes?limit=50"
+    return f"/jokes?limit=50&cursor={context.list_cursor}"
+
+
+def _any_added_ids(context: BenchContext) -> int:
+    return sys.maxsize if context.added_ids else 0
+
+
+def _ndjson_upload(context: BenchContext, rows: int = 1000) -> bytes:
+    tag = f"bench-bulk-{context.next()}:"
+    context.bulk_tags.append(tag)
+    return "".join(
+        json.dumps({"content": f"{tag} imported joke {i}"}) + "\n" for i in range(rows)
+    ).encode()
+
+
+def _bulk_delete_body(context: BenchContext) -> bytes:
+    return json.dumps({"contains": context.bulk_tags.pop()}).encode()
+
+
+SCENARIOS: List[Scenario] = [
+    Scenario("random_joke", "GET", "/joke", lambda c: "/joke"),
+    Scenario(
+        "random_joke_weighted", "GET", "/joke", lambda c: "/joke?weighted=true"
+    ),
+    Scenario("random_joke_lang", "GET", "/joke", lambda c: "/joke?lang=es"),
+    Scenario(
+        "random_joke_no_repeat",
+        "GET",
+        "/joke",
+        lambda c: f"/joke?no_repeat=true&client_id=bench-{c.next() % 100}",
+    ),
+    Scenario(
+        "random_joke_accept_language",
+        "GET",
+        "/joke",
+        lambda c: "/joke",
+        headers={"accept-language": "de-CH, de;q=0.9, en;q=0.8"},
+    ),
+    Scenario(
+        "daily_joke", "GET", "/joke/daily", lambda c: "/joke/daily", on_response=_keep_daily_etag
+    ),
+    Scenario("daily_joke_lang", "GET", "/joke/daily", lambda c: "/joke/daily?lang=de"),
+    Scenario(
+        "daily_joke_not_modified",
+        "GET",
+        "/joke/daily",
+        lambda c: "/joke/daily",
+        expected=(304,),
+        request_headers=_daily_if_none_match,
+    ),
+    Scenario("list_jokes_first_page", "GET", "/jokes", lambda c: "/jokes?limit=50"),
+    Scenario(
+        "list_jokes_walk", "GET", "/jokes", _list_page, on_response=_keep_list_cursor
+    ),
+    Scenario(
+        "export_jokes_ndjson",
+        "GET",
+        "/jokes",
+        lambda c: "/jokes",
+        headers={"accept": "application/x-ndjson"},
+        limit=lambda c: 3,
+        warmup=False,
+    ),
+    Scenario(
+        "random_jokes_10", "GET", "/jokes/random", lambda c: "/jokes/random?n=10"
+    ),
+    Scenario(
+        "random_jokes_100_ndjson",
+        "GET",
+        "/jokes/random",
+        lambda c: "/jokes/random?n=100",
+        headers={"accept": "application/x-ndjson"},
+    ),
+    Scenario("top_jokes_all", "GET", "/jokes/top", lambda c: "/jokes/top?n=10"),
+    Scenario(
+        "search_jokes",
+        "GET",
+        "/jokes/search",
+        lambda c: f"/jokes/search?q=chicken+{c.rng.randrange(len(c.joke_ids))}",
+    ),
+    Scenario(
+        "search_jokes_prefix", "GET", "/jokes/search", lambda c: "/jokes/search?q=cross+the+ro"
+    ),
+    Scenario(
+        "top_jokes_week", "GET", "/jokes/top", lambda c: "/jokes/top?n=10&window=week"
+    ),
+    Scenario(
+        "rate_joke",
+        "POST",
+        "/jokes/{jokeId}/rate",
+        lambda c: f"/jokes/{c.joke_id()}/rate?score={c.rng.randint(1, 5)}",
+        expected=(202,),
+        authenticated=True,
+    ),
+    Scenario(
+        "submit_joke",
+        "POST",
+        "/jokes/submit",
+        lambda c: f"/jokes/submit?content=bench-submitted-{c.next()}",
+        expected=(202,),
+        authenticated=True,
+    ),
+    Scenario(
+        "submit_joke_duplicate",
+        "POST",
+        "/jokes/submit",
+        _duplicate_submission,
+        expected=(202,),
+        authenticated=True,
+    ),
+    Scenario(
+        "user_profile", "GET", "/users/me", lambda c: "/users/me", authenticated=True
+    ),
+    Scenario(
+        "update_user_profile",
+        "PUT",
+        "/users/me/update",
+        lambda c: f"/users/me/update?name=bench&email={quote(PROFILE_EMAIL)}"
+        f"&profile_picture_url=https%3A%2F%2Fexample.com%2Fa.png&bio=run-{c.next()}",
+        authenticated=True,
+    ),
+    Scenario(
+        "user_login",
+        "POST",
+        "/users/login",
+        lambda c: f"/users/login?email={quote(c.login_email)}&password={BENCH_PASSWORD}",
+        limit=lambda c: 50,
+    ),
+    Scenario(
+        "user_registration",
+        "POST",
+        "/users/register",
+        lambda c: f"/users/register?email=bench-{c.next()}%40example.com"
+        f"&password={BENCH_PASSWORD}&username=bench&role=USER",
+        limit=lambda c: 50,
+    ),
+    Scenario(
+        "admin_add_joke",
+        "POST",
+        "/admin/jokes/add",
+        lambda c: f"/admin/jokes/add?content=bench-added-{c.next()}",
+        on_response=_keep_added_id,
+    ),
+    Scenario(
+        "admin_update_joke",
+        "PUT",
+        "/admin/jokes/update/{jokeId}",
+        lambda c: f"/admin/jokes/update/{c.rng.choice(c.added_ids)}"
+        f"?content=bench-updated-{c.next()}",
+        limit=_any_added_ids,
+    ),
+    Scenario(
+        "admin_delete_joke",
+        "DELETE",
+        "/admin/jokes/delete/{jokeId}",
+        lambda c: f"/admin/jokes/delete/{c.added_ids.pop()}",
+        limit=lambda c: len(c.added_ids),
+        warmup=False,
+    ),
+    Scenario(
+        "admin_bulk_add_1000",
+        "POST",
+        "/admin/jokes/bulk",
+        lambda c: "/admin/jokes/bulk",
+        body=_ndjson_upload,
+        headers={"content-type": "application/x-ndjson"},
+        limit=lambda c: 20,
+        warmup=False,
+    ),
+    Scenario(
+        "admin_bulk_delete_contains",
+        "DELETE",
+        "/admin/jokes/bulk",
+        lambda c: "/admin/jokes/bulk",
+        body=_bulk_delete_body,
+        headers={"content-type": "application/json"},
+        limit=lambda c: len(c.bulk_tags),
+        warmup=False,
+    ),
+    Scenario("metrics", "GET", "/metrics", lambda c: "/metrics"),
+]
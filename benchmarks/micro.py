@@ -0,0 +1,165 @@
+"""
+Micro-benchmarks for the service functions and the in-memory structures behind them.
+
+Each benchmark is timed in ``repeat`` batches of ``number`` calls; the per-call figures are derived
+from the batch times, so timer overhead stays negligible even for sub-microsecond operations.
+"""
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from benchmarks.load import BENCH_PASSWORD, percentile
+
+
+def _summarize(name: str, number: int, batches: List[float]) -> Dict[str, Any]:
+    per_call = sorted(batch / number for batch in batches)
+    microseconds = 1_000_000
+    return {
+        "name": name,
+        "calls": number * len(batches),
+        "ops_per_second": number * len(batches) / sum(batches) if sum(batches) else 0.0,
+        "per_call_us": {
+            "mean": sum(per_call) / len(per_call) * microseconds,
+            "p50": percentile(per_call, 0.50) * microseconds,
+            "p99": percentile(per_call, 0.99) * microseconds,
+            "min": per_call[0] * microseconds,
+        },
+    }
+
+
+def measure(name: str, func: Callable[[], Any], number: int, repeat: int) -> Dict[str, Any]:
+    batches = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        batches.append(time.perf_counter() - start)
+    return _summarize(name, number, batches)
+
+
+async def ameasure(
+    name: str, func: Callable[[], Awaitable[Any]], number: int, repeat: int
+) -> Dict[str, Any]:
+    batches = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        batches.append(time.perf_counter() - start)
+    return _summarize(name, number, batches)
+
+
+async def run_micro_benchmarks(user_id: str, scale: float = 1.0) -> List[Dict[str, Any]]:
+    """
+    Runs every micro-benchmark against the already loaded app state, reading the profile of
+    ``user_id``. ``scale`` multiplies the call counts, e.g. 0.1 for a quick smoke run.
+    """
+    import prisma.models
+
+    from project.admin_bulk_jokes_service import _iter_lines, _iter_ndjson
+    from project.alias_table import AliasTable
+    from project.fetch_random_joke_service import fetch_random_joke
+    from project.fetch_random_jokes_service import (
+        FetchRandomJokesResponse,
+        fetch_random_jokes,
+    )
+    from project.fetch_top_jokes_service import fetch_top_jokes
+    from project.fetch_user_profile_service import fetch_user_profile
+    from project.joke_index import joke_index
+    from project.metrics import REGISTRY, Histogram
+    from project.password_hashing import password_hasher
+    from project.localization_index import localization_index
+    from project.rating_aggregates import rating_aggregates
+    from project.search_index import search_index
+    from project.submission_queue import submission_queue
+    from project.sessions import session_signer
+    from project.weighted_joke_sampler import weighted_joke_sampler
+
+    def n(count: int) -> int:
+        return max(1, int(count * scale))
+
+    weights = [1 + i % 7 for i in range(len(joke_index))] or [1]
+    table = AliasTable(weights)
+    jokes = (await fetch_random_jokes(100)).jokes
+    await search_index.ensure_loaded()
+    histogram = Histogram("bench_histogram", "Scratch histogram.", ("label",))
+    upload = b"".join(b'{"content": "joke %d"}\n' % i for i in range(10000))
+    hashed = await password_hasher.hash(BENCH_PASSWORD)
+    token = session_signer.issue(user_id)
+
+    def top_recomputed() -> None:
+        # Forget the cached rankings so that every call pays for the heap selection.
+        rating_aggregates._rankings.clear()
+        rating_aggregates.top("week", 10)
+
+    def search_uncached(text: str) -> None:
+        # Forget cached results so that every call walks the postings.
+        search_index._results.clear()
+        search_index.search(text, 10)
+
+    async def parse_upload() -> None:
+        async def chunks():
+            for start in range(0, len(upload), 65536):
+                yield upload[start : start + 65536]
+
+        async for _ in _iter_ndjson(_iter_lines(chunks())):
+            pass
+
+    submitted = 0
+
+    async def moderate_100() -> None:
+        # Every call queues a fresh batch, so that each one claims, publishes and decides 100 rows.
+        nonlocal submitted
+        await prisma.models.Submission.prisma().create_many(
+            data=[
+                {"userId": user_id, "status": "PENDING", "content": f"bench-moderated-{submitted + i}"}
+                for i in range(100)
+            ]
+        )
+        submitted += 100
+        await submission_queue.moderate_batch()
+
+    # The background worker would otherwise race the benchmark for the same rows.
+    await submission_queue.stop()
+
+    sync_benchmarks = [
+        ("joke_index.random", joke_index.random, n(10000), 20),
+        ("joke_index.sample_100", lambda: joke_index.sample(100), n(1000), 20),
+        ("weighted_joke_sampler.random", weighted_joke_sampler.random, n(10000), 20),
+        ("alias_table.build", lambda: AliasTable(weights), 1, 5),
+        ("alias_table.draw", table.draw, n(10000), 20),
+        ("rating_aggregates.top_cached", lambda: rating_aggregates.top("all", 10), n(10000), 20),
+        ("rating_aggregates.top_recomputed", top_recomputed, n(100), 10),
+        (
+            "serialize_random_jokes_100",
+            lambda: FetchRandomJokesResponse(jokes=jokes).json(),
+            n(1000),
+            20,
+        ),
+        (
+            "localization_index.negotiate",
+            lambda: localization_index.negotiate(None, "de-CH, de;q=0.9, en;q=0.8"),
+            n(100000),
+            20,
+        ),
+        ("search_index.search_selective", lambda: search_uncached("chicken 12"), n(1000), 20),
+        ("search_index.search_prefix", lambda: search_uncached("cross the ro"), n(10), 10),
+        ("search_index.search_cached", lambda: search_index.search("cross the ro", 10), n(10000), 20),
+        ("histogram.observe", lambda: histogram.observe(0.01, "x"), n(100000), 20),
+        ("metrics.render", REGISTRY.render, n(100), 10),
+        ("session_signer.issue", lambda: session_signer.issue(user_id), n(10000), 20),
+        ("session_signer.verify", lambda: session_signer.verify(token), n(10000), 20),
+    ]
+    async_benchmarks = [
+        ("fetch_random_joke", fetch_random_joke, n(5000), 20),
+        ("fetch_random_jokes_10", lambda: fetch_random_jokes(10), n(1000), 20),
+        ("fetch_top_jokes_10", lambda: fetch_top_jokes(10), n(1000), 20),
+        ("fetch_user_profile_cached", lambda: fetch_user_profile(user_id), n(10000), 20),
+        ("parse_ndjson_10k_rows", parse_upload, 1, n(10)),
+        ("submission_queue.moderate_100", moderate_100, 1, n(20)),
+        ("password_hasher.hash", lambda: password_hasher.hash(BENCH_PASSWORD), 1, 5),
+        ("password_hasher.verify", lambda: password_hasher.verify(BENCH_PASSWORD, hashed), 1, 5),
+    ]
+    results = [measure(*benchmark) for benchmark in sync_benchmarks]
+    for benchmark in async_benchmarks:
+        results.append(await ameasure(*benchmark))
+    return results
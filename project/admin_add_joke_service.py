@@ -1,5 +1,16 @@
 import prisma
+import prisma.errors
 import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, DatabaseUnavailableError, query
+from project.joke_dedupe import (
+    DUPLICATE_JOKES,
+    content_hash,
+    duplicate_of,
+    duplicate_owner,
+)
+from project.joke_errors import DuplicateJokeError
+from project.joke_index import joke_index
+from project.metrics import time_serialization
 from pydantic import BaseModel
 
 
@@ -12,31 +23,75 @@ class AdminAddJokeResponse(BaseModel):
     message: str
     jokeId: str
     content: str
+    merged: bool = False
 
 
-async def admin_add_joke(content: str) -> AdminAddJokeResponse:
+async def admin_add_joke(content: str, on_duplicate: str = "reject") -> AdminAddJokeResponse:
     """
     Allows admin to add a new joke to the database.
 
+    Content that normalizes to that of an existing joke is a duplicate. The in-memory hash set
+    finds it without a query; the unique ``contentHash`` column catches whatever the set misses.
+
     Args:
         content (str): The textual content of the joke to be added to the database.
+        on_duplicate (str): "reject" to fail with DuplicateJokeError, or "merge" to return the
+            existing joke instead of adding a new one.
 
     Returns:
         AdminAddJokeResponse: Response model for the addition of a new joke. Includes details of the added joke along with a success message.
+
+    Raises:
+        DatabaseUnavailableError: If the database is unreachable or its circuit breaker is open.
     """
-    try:
-        joke = await prisma.models.Joke.prisma().create(data={"content": content})
-        response = AdminAddJokeResponse(
-            success=True,
-            message="Joke successfully added.",
-            jokeId=joke.id,
-            content=joke.content,
+    if on_duplicate not in ("reject", "merge"):
+        raise ValueError(
+            f"Unknown on_duplicate '{on_duplicate}', expected 'reject' or 'merge'"
         )
-    except Exception as e:
-        response = AdminAddJokeResponse(
-            success=False,
-            message=f"Failed to add joke. Error: {str(e)}",
-            jokeId="",
-            content=content,
+    owner = duplicate_of(content)
+    if owner is None:
+        try:
+            joke = await query(
+                "Joke.create",
+                prisma.models.Joke.prisma().create(
+                    data={"content": content, "contentHash": content_hash(content)}
+                ),
+                timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+            )
+            joke_index.add(joke.id, joke.content)
+            with time_serialization("AdminAddJokeResponse"):
+                return AdminAddJokeResponse(
+                    success=True,
+                    message="Joke successfully added.",
+                    jokeId=joke.id,
+                    content=joke.content,
+                )
+        except prisma.errors.UniqueViolationError as e:
+            owner = await duplicate_owner(content, e)
+        except DatabaseUnavailableError:
+            raise
+        except Exception as e:
+            return AdminAddJokeResponse(
+                success=False,
+                message=f"Failed to add joke. Error: {str(e)}",
+                jokeId="",
+                content=content,
+            )
+    if on_duplicate == "reject":
+        DUPLICATE_JOKES.inc("rejected")
+        raise DuplicateJokeError(owner)
+    DUPLICATE_JOKES.inc("merged")
+    existing = joke_index.get(owner)
+    if existing is None:
+        joke = await query(
+            "Joke.find_unique", prisma.models.Joke.prisma().find_unique(where={"id": owner})
+        )
+        existing = joke.content if joke is not None else content
+    with time_serialization("AdminAddJokeResponse"):
+        return AdminAddJokeResponse(
+            success=True,
+            message="Joke already exists.",
+            jokeId=owner,
+            content=existing,
+            merged=True,
         )
-    return response
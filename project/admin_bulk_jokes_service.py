@@ -0,0 +1,275 @@
+import codecs
+import csv
+import json
+import logging
+import os
+import uuid
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+import prisma
+import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.joke_dedupe import DUPLICATE_JOKES, content_hash, find_owners
+from project.joke_index import joke_index
+from project.metrics import time_serialization
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "1000"))
+# Only this many per-row errors are returned; the rest are counted.
+BULK_IMPORT_MAX_ERRORS = int(os.getenv("BULK_IMPORT_MAX_ERRORS", "1000"))
+BULK_DELETE_CHUNK_SIZE = int(os.getenv("BULK_DELETE_CHUNK_SIZE", "10000"))
+
+
+class BulkRowError(BaseModel):
+    """
+    An error for one row of a bulk upload. Line numbers start at 1 and count physical lines.
+    """
+
+    line: int
+    error: str
+
+
+class AdminBulkAddJokesResponse(BaseModel):
+    """
+    Summary of a bulk joke import: how many rows were inserted, how many failed, and why.
+    """
+
+    inserted: int
+    duplicates: int
+    failed: int
+    errors: List[BulkRowError]
+    errorsTruncated: bool
+
+
+class AdminBulkDeleteJokesRequest(BaseModel):
+    """
+    Selects the jokes to delete, either by ID or by a substring of their content.
+    """
+
+    ids: Optional[List[str]] = None
+    contains: Optional[str] = None
+
+
+class AdminBulkDeleteJokesResponse(BaseModel):
+    """
+    Acknowledgment of a bulk delete, including the number of jokes removed.
+    """
+
+    deleted: int
+    message: str
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    line_number = 0
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            line_number += 1
+            yield line_number, line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield line_number + 1, buffer.rstrip("\r")
+
+
+async def _iter_ndjson(
+    lines: AsyncIterator[Tuple[int, str]]
+) -> AsyncIterator[Tuple[int, Optional[str], Optional[str]]]:
+    async for line_number, line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        content = row.get("content") if isinstance(row, dict) else row
+        if not isinstance(content, str):
+            yield line_number, None, "Expected a string or an object with a 'content' string"
+            continue
+        yield line_number, content, None
+
+
+async def _iter_csv(
+    lines: AsyncIterator[Tuple[int, str]]
+) -> AsyncIterator[Tuple[int, Optional[str], Optional[str]]]:
+    # A record may span several physical lines when a quoted field contains newlines, so lines are
+    # held back until their double quotes balance out.
+    column: Optional[int] = None
+    record: List[str] = []
+    record_start = 0
+    async for line_number, line in lines:
+        if not record:
+            record_start = line_number
+        record.append(line)
+        if sum(part.count('"') for part in record) % 2:
+            continue
+        fields = next(csv.reader(["\n".join(record)]), [])
+        record = []
+        if not fields:
+            continue
+        if column is None:
+            try:
+                column = [name.strip().lower() for name in fields].index("content")
+            except ValueError:
+                yield record_start, None, "CSV header must contain a 'content' column"
+                return
+            continue
+        if column >= len(fields):
+            yield record_start, None, "Missing 'content' column"
+            continue
+        yield record_start, fields[column], None
+    if record:
+        yield record_start, None, "Unterminated quoted field"
+
+
+async def admin_bulk_add_jokes(
+    chunks: AsyncIterator[bytes], content_type: str = "application/x-ndjson"
+) -> AdminBulkAddJokesResponse:
+    """
+    Imports jokes from a streamed NDJSON or CSV upload.
+
+    The body is decoded and parsed incrementally, and rows are written in chunks of
+    BULK_IMPORT_CHUNK_SIZE with one ``create_many`` each, so the upload is never held in memory.
+    IDs are generated here so that imported jokes can be added to the joke index without reading
+    them back. A failed chunk is reported against each of its rows and the import carries on.
+
+    Rows whose normalized content matches an existing joke, or an earlier row of the upload, are
+    skipped and counted as duplicates, so re-importing a file adds nothing. Existing jokes are
+    looked up per chunk, in the in-memory hash set or with one query.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The raw request body.
+        content_type (str): "text/csv" for CSV with a 'content' header column; anything else is read
+            as NDJSON, one joke per line as ``{"content": "..."}`` or a bare JSON string.
+
+    Returns:
+        AdminBulkAddJokesResponse: Summary of the import.
+    """
+    parse = _iter_csv if content_type.startswith("text/csv") else _iter_ndjson
+    inserted = 0
+    duplicates = 0
+    failed = 0
+    errors: List[BulkRowError] = []
+
+    def report(line: int, error: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_IMPORT_MAX_ERRORS:
+            errors.append(BulkRowError(line=line, error=error))
+
+    async def write(pending: List[Tuple[int, str]]) -> None:
+        nonlocal inserted, duplicates
+        hashes = [content_hash(content) for _, content in pending]
+        taken = set(await find_owners(hashes))
+        rows = []
+        lines = []
+        for (line, content), hashed in zip(pending, hashes):
+            if hashed in taken:
+                duplicates += 1
+                continue
+            taken.add(hashed)
+            rows.append({"id": str(uuid.uuid4()), "content": content, "contentHash": hashed})
+            lines.append(line)
+        DUPLICATE_JOKES.inc("skipped", amount=len(pending) - len(rows))
+        if not rows:
+            return
+        try:
+            await query(
+                "Joke.create_many",
+                prisma.models.Joke.prisma().create_many(data=rows),
+                timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            logger.exception("Failed to import a chunk of %d jokes", len(rows))
+            for line in lines:
+                report(line, f"Failed to insert: {e}")
+            return
+        for row in rows:
+            joke_index.add(row["id"], row["content"])
+        inserted += len(rows)
+        logger.info(
+            "Bulk import progress: %d inserted, %d duplicates, %d failed",
+            inserted,
+            duplicates,
+            failed,
+        )
+
+    pending: List[Tuple[int, str]] = []
+    async for line, content, error in parse(_iter_lines(chunks)):
+        if error is not None:
+            report(line, error)
+            continue
+        if not content or not content.strip():
+            report(line, "Joke content is empty")
+            continue
+        pending.append((line, content))
+        if len(pending) >= BULK_IMPORT_CHUNK_SIZE:
+            await write(pending)
+            pending = []
+    if pending:
+        await write(pending)
+    with time_serialization("AdminBulkAddJokesResponse"):
+        return AdminBulkAddJokesResponse(
+            inserted=inserted,
+            duplicates=duplicates,
+            failed=failed,
+            errors=errors,
+            errorsTruncated=failed > len(errors),
+        )
+
+
+def _chunked(ids: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(ids), size):
+        yield ids[start : start + size]
+
+
+async def admin_bulk_delete_jokes(
+    request: AdminBulkDeleteJokesRequest,
+) -> AdminBulkDeleteJokesResponse:
+    """
+    Deletes many jokes with ``delete_many``, selected either by an ID list or by a content filter.
+
+    ID lists are deleted in chunks of BULK_DELETE_CHUNK_SIZE to keep each statement bounded.
+
+    Args:
+        request (AdminBulkDeleteJokesRequest): Exactly one of ``ids`` or ``contains`` must be set.
+
+    Returns:
+        AdminBulkDeleteJokesResponse: Acknowledgment including the number of jokes removed.
+    """
+    if (request.ids is None) == (request.contains is None):
+        raise ValueError("Specify exactly one of 'ids' or 'contains'")
+    deleted = 0
+    if request.ids is not None:
+        for chunk in _chunked(request.ids, BULK_DELETE_CHUNK_SIZE):
+            deleted += await query(
+                "Joke.delete_many",
+                prisma.models.Joke.prisma().delete_many(where={"id": {"in": chunk}}),
+                timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+            )
+            for joke_id in chunk:
+                joke_index.remove(joke_id)
+    else:
+        if not request.contains:
+            raise ValueError("'contains' must not be empty")
+        deleted = await query(
+            "Joke.delete_many",
+            prisma.models.Joke.prisma().delete_many(
+                where={"content": {"contains": request.contains}}
+            ),
+            timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+        )
+        if joke_index.loaded:
+            for joke_id in joke_index.ids():
+                content = joke_index.get(joke_id)
+                if content is not None and request.contains in content:
+                    joke_index.remove(joke_id)
+    with time_serialization("AdminBulkDeleteJokesResponse"):
+        return AdminBulkDeleteJokesResponse(
+            deleted=deleted, message=f"{deleted} jokes successfully deleted."
+        )
@@ -1,5 +1,11 @@
+from typing import Optional
+
 import prisma
 import prisma.models
+from project.admin_update_joke_service import parse_if_match, raise_write_miss
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.joke_index import joke_index
+from project.metrics import time_serialization
 from pydantic import BaseModel
 
 
@@ -11,23 +17,38 @@ class DeleteJokeResponse(BaseModel):
     message: str
 
 
-async def admin_delete_joke(jokeId: str) -> DeleteJokeResponse:
+async def admin_delete_joke(
+    jokeId: str, if_match: Optional[str] = None
+) -> DeleteJokeResponse:
     """
     Allows an admin to delete an existing joke from the database.
 
     Utilizes Prisma Client to interact with the database for performing the deletion operation.
-    Ensures that the joke exists before attempting to delete it. If the joke doesn't exist or the deletion fails,
-    it raises an appropriate HTTPException.
+    The delete is a single conditional statement; whether the joke existed is taken from its result.
+    When ``if_match`` is given, the joke is only deleted if its ``updatedAt`` still matches.
 
     Args:
         jokeId (str): The unique identifier of the joke to be deleted.
+        if_match (Optional[str]): The If-Match header value, the joke's expected ``updatedAt``.
 
     Returns:
         DeleteJokeResponse: An instance containing a message indicating the outcome of the operation.
 
+    Raises:
+        JokeNotFoundError: If no joke has the given ID.
+        JokeVersionConflictError: If the joke was modified after the version in ``if_match``.
     """
-    joke = await prisma.models.Joke.prisma().find_unique(where={"id": jokeId})
-    if not joke:
-        raise Exception("Joke not found")
-    await prisma.models.Joke.prisma().delete(where={"id": jokeId})
-    return DeleteJokeResponse(message=f"Joke with id {jokeId} successfully deleted.")
+    expected = parse_if_match(if_match)
+    where = {"id": jokeId}
+    if expected is not None:
+        where["updatedAt"] = expected
+    deleted = await query(
+        "Joke.delete",
+        prisma.models.Joke.prisma().delete(where=where),
+        timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+    )
+    if deleted is None:
+        await raise_write_miss(jokeId, expected)
+    joke_index.remove(jokeId)
+    with time_serialization("DeleteJokeResponse"):
+        return DeleteJokeResponse(message=f"Joke with id {jokeId} successfully deleted.")
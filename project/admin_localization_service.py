@@ -0,0 +1,105 @@
+import prisma
+import prisma.errors
+import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.fetch_daily_joke_service import daily_jokes
+from project.joke_errors import JokeNotFoundError, LocalizationNotFoundError
+from project.joke_index import joke_index
+from project.localization_index import localization_index, normalize_language
+from project.metrics import time_serialization
+from pydantic import BaseModel
+
+
+class AdminPutLocalizationResponse(BaseModel):
+    """
+    Response model for storing a joke's translation into one language.
+    """
+
+    jokeId: str
+    language: str
+    content: str
+
+
+class DeleteLocalizationResponse(BaseModel):
+    """
+    Acknowledgment response indicating the deletion operation's outcome.
+    """
+
+    message: str
+
+
+async def admin_put_localization(
+    jokeId: str, language: str, content: str
+) -> AdminPutLocalizationResponse:
+    """
+    Creates or replaces a joke's translation into one language with a single upsert on the
+    (jokeId, language) key, then updates the localization index.
+
+    Args:
+        jokeId (str): The unique identifier of the translated joke.
+        language (str): The language tag, e.g. "de" or "pt-BR". Stored normalized to lower case.
+        content (str): The translated joke text. Stored as ``{"content": ...}``.
+
+    Returns:
+        AdminPutLocalizationResponse: The stored translation.
+
+    Raises:
+        JokeNotFoundError: If no joke has the given ID.
+        ValueError: If the language tag or the content is empty.
+    """
+    language = normalize_language(language)
+    if not language or not content.strip():
+        raise ValueError("Language and content must not be empty")
+    if joke_index.loaded and joke_index.get(jokeId) is None:
+        raise JokeNotFoundError(jokeId)
+    value = prisma.Json({"content": content})
+    try:
+        await query(
+            "Localization.upsert",
+            prisma.models.Localization.prisma().upsert(
+                where={"jokeId_language": {"jokeId": jokeId, "language": language}},
+                data={
+                    "create": {"jokeId": jokeId, "language": language, "content": value},
+                    "update": {"content": value},
+                },
+            ),
+            timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+        )
+    except prisma.errors.ForeignKeyViolationError:
+        raise JokeNotFoundError(jokeId)
+    localization_index.set(jokeId, language, content)
+    daily_jokes.forget(jokeId, language)
+    with time_serialization("AdminPutLocalizationResponse"):
+        return AdminPutLocalizationResponse(jokeId=jokeId, language=language, content=content)
+
+
+async def admin_delete_localization(jokeId: str, language: str) -> DeleteLocalizationResponse:
+    """
+    Deletes a joke's translation into one language; the joke itself is left untouched.
+
+    Args:
+        jokeId (str): The unique identifier of the translated joke.
+        language (str): The language tag of the translation to delete.
+
+    Returns:
+        DeleteLocalizationResponse: An instance containing a message indicating the outcome of the operation.
+
+    Raises:
+        LocalizationNotFoundError: If the joke has no translation into that language.
+    """
+    language = normalize_language(language)
+    deleted = await query(
+        "Localization.delete",
+        prisma.models.Localization.prisma().delete(
+            where={"jokeId_language": {"jokeId": jokeId, "language": language}}
+        ),
+        timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+    )
+    if deleted is None:
+        raise LocalizationNotFoundError(jokeId, language)
+    localization_index.remove(jokeId, language)
+    daily_jokes.forget(jokeId, language)
+    with time_serialization("DeleteLocalizationResponse"):
+        return DeleteLocalizationResponse(
+            message=f"Translation of joke {jokeId} into {language} successfully deleted."
+        )
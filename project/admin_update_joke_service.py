@@ -1,5 +1,18 @@
+from datetime import datetime
+from typing import Optional
+
 import prisma
+import prisma.errors
 import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.joke_dedupe import DUPLICATE_JOKES, content_hash, duplicate_of, duplicate_owner
+from project.joke_errors import (
+    DuplicateJokeError,
+    JokeNotFoundError,
+    JokeVersionConflictError,
+)
+from project.joke_index import joke_index
+from project.metrics import time_serialization
 from pydantic import BaseModel
 
 
@@ -23,27 +36,93 @@ class AdminUpdateJokeResponse(BaseModel):
     updatedJoke: Joke
 
 
-async def admin_update_joke(jokeId: str, content: str) -> AdminUpdateJokeResponse:
+def parse_if_match(if_match: Optional[str]) -> Optional[datetime]:
+    """
+    Parses an If-Match header carrying a joke's ``updatedAt`` timestamp, as listed by
+    ``GET /jokes`` or returned in the ETag of a previous write. Returns None when no
+    precondition was sent or it is ``*``.
+
+    Raises:
+        ValueError: If the header is not a quoted ISO 8601 timestamp.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return datetime.fromisoformat(tag.strip('"'))
+    except ValueError:
+        raise ValueError(f"Invalid If-Match header: {if_match}")
+
+
+async def raise_write_miss(jokeId: str, expected: Optional[datetime]) -> None:
+    """
+    Explains why a conditional write touched no row. Only runs on the failure path, so successful
+    writes stay a single round trip.
+    """
+    if expected is not None:
+        current = await query(
+            "Joke.find_unique",
+            prisma.models.Joke.prisma().find_unique(where={"id": jokeId}),
+        )
+        if current is not None:
+            raise JokeVersionConflictError(jokeId)
+    raise JokeNotFoundError(jokeId)
+
+
+async def admin_update_joke(
+    jokeId: str, content: str, if_match: Optional[str] = None
+) -> AdminUpdateJokeResponse:
     """
     Allows admin to update an existing joke.
 
+    The update is a single conditional statement. When ``if_match`` carries the ``updatedAt`` the
+    caller last saw, the row is only updated if it still has that timestamp, so concurrent editors
+    get a conflict instead of silently overwriting each other. Content that normalizes to that of
+    another joke is rejected, checked against the in-memory hash set first and the unique
+    ``contentHash`` column last.
+
     Args:
     jokeId (str): The unique identifier of the joke to be updated.
     content (str): The new content for the joke to be updated.
+    if_match (Optional[str]): The If-Match header value, the joke's expected ``updatedAt``.
 
     Returns:
     AdminUpdateJokeResponse: Response model indicating the successful update of a joke, including the updated joke details.
+
+    Raises:
+    JokeNotFoundError: If no joke has the given ID.
+    JokeVersionConflictError: If the joke was modified after the version in ``if_match``.
+    DuplicateJokeError: If another joke already has this content.
     """
-    joke = await prisma.models.Joke.prisma().find_unique(where={"id": jokeId})
-    if joke is None:
-        return AdminUpdateJokeResponse(success=False, updatedJoke=None)
-    updated_joke = await prisma.models.Joke.prisma().update(
-        where={"id": jokeId}, data={"content": content}
-    )
-    updated_joke_model = Joke(
-        id=updated_joke.id,
-        content=updated_joke.content,
-        createdAt=updated_joke.createdAt.isoformat(),
-        updatedAt=updated_joke.updatedAt.isoformat(),
-    )
-    return AdminUpdateJokeResponse(success=True, updatedJoke=updated_joke_model)
+    expected = parse_if_match(if_match)
+    owner = duplicate_of(content, jokeId)
+    if owner is not None:
+        DUPLICATE_JOKES.inc("rejected")
+        raise DuplicateJokeError(owner)
+    where = {"id": jokeId}
+    if expected is not None:
+        where["updatedAt"] = expected
+    try:
+        updated_joke = await query(
+            "Joke.update",
+            prisma.models.Joke.prisma().update(
+                where=where, data={"content": content, "contentHash": content_hash(content)}
+            ),
+            timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+        )
+    except prisma.errors.UniqueViolationError as e:
+        DUPLICATE_JOKES.inc("rejected")
+        raise DuplicateJokeError(await duplicate_owner(content, e))
+    if updated_joke is None:
+        await raise_write_miss(jokeId, expected)
+    joke_index.update(updated_joke.id, updated_joke.content)
+    with time_serialization("AdminUpdateJokeResponse"):
+        updated_joke_model = Joke(
+            id=updated_joke.id,
+            content=updated_joke.content,
+            createdAt=updated_joke.createdAt.isoformat(),
+            updatedAt=updated_joke.updatedAt.isoformat(),
+        )
+        return AdminUpdateJokeResponse(success=True, updatedJoke=updated_joke_model)
@@ -0,0 +1,44 @@
+import random
+from typing import List, Sequence
+
+
+class AliasTable:
+    """
+    Walker/Vose alias table for drawing indices in proportion to a fixed list of weights.
+
+    Building the table is O(n); each draw is O(1): one uniform slot plus one biased coin flip.
+    """
+
+    def __init__(self, weights: Sequence[float]) -> None:
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("AliasTable needs at least one positive weight")
+        scaled = [w * n / total for w in weights]
+        self._probabilities: List[float] = [0.0] * n
+        self._aliases: List[int] = [0] * n
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            lesser = small.pop()
+            greater = large.pop()
+            self._probabilities[lesser] = scaled[lesser]
+            self._aliases[lesser] = greater
+            scaled[greater] = scaled[greater] + scaled[lesser] - 1.0
+            if scaled[greater] < 1.0:
+                small.append(greater)
+            else:
+                large.append(greater)
+        # Whatever is left over is 1.0 up to floating point error.
+        for i in large + small:
+            self._probabilities[i] = 1.0
+            self._aliases[i] = i
+
+    def __len__(self) -> int:
+        return len(self._probabilities)
+
+    def draw(self) -> int:
+        slot = random.randrange(len(self._probabilities))
+        if random.random() < self._probabilities[slot]:
+            return slot
+        return self._aliases[slot]
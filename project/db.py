@@ -0,0 +1,228 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import prisma.errors
+from project.metrics import DB_QUERY_ERRORS, DB_QUERY_SECONDS, counter, gauge
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How long a single query may take before it is abandoned; "0" waits for Prisma's own timeouts.
+DB_QUERY_TIMEOUT_SECONDS = float(os.getenv("DB_QUERY_TIMEOUT_SECONDS", "5"))
+# Deadline for admin writes, bulk jobs, background flushes and startup loads, which may scan or
+# write far more rows than a request-path read; "0", the default, leaves it to Prisma. Abandoning a
+# write client-side does not stop the database from committing it, only the in-process indexes
+# from learning about it.
+DB_LONG_QUERY_TIMEOUT_SECONDS = float(os.getenv("DB_LONG_QUERY_TIMEOUT_SECONDS", "0"))
+# Consecutive failed queries that open the circuit breaker, and how long it then stays open before
+# a single query is let through to probe the database.
+DB_BREAKER_FAILURE_THRESHOLD = int(os.getenv("DB_BREAKER_FAILURE_THRESHOLD", "5"))
+DB_BREAKER_RESET_SECONDS = float(os.getenv("DB_BREAKER_RESET_SECONDS", "10"))
+
+# Connections each worker's Prisma query engine may open, and seconds a query waits for a free one
+# before failing. "0" leaves Prisma's defaults (2 * CPUs + 1 connections, 10 seconds), or whatever
+# connection_limit and pool_timeout DATABASE_URL already sets.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0"))
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "0"))
+
+BREAKER_STATES = ("closed", "half_open", "open")
+
+DB_QUERY_REJECTED = counter(
+    "db_query_rejected_total",
+    'Prisma queries not sent because the database circuit breaker was open, by operation, such '
+    'as "Joke.find_many".',
+    ("operation",),
+)
+DB_BREAKER_TRANSITIONS = counter(
+    "db_breaker_transitions_total",
+    "Database circuit breaker state changes, by the state entered.",
+    ("state",),
+)
+
+
+class DatabaseUnavailableError(Exception):
+    """
+    Raised instead of a query's result when the database did not answer in time or the circuit
+    breaker is open. ``retry_after`` is a hint, in seconds, for when to try again.
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class CircuitBreaker:
+    """
+    Stops sending queries to a database that keeps failing.
+
+    The breaker is closed while queries succeed. ``failure_threshold`` consecutive failures open
+    it, and for ``reset_seconds`` every query is rejected without reaching Prisma, so that callers
+    fail fast instead of each waiting out a deadline. Then it is half open: one query is let
+    through, and its outcome closes the breaker again or reopens it for another period.
+
+    Only failures that say something about the database count: deadlines, lost connections and
+    engine errors. Errors the database answered with, such as unique violations, do not.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DB_BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = DB_BREAKER_RESET_SECONDS,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """
+        Returns whether a query may be sent now. In the half open state only the first caller is
+        allowed, and it must report back through ``succeeded`` or ``failed``.
+        """
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            self._enter("half_open")
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def succeeded(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != "closed":
+            logger.info("Database answered again; closing the circuit breaker")
+            self._enter("closed")
+
+    def failed(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or (
+            self.state == "closed" and self.failures >= self.failure_threshold
+        ):
+            logger.warning(
+                "Opening the database circuit breaker for %gs after %d failed queries",
+                self.reset_seconds,
+                self.failures,
+            )
+            self._opened_at = time.monotonic()
+            self._enter("open")
+
+    def released(self) -> None:
+        """
+        Gives up a half open probe that ended without an outcome, such as a cancelled request.
+        """
+        self._probing = False
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the breaker lets a query through again; 0 unless it is open.
+        """
+        if self.state != "open":
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutiveFailures": self.failures,
+            "retryAfterSeconds": round(self.retry_after(), 3),
+        }
+
+    def _enter(self, state: str) -> None:
+        self.state = state
+        DB_BREAKER_TRANSITIONS.inc(state)
+
+
+def datasource_url(url: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the database URL, DATABASE_URL by default, with ``connection_limit`` and
+    ``pool_timeout`` set from DB_POOL_SIZE and DB_POOL_TIMEOUT_SECONDS. Returns None when neither
+    is set, so that the client keeps the URL from schema.prisma.
+    """
+    pool: Dict[str, str] = {}
+    if DB_POOL_SIZE > 0:
+        pool["connection_limit"] = str(DB_POOL_SIZE)
+    if DB_POOL_TIMEOUT_SECONDS > 0:
+        pool["pool_timeout"] = str(DB_POOL_TIMEOUT_SECONDS)
+    url = url or os.getenv("DATABASE_URL")
+    if not pool or not url:
+        return None
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query, keep_blank_values=True))
+    params.update(pool)
+    return urlunsplit(parts._replace(query=urlencode(params)))
+
+
+def client_options() -> Dict[str, Any]:
+    """
+    Keyword arguments for ``Prisma()`` that apply the configured connection pool.
+    """
+    url = datasource_url()
+    return {} if url is None else {"datasource": {"url": url}}
+
+
+db_breaker = CircuitBreaker()
+
+gauge(
+    "db_breaker_state",
+    "Database circuit breaker state: 0 closed, 1 half open, 2 open.",
+    function=lambda: BREAKER_STATES.index(db_breaker.state),
+)
+
+
+async def query(
+    operation: str, awaitable: Awaitable[T], timeout: Optional[float] = None
+) -> T:
+    """
+    Awaits a Prisma query and records its latency, and any error, under ``operation``.
+
+    The query is abandoned after ``timeout`` seconds, DB_QUERY_TIMEOUT_SECONDS by default, and is
+    not sent at all while the circuit breaker is open. Both raise ``DatabaseUnavailableError``.
+    Writes whose outcome must reach the in-process indexes, and queries that scan whole tables,
+    pass ``timeout=DB_LONG_QUERY_TIMEOUT_SECONDS`` instead.
+
+    Usage: ``await query("Joke.find_many", prisma.models.Joke.prisma().find_many())``.
+    """
+    if not db_breaker.allow():
+        if inspect.iscoroutine(awaitable):
+            awaitable.close()
+        DB_QUERY_REJECTED.inc(operation)
+        raise DatabaseUnavailableError(
+            "Database is unavailable; try again later", db_breaker.retry_after()
+        )
+    if timeout is None:
+        timeout = DB_QUERY_TIMEOUT_SECONDS
+    with DB_QUERY_SECONDS.time(operation):
+        try:
+            result = await (asyncio.wait_for(awaitable, timeout) if timeout > 0 else awaitable)
+        except asyncio.TimeoutError:
+            DB_QUERY_ERRORS.inc(operation)
+            db_breaker.failed()
+            raise DatabaseUnavailableError(
+                f"{operation} did not complete within {timeout:g}s", db_breaker.retry_after()
+            ) from None
+        except prisma.errors.DataError:
+            DB_QUERY_ERRORS.inc(operation)
+            db_breaker.succeeded()
+            raise
+        except Exception:
+            DB_QUERY_ERRORS.inc(operation)
+            db_breaker.failed()
+            raise
+        except BaseException:
+            db_breaker.released()
+            raise
+    db_breaker.succeeded()
+    return result
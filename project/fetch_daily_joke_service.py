@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import prisma
+import prisma.models
+from project.db import DatabaseUnavailableError, query
+from project.fetch_random_joke_service import FetchLocalizedJokeResponse, translate
+from project.joke_index import joke_index
+from project.localization_index import localization_index
+from project.metrics import counter
+from project.responses import dumps
+
+# Mixed into every pick; changing it reshuffles the jokes of the day, including today's.
+DAILY_JOKE_SEED = os.getenv("DAILY_JOKE_SEED", "")
+
+_DAY_SECONDS = 86400
+# IDs scored between yields to the event loop while a pick scans the whole corpus.
+_SCAN_CHUNK = 10000
+# Languages without translations are only bounded here when the localization index is not loaded.
+_MAX_PICKS = 1000
+
+DAILY_JOKE_PICKS = counter(
+    "daily_joke_picks_total",
+    "Jokes of the day picked, once per day and language unless the picked joke changes.",
+)
+
+
+class FetchDailyJokeResponse(FetchLocalizedJokeResponse):
+    """
+    The joke of the day, the same for every caller until midnight UTC. ``date`` is that day.
+    """
+
+    date: str
+
+
+class DailyJoke(NamedTuple):
+    day: int
+    id: str
+    content: str
+    # Language of ``content``, None for the base joke content.
+    language: Optional[str]
+    # Language whose translated jokes the pick was made from, None for the whole corpus.
+    pool: Optional[str]
+    # Rendezvous score of the pick, None when it was drawn from the database by offset.
+    score: Optional[int]
+    body: bytes
+    etag: str
+
+    @property
+    def expires_in(self) -> int:
+        """
+        Seconds left until midnight UTC, when the next joke of the day takes over.
+        """
+        return max(0, (self.day + 1) * _DAY_SECONDS - int(time.time()))
+
+
+def current_day() -> int:
+    """
+    Days since the Unix epoch, in UTC.
+    """
+    return int(time.time()) // _DAY_SECONDS
+
+
+def etag(body: bytes) -> str:
+    """
+    The strong ETag of a rendered joke of the day.
+    """
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def _seeded(day: int, pool: Optional[str]) -> Any:
+    return hashlib.blake2b(
+        f"{DAILY_JOKE_SEED}\0{day}\0{pool or ''}".encode("utf-8"), digest_size=8
+    )
+
+
+def _score(seeded: Any, joke_id: str) -> int:
+    hashed = seeded.copy()
+    hashed.update(joke_id.encode("utf-8"))
+    return int.from_bytes(hashed.digest(), "big")
+
+
+async def rendezvous(seeded: Any, ids: List[str]) -> Optional[Tuple[int, str]]:
+    """
+    Returns the highest ``(score, id)`` of ``ids`` under the seeded hash, or None when there are
+    none. Every worker picks the same joke from the same corpus, and adding or removing any other
+    joke leaves the pick where it is.
+    """
+    best: Optional[Tuple[int, str]] = None
+    for start in range(0, len(ids), _SCAN_CHUNK):
+        for joke_id in ids[start : start + _SCAN_CHUNK]:
+            scored = (_score(seeded, joke_id), joke_id)
+            if best is None or scored > best:
+                best = scored
+        await asyncio.sleep(0)
+    return best
+
+
+class DailyJokes:
+    """
+    Picks and renders one joke per day and language, at most once per worker.
+
+    A language with translations in the localization index gets its own joke, picked from the
+    jokes translated into it; every other request is served the day's pick from the whole corpus,
+    translated when possible. The pick is a rendezvous hash seeded with DAILY_JOKE_SEED, the day
+    and the language, over the joke index, or a seeded offset into the table in "db" mode.
+
+    The rendered body and its ETag are kept until the day ends. They are dropped early when the
+    picked joke or translation is edited or removed, or when a joke added to the index outscores
+    the pick, so that the pick stays the one a freshly started worker would make.
+    """
+
+    def __init__(self) -> None:
+        self._picks: Dict[Tuple[int, Optional[str]], DailyJoke] = {}
+        self._picking: Dict[Tuple[int, Optional[str]], asyncio.Task] = {}
+        self._generation = 0
+
+    async def get(self, language: Optional[str]) -> Optional[DailyJoke]:
+        """
+        Returns today's joke for ``language``, or None when there are no jokes at all.
+        """
+        if localization_index.loaded and language not in localization_index.languages:
+            language = None
+        key = (current_day(), language)
+        picked = self._picks.get(key)
+        if picked is not None:
+            return picked
+        task = self._picking.get(key)
+        if task is None:
+            task = self._picking[key] = asyncio.create_task(self._pick(*key))
+            task.add_done_callback(lambda _: self._picking.pop(key, None))
+        return await asyncio.shield(task)
+
+    def forget(self, joke_id: Optional[str] = None, language: Optional[str] = None) -> None:
+        """
+        Drops today's picks of ``joke_id``, or those made from ``language``'s translations.
+        """
+        self._generation += 1
+        for key, picked in list(self._picks.items()):
+            if picked.id == joke_id or (language is not None and picked.pool == language):
+                del self._picks[key]
+
+    async def _pick(self, day: int, language: Optional[str]) -> Optional[DailyJoke]:
+        generation = self._generation
+        pool = language if localization_index.loaded else None
+        score: Optional[int] = None
+        if pool is not None:
+            best = await rendezvous(_seeded(day, pool), localization_index.translated(pool))
+            if best is None:
+                return None
+            score, joke_id = best
+            content = localization_index.get(joke_id, pool) or ""
+            served_language: Optional[str] = pool
+        else:
+            picked = await self._pick_base(day)
+            if picked is None:
+                return None
+            score, joke_id, content = picked
+            served_language = None
+            if language:
+                try:
+                    translation = await translate(joke_id, language)
+                except DatabaseUnavailableError:
+                    translation = None
+                if translation is not None:
+                    content, served_language = translation, language
+        fields = {"id": joke_id, "content": content}
+        if served_language is not None:
+            fields["language"] = served_language
+        date = datetime.fromtimestamp(day * _DAY_SECONDS, timezone.utc).date()
+        fields["date"] = date.isoformat()
+        body = dumps(fields)
+        picked_joke = DailyJoke(
+            day, joke_id, content, served_language, pool, score, body, etag(body)
+        )
+        DAILY_JOKE_PICKS.inc()
+        if generation == self._generation:
+            if len(self._picks) >= _MAX_PICKS or any(key[0] != day for key in self._picks):
+                self._picks = {key: kept for key, kept in self._picks.items() if key[0] == day}
+                if len(self._picks) >= _MAX_PICKS:
+                    self._picks.clear()
+            self._picks[(day, language)] = picked_joke
+        return picked_joke
+
+    async def _pick_base(self, day: int) -> Optional[Tuple[Optional[int], str, str]]:
+        if joke_index.loaded:
+            best = await rendezvous(_seeded(day, None), joke_index.ids())
+            if best is None:
+                return None
+            score, joke_id = best
+            return score, joke_id, joke_index.get(joke_id) or ""
+        total = await query("Joke.count", prisma.models.Joke.prisma().count())
+        if total == 0:
+            return None
+        joke = await query(
+            "Joke.find_first",
+            prisma.models.Joke.prisma().find_first(
+                skip=_score(_seeded(day, None), "") % total, order={"id": "asc"}
+            ),
+        )
+        if joke is None:
+            return None
+        return None, joke.id, joke.content
+
+    def _on_joke_changed(self, event: str, joke_id: str, content: Optional[str]) -> None:
+        if event != "add":
+            self.forget(joke_id)
+            return
+        if not joke_index.loaded:
+            return
+        for key, picked in list(self._picks.items()):
+            if picked.pool is not None or picked.score is None:
+                continue
+            if (_score(_seeded(picked.day, None), joke_id), joke_id) > (picked.score, picked.id):
+                self._generation += 1
+                del self._picks[key]
+
+
+daily_jokes = DailyJokes()
+joke_index.subscribe(daily_jokes._on_joke_changed)
+
+
+def not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches ``etag``, using the weak comparison it calls for, so
+    that the weakened ETag of a compressed response matches too.
+    """
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+async def fetch_daily_joke(language: Optional[str] = None) -> Optional[DailyJoke]:
+    """
+    Returns the joke of the day, rendered once per day and language.
+
+    Args:
+        language (Optional[str]): A normalized language tag. Languages with translations get a joke
+            picked from those translations; the others get the day's joke translated when possible,
+            and its base content otherwise.
+
+    Returns:
+        Optional[DailyJoke]: The pick with its rendered JSON body and strong ETag, or None when
+            there are no jokes.
+    """
+    return await daily_jokes.get(language)
@@ -1,10 +1,28 @@
+import os
 import random
-from typing import List
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 import prisma
 import prisma.models
+from project.db import DatabaseUnavailableError, query
+from project.joke_index import joke_index
+from project.localization_index import localization_index, localized_text
+from project.metrics import counter, time_serialization
+from project.responses import dumps
+from project.seen_jokes import seen_jokes
+from project.weighted_joke_sampler import weighted_joke_sampler
 from pydantic import BaseModel
 
+# Jokes sampled from the database that are kept to be served while it is unavailable, when the
+# joke index is not loaded.
+STALE_JOKES_MAX = int(os.getenv("STALE_JOKES_MAX", "1000"))
+
+STALE_JOKES_SERVED = counter(
+    "stale_jokes_served_total",
+    "Random jokes served from recently sampled jokes because the database was unavailable.",
+)
+
 
 class FetchRandomJokeResponse(BaseModel):
     """
@@ -15,18 +33,180 @@ class FetchRandomJokeResponse(BaseModel):
     content: str
 
 
-async def fetch_random_joke() -> FetchRandomJokeResponse:
+class FetchLocalizedJokeResponse(FetchRandomJokeResponse):
+    """
+    A random joke, translated when a translation exists. ``language`` is the language of
+    ``content``, or None when the base joke content was served.
+    """
+
+    language: Optional[str] = None
+
+
+async def sample_joke_from_db() -> Optional[prisma.models.Joke]:
+    """
+    Picks a single random joke row using an offset into the table, without loading the rest of it.
+
+    Used when the in-memory joke index is disabled, for deployments that cannot hold the whole corpus.
+
+    Returns:
+        Optional[prisma.models.Joke]: The selected joke, or None if the table is empty.
+    """
+    total = await query("Joke.count", prisma.models.Joke.prisma().count())
+    if total == 0:
+        return None
+    return await query(
+        "Joke.find_first",
+        prisma.models.Joke.prisma().find_first(
+            skip=random.randrange(total), order={"id": "asc"}
+        ),
+    )
+
+
+# A uniform sample of the jokes read by sample_joke, kept in place as new ones are read.
+_recent: List[Tuple[str, str]] = []
+_sampled = 0
+
+
+async def sample_joke() -> Optional[Tuple[str, str]]:
+    """
+    Samples a joke from the database, or serves one of those sampled before while the database is
+    unavailable. Only when none has been sampled yet does ``DatabaseUnavailableError`` propagate.
+    """
+    global _sampled
+    try:
+        random_joke = await sample_joke_from_db()
+    except DatabaseUnavailableError:
+        if not _recent:
+            raise
+        STALE_JOKES_SERVED.inc()
+        return random.choice(_recent)
+    if random_joke is None:
+        return None
+    picked = (random_joke.id, random_joke.content)
+    _sampled += 1
+    if len(_recent) < STALE_JOKES_MAX:
+        _recent.append(picked)
+    elif (slot := random.randrange(_sampled)) < STALE_JOKES_MAX:
+        _recent[slot] = picked
+    return picked
+
+
+def _on_joke_changed(event: str, joke_id: str, content: Optional[str]) -> None:
+    if event != "add":
+        _recent[:] = [picked for picked in _recent if picked[0] != joke_id]
+
+
+joke_index.subscribe(_on_joke_changed)
+
+
+async def translate(joke_id: str, language: str) -> Optional[str]:
+    """
+    Returns a joke's translation into ``language``, or None if it has none.
+
+    Answered from the localization index when it is loaded; otherwise a single Localization row is
+    read by its (jokeId, language) key.
+    """
+    if localization_index.loaded:
+        return localization_index.get(joke_id, language)
+    localization = await query(
+        "Localization.find_unique",
+        prisma.models.Localization.prisma().find_unique(
+            where={"jokeId_language": {"jokeId": joke_id, "language": language}}
+        ),
+    )
+    return None if localization is None else localized_text(localization.content)
+
+
+def draw_joke(weighted: bool) -> Optional[Tuple[str, str]]:
+    """
+    Picks a joke from the resident joke index, by rating when ``weighted`` and the alias table is
+    built, and uniformly otherwise.
+    """
+    picked = weighted_joke_sampler.random() if weighted else None
+    if picked is None:
+        picked = joke_index.random()
+    return picked
+
+
+# Rendered bodies of served jokes, least recently served first. The key holds the content itself,
+# so an edited joke or translation simply misses and the stale entry ages out.
+_rendered: "OrderedDict[Tuple[str, str, Optional[str]], bytes]" = OrderedDict()
+_MAX_RENDERED = 10000
+
+
+async def pick_random_joke(
+    weighted: bool = False, language: Optional[str] = None, seen_by: Optional[str] = None
+) -> Tuple[str, str, Optional[str]]:
+    """
+    Selects a random joke for ``fetch_random_joke`` and returns its ID, the content to serve and
+    the language of that content, which is None for the base content.
+    """
+    if joke_index.loaded:
+        if seen_by is not None and seen_jokes.loaded:
+            picked = seen_jokes.pick(seen_by, lambda: draw_joke(weighted))
+        else:
+            picked = draw_joke(weighted)
+    else:
+        picked = await sample_joke()
+    if picked is None:
+        return "N/A", "No jokes available.", None
+    joke_id, content = picked
+    if language:
+        try:
+            translation = await translate(joke_id, language)
+        except DatabaseUnavailableError:
+            # The base content is better than no joke at all.
+            translation = None
+        if translation is not None:
+            return joke_id, translation, language
+    return joke_id, content, None
+
+
+async def fetch_random_joke(
+    weighted: bool = False, language: Optional[str] = None, seen_by: Optional[str] = None
+) -> FetchLocalizedJokeResponse:
     """
-    Fetches a random joke from the database and returns it.
+    Fetches a random joke and returns it.
+
+    Jokes are served from the resident joke index when it is loaded, which makes the selection O(1)
+    with no database round trip. Otherwise a single row is sampled from the database.
 
     Args:
-        None
+        weighted (bool): If True, jokes are picked in proportion to their aggregate rating using the
+            precomputed alias table. Requires the resident joke index; ignored in "db" mode.
+        language (Optional[str]): A normalized language tag. The picked joke is translated from the
+            localization index when possible and falls back to its base content otherwise.
+        seen_by (Optional[str]): A client key for no_repeat. The client is not served a joke again
+            until it has seen every joke. Requires the resident joke index; ignored in "db" mode.
 
     Returns:
-        FetchRandomJokeResponse: Response model for delivering a randomly selected joke to the user.
+        FetchLocalizedJokeResponse: Response model for delivering a randomly selected joke to the user.
+    """
+    joke_id, content, served_language = await pick_random_joke(weighted, language, seen_by)
+    with time_serialization("FetchRandomJokeResponse"):
+        return FetchLocalizedJokeResponse(id=joke_id, content=content, language=served_language)
+
+
+async def render_random_joke(
+    weighted: bool = False, language: Optional[str] = None, seen_by: Optional[str] = None
+) -> Tuple[bytes, Optional[str]]:
+    """
+    Like ``fetch_random_joke``, but returns the JSON body of the response and the language of its
+    content. The body is encoded straight from the picked joke, as building the response model
+    would cost several times more than the rest of the request.
     """
-    jokes: List[prisma.models.Joke] = await prisma.models.Joke.prisma().find_many()
-    if not jokes:
-        return FetchRandomJokeResponse(id="N/A", content="No jokes available.")
-    random_joke = random.choice(jokes)
-    return FetchRandomJokeResponse(id=random_joke.id, content=random_joke.content)
+    joke_id, content, served_language = await pick_random_joke(weighted, language, seen_by)
+    with time_serialization("FetchRandomJokeResponse"):
+        key = (joke_id, content, served_language)
+        body = _rendered.get(key)
+        if body is not None:
+            _rendered.move_to_end(key)
+        else:
+            fields = {"id": joke_id, "content": content}
+            if served_language is not None:
+                fields["language"] = served_language
+            body = dumps(fields)
+            _rendered[key] = body
+            if len(_rendered) > _MAX_RENDERED:
+                _rendered.popitem(last=False)
+        return body, served_language
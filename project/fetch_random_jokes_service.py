@@ -0,0 +1,94 @@
+import asyncio
+import os
+import random
+from typing import AsyncIterator, Dict, List, Tuple
+
+import prisma
+import prisma.models
+from project.db import query
+from project.fetch_random_joke_service import FetchRandomJokeResponse
+from project.joke_index import joke_index
+from project.metrics import time_serialization
+from pydantic import BaseModel
+
+RANDOM_JOKES_MAX_N = int(os.getenv("RANDOM_JOKES_MAX_N", "1000"))
+# Queries one request may have in flight when it samples from the database, so that a large n
+# does not take every pooled connection.
+_CONCURRENT_READS = 8
+
+
+class FetchRandomJokesResponse(BaseModel):
+    """
+    Response model for delivering a batch of distinct, randomly selected jokes to the user.
+    """
+
+    jokes: List[FetchRandomJokeResponse]
+
+
+async def iter_random_jokes(n: int) -> AsyncIterator[FetchRandomJokeResponse]:
+    """
+    Yields up to n distinct random jokes, sampled without replacement.
+
+    The resident joke index is used when it is loaded. Otherwise n distinct row offsets are drawn
+    from the table, in ID order, and the rows at them are read and yielded in the order they were
+    drawn. Offsets that turn out to be consecutive are read together, one query per run, with a
+    few runs read at a time.
+
+    Args:
+        n (int): The number of jokes to return. Fewer are yielded if the corpus is smaller.
+
+    Yields:
+        FetchRandomJokeResponse: One randomly selected joke.
+    """
+    if joke_index.loaded:
+        for joke_id, content in joke_index.sample(n):
+            yield FetchRandomJokeResponse(id=joke_id, content=content)
+        return
+    total = await query("Joke.count", prisma.models.Joke.prisma().count())
+    offsets = random.sample(range(total), min(n, total))
+    runs: List[Tuple[int, int]] = []
+    for offset in sorted(offsets):
+        if runs and runs[-1][0] + runs[-1][1] == offset:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((offset, 1))
+    results: List[List[prisma.models.Joke]] = []
+    for first in range(0, len(runs), _CONCURRENT_READS):
+        results += await asyncio.gather(
+            *(
+                query(
+                    "Joke.find_many",
+                    prisma.models.Joke.prisma().find_many(
+                        skip=start, take=length, order={"id": "asc"}
+                    ),
+                )
+                for start, length in runs[first : first + _CONCURRENT_READS]
+            )
+        )
+    at: Dict[int, prisma.models.Joke] = {}
+    for (start, _), jokes in zip(runs, results):
+        for position, joke in enumerate(jokes, start):
+            at[position] = joke
+    # Rows added or deleted between the reads can shift one joke to two offsets, or off the end.
+    seen = set()
+    for offset in offsets:
+        joke = at.get(offset)
+        if joke is None or joke.id in seen:
+            continue
+        seen.add(joke.id)
+        yield FetchRandomJokeResponse(id=joke.id, content=joke.content)
+
+
+async def fetch_random_jokes(n: int) -> FetchRandomJokesResponse:
+    """
+    Fetches n distinct random jokes and returns them in a single response.
+
+    Args:
+        n (int): The number of jokes to return.
+
+    Returns:
+        FetchRandomJokesResponse: Response model for delivering a batch of distinct, randomly selected jokes to the user.
+    """
+    jokes = [joke async for joke in iter_random_jokes(n)]
+    with time_serialization("FetchRandomJokesResponse"):
+        return FetchRandomJokesResponse(jokes=jokes)
@@ -0,0 +1,80 @@
+from typing import Dict, List
+
+import prisma
+import prisma.models
+from project.db import query
+from project.joke_index import joke_index
+from project.metrics import time_serialization
+from project.rating_aggregates import LEADERBOARD_WINDOWS, rating_aggregates
+from pydantic import BaseModel
+
+
+class TopJoke(BaseModel):
+    """
+    A joke on the leaderboard together with its rating aggregate for the requested window.
+    """
+
+    id: str
+    content: str
+    ratingCount: int
+    ratingSum: int
+    ratingMean: float
+
+
+class FetchTopJokesResponse(BaseModel):
+    """
+    Response model for the top-rated jokes leaderboard.
+    """
+
+    window: str
+    jokes: List[TopJoke]
+
+
+async def fetch_top_jokes(n: int, window: str = "all") -> FetchTopJokesResponse:
+    """
+    Returns the n best rated jokes for a time window, read from the in-process rating aggregates.
+
+    The ranking never queries the Rating table. Joke contents come from the resident joke index, or
+    from a single ``find_many`` by ID when the index is not loaded.
+
+    Args:
+        n (int): The number of jokes to return.
+        window (str): One of "all", "day", "week" or "month".
+
+    Returns:
+        FetchTopJokesResponse: Response model for the top-rated jokes leaderboard.
+    """
+    if window not in LEADERBOARD_WINDOWS:
+        raise ValueError(
+            f"Unknown window '{window}', expected one of {', '.join(LEADERBOARD_WINDOWS)}"
+        )
+    ranked = rating_aggregates.top(window, n)
+    if joke_index.loaded:
+        contents: Dict[str, str] = {
+            joke_id: content
+            for joke_id, _, _ in ranked
+            if (content := joke_index.get(joke_id)) is not None
+        }
+    else:
+        jokes = await query(
+            "Joke.find_many",
+            prisma.models.Joke.prisma().find_many(
+                where={"id": {"in": [joke_id for joke_id, _, _ in ranked]}}
+            ),
+        )
+        contents = {joke.id: joke.content for joke in jokes}
+    with time_serialization("FetchTopJokesResponse"):
+        return FetchTopJokesResponse(
+            window=window,
+            jokes=[
+                TopJoke(
+                    id=joke_id,
+                    content=contents[joke_id],
+                    ratingCount=count,
+                    ratingSum=total,
+                    ratingMean=total / count,
+                )
+                for joke_id, count, total in ranked
+                if joke_id in contents
+            ],
+        )
@@ -1,9 +1,14 @@
 from datetime import datetime
 from enum import Enum
+from typing import Optional
 
 import prisma
 import prisma.enums
 import prisma.models
+from project.db import query
+from project.metrics import time_serialization
+from project.profile_cache import profile_cache
+from project.sessions import InvalidSessionError
 from pydantic import BaseModel
 
 
@@ -25,31 +30,54 @@ class Role(Enum):
     EDITOR: str = "EDITOR"
 
 
-async def fetch_user_profile() -> FetchUserProfileResponse:
+async def load_user_profile(user_id: str) -> Optional[FetchUserProfileResponse]:
+    """
+    Reads a user's profile from the database, bypassing the profile cache.
+
+    Args:
+        user_id (str): The ID of the user whose profile to read.
+
+    Returns:
+        Optional[FetchUserProfileResponse]: The user's profile, or None if there is no such user.
+    """
+    user_record = await query(
+        "User.find_unique",
+        prisma.models.User.prisma().find_unique(where={"id": user_id}),
+    )
+    if not user_record:
+        return None
+    with time_serialization("FetchUserProfileResponse"):
+        return FetchUserProfileResponse(
+            id=user_record.id,
+            email=user_record.email,
+            role=prisma.enums.Role(user_record.role),
+            createdAt=user_record.createdAt,
+            updatedAt=user_record.updatedAt,
+        )
+
+
+async def fetch_user_profile(user_id: str) -> FetchUserProfileResponse:
     """
     Retrieves the profile information of a logged-in user.
 
-    This function queries the Prisma ORM to find the first User record from the database, simulating
-    fetching the logged-in user's profile information. It returns a comprehensive model of the user's information.
+    The caller is identified by the user ID from their verified session token. Profiles are served
+    from the TTL/LRU profile cache, so only the first read after login, expiry or an update reaches
+    the database, and concurrent misses for the same user share a single query. An expired profile
+    is still served while it is refreshed in the background, which keeps this working while the
+    database is unavailable.
 
-    Note: For a real application scenario, the function should be adapted to identify the user via authentication
-    token/session and query by user's unique identifier.
+    Args:
+        user_id (str): The ID of the logged-in user, as resolved from their session token.
 
     Returns:
         FetchUserProfileResponse: Response model for a user's profile information, providing details about the user.
 
-    Example:
-        # Assuming there is a user logged in and their ID is known,
-        # This function would return an instance of FetchUserProfileResponse with the user's details.
+    Raises:
+        InvalidSessionError: If the session's user no longer exists.
     """
-    user_record = await prisma.models.User.prisma().find_first()
-    if not user_record:
-        raise Exception("User not found")
-    user_profile = FetchUserProfileResponse(
-        id=user_record.id,
-        email=user_record.email,
-        role=prisma.enums.Role(user_record.role),
-        createdAt=user_record.createdAt,
-        updatedAt=user_record.updatedAt,
+    user_profile = await profile_cache.get_or_load(
+        user_id, lambda: load_user_profile(user_id)
     )
+    if user_profile is None:
+        raise InvalidSessionError("User no longer exists")
     return user_profile
@@ -0,0 +1,184 @@
+import hashlib
+import logging
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+import prisma
+import prisma.errors
+import prisma.models
+from project.db import query
+from project.joke_index import JokeIndex, joke_index
+from project.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+DUPLICATE_JOKES = counter(
+    "duplicate_jokes_total",
+    "Joke writes whose content duplicated an existing joke, by action: rejected, merged or "
+    "skipped.",
+    ("action",),
+)
+
+
+def normalize_content(content: str) -> str:
+    """
+    Reduces joke content to what makes it the same joke: Unicode compatibility forms are folded,
+    case is ignored and every run of punctuation and whitespace counts as a single space.
+    """
+    folded = unicodedata.normalize("NFKC", content).casefold()
+    return _NON_WORD.sub(" ", folded).strip()
+
+
+def content_digest(content: str) -> bytes:
+    return hashlib.blake2b(normalize_content(content).encode("utf-8"), digest_size=16).digest()
+
+
+def content_hash(content: str) -> str:
+    """
+    Returns the value stored in ``Joke.contentHash``: the hex digest of the normalized content.
+    """
+    return content_digest(content).hex()
+
+
+class ContentHashSet:
+    """
+    In-process map from content digest to the joke holding that content.
+
+    It lets writes find a duplicate with one dictionary lookup instead of a query. The unique
+    ``contentHash`` column stays the authority: it catches concurrent writers and other processes,
+    and it is all there is when JOKE_INDEX_MODE is "db" or "snapshot", as the set is then left
+    empty: in "snapshot" mode every worker would otherwise hash the whole shared corpus and keep
+    its own O(N) copy of the digests. Duplicates are then found by one query on the indexed
+    column, see ``find_owners``, or by the unique constraint, instead of a dictionary lookup.
+
+    Jokes that predate the column can share a digest, and their ``contentHash`` is NULL. The first
+    one owns the digest and the others are kept aside, so that when the owner is edited or removed
+    the next one takes its place and duplicates of it are still caught.
+    """
+
+    def __init__(self, jokes: JokeIndex) -> None:
+        self.jokes = jokes
+        self.loaded = False
+        self._owners: Dict[bytes, str] = {}
+        self._digests: Dict[str, bytes] = {}
+        self._holders: Dict[bytes, List[str]] = {}
+        jokes.subscribe(self._on_joke_changed)
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def load(self) -> None:
+        """
+        Hashes every joke of the loaded joke index. Does nothing in "snapshot" mode.
+        """
+        if not self.jokes.loaded:
+            return
+        if self.jokes.shared:
+            logger.info(
+                "Duplicate jokes are looked up by contentHash in the database in snapshot mode"
+            )
+            return
+        owners: Dict[bytes, str] = {}
+        digests: Dict[str, bytes] = {}
+        holders: Dict[bytes, List[str]] = {}
+        duplicates = 0
+        for joke_id, content in self.jokes.items():
+            digest = content_digest(content)
+            digests[joke_id] = digest
+            if owners.setdefault(digest, joke_id) != joke_id:
+                holders.setdefault(digest, []).append(joke_id)
+                duplicates += 1
+        self._owners = owners
+        self._digests = digests
+        self._holders = holders
+        self.loaded = True
+        if duplicates:
+            logger.warning(
+                "%d jokes duplicate the content of another joke; run python -m "
+                "project.near_duplicates --backfill to report them and fill in contentHash",
+                duplicates,
+            )
+
+    def owner(self, digest: bytes) -> Optional[str]:
+        """
+        Returns the ID of the joke whose content has the given digest, if any.
+        """
+        return self._owners.get(digest)
+
+    def _on_joke_changed(self, event: str, joke_id: str, content: Optional[str]) -> None:
+        if not self.loaded:
+            return
+        digest = self._digests.pop(joke_id, None)
+        if digest is not None:
+            self._release(digest, joke_id)
+        if content is not None:
+            digest = content_digest(content)
+            self._digests[joke_id] = digest
+            if self._owners.setdefault(digest, joke_id) != joke_id:
+                self._holders.setdefault(digest, []).append(joke_id)
+
+    def _release(self, digest: bytes, joke_id: str) -> None:
+        holders = self._holders.get(digest)
+        if self._owners.get(digest) == joke_id:
+            if holders:
+                self._owners[digest] = holders.pop(0)
+            else:
+                del self._owners[digest]
+        elif holders and joke_id in holders:
+            holders.remove(joke_id)
+        if holders == []:
+            del self._holders[digest]
+
+
+def duplicate_of(content: str, joke_id: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the ID of another joke than ``joke_id`` with the same normalized content, as far as the
+    hash set knows. Without a loaded set this is always None and the unique column decides.
+    """
+    owner = content_hashes.owner(content_digest(content))
+    return owner if owner != joke_id else None
+
+
+async def find_owners(hashes: List[str]) -> Dict[str, str]:
+    """
+    Maps those of the given content hashes that are already taken to the ID of the joke holding
+    them, from the hash set when it is loaded and with one query otherwise.
+    """
+    if content_hashes.loaded:
+        return {
+            content_hash: owner
+            for content_hash in hashes
+            if (owner := content_hashes.owner(bytes.fromhex(content_hash))) is not None
+        }
+    jokes = await query(
+        "Joke.find_many",
+        prisma.models.Joke.prisma().find_many(where={"contentHash": {"in": hashes}}),
+    )
+    return {joke.contentHash: joke.id for joke in jokes}
+
+
+async def duplicate_owner(content: str, error: prisma.errors.UniqueViolationError) -> str:
+    """
+    Resolves a unique violation on ``contentHash``, from a duplicate written concurrently or missed
+    by the hash set, to the ID of the joke holding the content. Re-raises the error when no such
+    joke exists, as the violation was then on another column.
+    """
+    joke = await query(
+        "Joke.find_unique",
+        prisma.models.Joke.prisma().find_unique(where={"contentHash": content_hash(content)}),
+    )
+    if joke is None:
+        raise error
+    return joke.id
+
+
+content_hashes = ContentHashSet(joke_index)
+
+gauge(
+    "content_hash_set_size",
+    "Distinct joke contents held in the duplicate detection hash set.",
+    function=lambda: len(content_hashes),
+)
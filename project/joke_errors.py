@@ -0,0 +1,41 @@
+class JokeNotFoundError(LookupError):
+    """
+    Raised when a joke addressed by ID does not exist.
+    """
+
+    def __init__(self, jokeId: str) -> None:
+        super().__init__(f"Joke with id {jokeId} not found")
+        self.jokeId = jokeId
+
+
+class JokeVersionConflictError(Exception):
+    """
+    Raised when a conditional write finds that the joke changed since the version the caller sent.
+    """
+
+    def __init__(self, jokeId: str) -> None:
+        super().__init__(
+            f"Joke with id {jokeId} was modified by someone else; reload it and retry"
+        )
+        self.jokeId = jokeId
+
+
+class LocalizationNotFoundError(LookupError):
+    """
+    Raised when a joke has no translation into the requested language.
+    """
+
+    def __init__(self, jokeId: str, language: str) -> None:
+        super().__init__(f"Joke with id {jokeId} has no translation into {language}")
+        self.jokeId = jokeId
+        self.language = language
+
+
+class DuplicateJokeError(Exception):
+    """
+    Raised when a joke's content, once normalized, is the same as that of another joke.
+    """
+
+    def __init__(self, jokeId: str) -> None:
+        super().__init__(f"Joke with id {jokeId} already has this content")
+        self.jokeId = jokeId
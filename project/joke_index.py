@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import os
+import random
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import prisma
+import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.joke_snapshot import SharedJokeCorpus
+from project.metrics import gauge
+
+logger = logging.getLogger(__name__)
+
+# "memory" keeps every joke resident in the process; "snapshot" maps a snapshot file shared by all
+# worker processes; "db" samples a single row per request.
+JOKE_INDEX_MODE = os.getenv("JOKE_INDEX_MODE", "memory").lower()
+JOKE_INDEX_LOAD_BATCH_SIZE = int(os.getenv("JOKE_INDEX_LOAD_BATCH_SIZE", "10000"))
+# Jokes handed to a background build between yields to the event loop; search indexing takes about
+# 10 ms per thousand jokes.
+_BUILD_CHUNK = 1000
+
+# Called with ("add" | "update" | "remove", joke_id, content) after every change to the corpus.
+JokeListener = Callable[[str, str, Optional[str]], None]
+
+
+class JokeIndex:
+    """
+    Array-backed, in-process index of joke IDs and contents.
+
+    IDs and contents are stored in two parallel lists so that picking a random joke is a single
+    ``random.randrange`` call. A dictionary maps each ID to its position, which lets updates and
+    removals run in O(1); removals swap the last entry into the freed slot.
+
+    In "snapshot" mode the corpus is read from a memory-mapped file that all workers share instead,
+    see ``project.joke_snapshot``, and changes are written into a new snapshot shortly after.
+
+    Listeners registered with ``subscribe`` are told about every add, update and removal made by
+    this process, whether or not the index itself holds the corpus, so derived structures can stay
+    in sync. Only the corpus is shared between workers: the search index, the duplicate hashes, the
+    weighted sampler, the seen-joke filters, the localization index, the rating aggregates and the
+    daily picks are built by every worker and do not hear about changes made by the others, which
+    they only see after a restart.
+
+    Those structures are plain Python dictionaries and lists, so a worker that builds one pays
+    memory and build time in proportion to the corpus, however many workers share the snapshot.
+    In "snapshot" mode a worker therefore skips the duplicate hashes, leaving duplicates to the
+    unique ``contentHash`` column, and builds the search index, the no_repeat numbering and the
+    weighted alias table in the background once it serves requests, a chunk at a time from
+    ``chunks``. Startup no longer walks the corpus, but every worker still holds O(N) memory for
+    each of them.
+    """
+
+    def __init__(self, mode: str = JOKE_INDEX_MODE) -> None:
+        self.mode = mode
+        self.loaded = False
+        self._ids: List[str] = []
+        self._contents: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._listeners: List[JokeListener] = []
+        self._shared = SharedJokeCorpus() if mode == "snapshot" else None
+
+    @property
+    def in_memory(self) -> bool:
+        return self.mode in ("memory", "snapshot")
+
+    @property
+    def shared(self) -> bool:
+        """
+        Whether the corpus is mapped from the shared snapshot, in which case the structures derived
+        from it are built in the background after startup, or not at all.
+        """
+        return self._shared is not None
+
+    def __len__(self) -> int:
+        if self._shared is not None:
+            return len(self._shared)
+        return len(self._ids)
+
+    async def load(self) -> None:
+        """
+        Loads every joke into memory, paging through the table by ID so the whole corpus is never
+        materialized as Prisma models at once. In "snapshot" mode the shared snapshot is mapped
+        instead, and only built from the table when there is none. Does nothing in "db" mode.
+        """
+        if not self.in_memory:
+            return
+        if self._shared is not None:
+            await self._shared.open(self._fetch, self._fetch_rows)
+            self.loaded = True
+            return
+        jokes = await self._fetch()
+        self._ids = [joke_id for joke_id, _ in jokes]
+        self._contents = [content for _, content in jokes]
+        self._positions = {joke_id: i for i, joke_id in enumerate(self._ids)}
+        self.loaded = True
+        logger.info("Loaded %d jokes into the in-memory joke index", len(self._ids))
+
+    async def close(self) -> None:
+        """
+        Writes changes still pending for the shared snapshot.
+        """
+        if self._shared is not None:
+            await self._shared.close()
+
+    async def _fetch(self) -> List[Tuple[str, str]]:
+        jokes: List[Tuple[str, str]] = []
+        last_id: Optional[str] = None
+        while True:
+            if last_id is None:
+                batch = await query(
+                    "Joke.find_many",
+                    prisma.models.Joke.prisma().find_many(
+                        take=JOKE_INDEX_LOAD_BATCH_SIZE, order={"id": "asc"}
+                    ),
+                    timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+                )
+            else:
+                batch = await query(
+                    "Joke.find_many",
+                    prisma.models.Joke.prisma().find_many(
+                        take=JOKE_INDEX_LOAD_BATCH_SIZE,
+                        skip=1,
+                        cursor={"id": last_id},
+                        order={"id": "asc"},
+                    ),
+                    timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+                )
+            jokes.extend((joke.id, joke.content) for joke in batch)
+            if len(batch) < JOKE_INDEX_LOAD_BATCH_SIZE:
+                return jokes
+            last_id = batch[-1].id
+
+    async def _fetch_rows(self, joke_ids: List[str]) -> Dict[str, str]:
+        rows: Dict[str, str] = {}
+        for start in range(0, len(joke_ids), JOKE_INDEX_LOAD_BATCH_SIZE):
+            batch = await query(
+                "Joke.find_many",
+                prisma.models.Joke.prisma().find_many(
+                    where={"id": {"in": joke_ids[start : start + JOKE_INDEX_LOAD_BATCH_SIZE]}}
+                ),
+                timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+            )
+            rows.update((joke.id, joke.content) for joke in batch)
+        return rows
+
+    def random(self) -> Optional[Tuple[str, str]]:
+        """
+        Returns a uniformly random ``(id, content)`` pair, or None when the index is empty.
+        """
+        if self._shared is not None:
+            return self._shared.random()
+        if not self._ids:
+            return None
+        position = random.randrange(len(self._ids))
+        return self._ids[position], self._contents[position]
+
+    def sample(self, k: int) -> List[Tuple[str, str]]:
+        """
+        Returns up to ``k`` distinct ``(id, content)`` pairs, sampled without replacement.
+
+        ``random.sample`` over a ``range`` never materializes the population, so only the ``k``
+        chosen entries are touched.
+        """
+        if self._shared is not None:
+            return self._shared.sample(k)
+        positions = random.sample(range(len(self._ids)), min(k, len(self._ids)))
+        return [(self._ids[position], self._contents[position]) for position in positions]
+
+    def get(self, joke_id: str) -> Optional[str]:
+        if self._shared is not None:
+            return self._shared.get(joke_id)
+        position = self._positions.get(joke_id)
+        if position is None:
+            return None
+        return self._contents[position]
+
+    def ids(self) -> List[str]:
+        """
+        Returns a copy of the indexed joke IDs, in position order.
+        """
+        if self._shared is not None:
+            return self._shared.ids()
+        return list(self._ids)
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """
+        Iterates over the indexed ``(id, content)`` pairs, in position order. The index must not be
+        changed while the iterator is in use.
+        """
+        if self._shared is not None:
+            return self._shared.items()
+        return zip(self._ids, self._contents)
+
+    async def chunks(
+        self, size: int = _BUILD_CHUNK
+    ) -> AsyncIterator[List[Tuple[str, str]]]:
+        """
+        Yields the indexed ``(id, content)`` pairs in lists of up to ``size`` in "snapshot" mode, and
+        in a single list otherwise, letting the event loop run between them. The corpus may change meanwhile, and a joke changed after its list was
+        yielded is not yielded again, so a structure built from the lists must also apply the
+        changes its listener hears about while it is being built.
+        """
+        if self._shared is not None:
+            chunks: Iterator[List[Tuple[str, str]]] = self._shared.chunks(size)
+        else:
+            # Resident lists are reordered by removals, so they are handed over in one piece.
+            chunks = iter([list(zip(self._ids, self._contents))])
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(0)
+
+    def subscribe(self, listener: JokeListener) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, joke_id: str, content: Optional[str]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event, joke_id, content)
+            except Exception:
+                logger.exception("Joke index listener failed on %s of %s", event, joke_id)
+
+    def add(self, joke_id: str, content: str) -> None:
+        if self.loaded:
+            self._store(joke_id, content)
+        self._notify("add", joke_id, content)
+
+    def update(self, joke_id: str, content: str) -> None:
+        if self.loaded:
+            self._store(joke_id, content)
+        self._notify("update", joke_id, content)
+
+    def remove(self, joke_id: str) -> None:
+        if self.loaded:
+            self._discard(joke_id)
+        self._notify("remove", joke_id, None)
+
+    def _store(self, joke_id: str, content: str) -> None:
+        if self._shared is not None:
+            self._shared.store(joke_id, content)
+            return
+        position = self._positions.get(joke_id)
+        if position is not None:
+            self._contents[position] = content
+            return
+        self._positions[joke_id] = len(self._ids)
+        self._ids.append(joke_id)
+        self._contents.append(content)
+
+    def _discard(self, joke_id: str) -> None:
+        if self._shared is not None:
+            self._shared.discard(joke_id)
+            return
+        position = self._positions.pop(joke_id, None)
+        if position is None:
+            return
+        last_id = self._ids.pop()
+        last_content = self._contents.pop()
+        if position < len(self._ids):
+            self._ids[position] = last_id
+            self._contents[position] = last_content
+            self._positions[last_id] = position
+
+
+joke_index = JokeIndex()
+
+gauge(
+    "joke_index_size",
+    "Jokes held in the resident joke index.",
+    function=lambda: len(joke_index),
+)
+gauge(
+    "joke_snapshot_pending_changes",
+    "Joke changes made by this process that are not in the shared snapshot yet.",
+    function=lambda: joke_index._shared.pending if joke_index._shared is not None else 0,
+)
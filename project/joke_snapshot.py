@@ -0,0 +1,644 @@
+"""
+Binary snapshot of the joke corpus that every worker process maps read-only.
+
+    python -m project.joke_snapshot [--interval SECONDS]
+
+rebuilds the snapshot at JOKE_SNAPSHOT_PATH from the Joke table, once or every ``--interval``
+seconds, for running as a sidecar next to the web workers.
+
+A snapshot is a single file, in native byte order:
+
+    magic           8 bytes, b"JOKESNP1"
+    count           uint64
+    built_at        float64, Unix time the file was written
+    id offsets      uint64 * (count + 1), file offsets of the IDs and the end of the last one
+    content offsets uint64 * (count + 1), likewise for the contents
+    ids             UTF-8 joke IDs, concatenated in ascending byte order
+    contents        UTF-8 joke contents, concatenated in the same order
+
+Entry ``i`` is read straight out of the mapping with two offset lookups, and an ID is found by a
+binary search over the sorted IDs, so opening a snapshot costs the same whatever its size and the
+pages are shared by every process that maps the file. A new snapshot is written next to the old
+one and renamed over it; processes still reading the old file keep their mapping until they notice
+the rename and map the new one.
+
+Workers rewrite the snapshot with the contents the database holds for the jokes they changed,
+read while holding the snapshot lock, rather than with the contents they wrote themselves. Two
+workers editing the same joke may rewrite in either order, and whichever goes last still writes
+the latest row.
+"""
+import argparse
+import asyncio
+import fcntl
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import prisma
+
+logger = logging.getLogger(__name__)
+
+JOKE_SNAPSHOT_PATH = os.getenv(
+    "JOKE_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "jokes.snapshot")
+)
+# Seconds after an admin change before this process writes a new snapshot, so bursts such as a
+# bulk import share one rewrite.
+JOKE_SNAPSHOT_REWRITE_DELAY_SECONDS = float(
+    os.getenv("JOKE_SNAPSHOT_REWRITE_DELAY_SECONDS", "1")
+)
+# Seconds before a failed rewrite, e.g. during a database outage, is tried again.
+JOKE_SNAPSHOT_RETRY_SECONDS = float(os.getenv("JOKE_SNAPSHOT_RETRY_SECONDS", "10"))
+# How often a process looks for a snapshot written by another process.
+JOKE_SNAPSHOT_CHECK_INTERVAL_SECONDS = float(
+    os.getenv("JOKE_SNAPSHOT_CHECK_INTERVAL_SECONDS", "1")
+)
+# A snapshot older than this is rebuilt from the database at startup; 0 trusts any snapshot, which
+# admin changes keep current, and leaves changes made outside the app to the sidecar.
+JOKE_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("JOKE_SNAPSHOT_MAX_AGE_SECONDS", "0"))
+
+MAGIC = b"JOKESNP1"
+_HEADER = struct.Struct("=8sQd")
+_OFFSET = array("Q").itemsize
+
+# The corpus changes a process has made since its snapshot: joke ID -> content, None if removed.
+Changes = Dict[str, Optional[str]]
+# Reads the current contents of the given jokes from the database, leaving out those that are gone.
+RowFetcher = Callable[[List[str]], Awaitable[Dict[str, str]]]
+
+
+class SnapshotFormatError(Exception):
+    """
+    Raised when a file is not a joke snapshot this version can read.
+    """
+
+
+class JokeSnapshot:
+    """
+    A read-only mapping of one snapshot file.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            # Identifies the file even after it has been renamed over, to detect newer snapshots.
+            self.identity = (stat.st_dev, stat.st_ino)
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            raise SnapshotFormatError(f"{path} is too short to be a joke snapshot")
+        magic, count, self.built_at = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise SnapshotFormatError(f"{path} is not a joke snapshot")
+        self.count: int = count
+        view = memoryview(self._map)
+        start = _HEADER.size
+        middle = start + (count + 1) * _OFFSET
+        self._id_offsets = view[start:middle].cast("Q")
+        self._content_offsets = view[middle : middle + (count + 1) * _OFFSET].cast("Q")
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def bytes(self) -> int:
+        return len(self._map)
+
+    def id(self, position: int) -> str:
+        offsets = self._id_offsets
+        return self._map[offsets[position] : offsets[position + 1]].decode("utf-8")
+
+    def content(self, position: int) -> str:
+        offsets = self._content_offsets
+        return self._map[offsets[position] : offsets[position + 1]].decode("utf-8")
+
+    def raw(self, position: int) -> Tuple[bytes, bytes]:
+        """
+        Returns the encoded ID and content of an entry, for copying it into another snapshot.
+        """
+        ids, contents = self._id_offsets, self._content_offsets
+        return (
+            self._map[ids[position] : ids[position + 1]],
+            self._map[contents[position] : contents[position + 1]],
+        )
+
+    def find(self, joke_id: str) -> Optional[int]:
+        """
+        Returns the position of a joke, by binary search over the sorted IDs.
+        """
+        key = joke_id.encode("utf-8")
+        offsets = self._id_offsets
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._map[offsets[middle] : offsets[middle + 1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._map[offsets[low] : offsets[low + 1]] == key:
+            return low
+        return None
+
+    def get(self, joke_id: str) -> Optional[str]:
+        position = self.find(joke_id)
+        return None if position is None else self.content(position)
+
+
+class SnapshotWriter:
+    """
+    Collects jokes in ascending ID order and writes them out as a snapshot.
+    """
+
+    def __init__(self) -> None:
+        self._ids = bytearray()
+        self._contents = bytearray()
+        self._id_ends = array("Q")
+        self._content_ends = array("Q")
+        self._last_id = b""
+
+    def __len__(self) -> int:
+        return len(self._id_ends)
+
+    def append(self, joke_id: str, content: str) -> None:
+        self.append_encoded(joke_id.encode("utf-8"), content.encode("utf-8"))
+
+    def append_encoded(self, joke_id: bytes, content: bytes) -> None:
+        if self._id_ends and joke_id <= self._last_id:
+            raise ValueError("Snapshot entries must be appended in ascending ID order")
+        self._last_id = joke_id
+        self._ids += joke_id
+        self._contents += content
+        self._id_ends.append(len(self._ids))
+        self._content_ends.append(len(self._contents))
+
+    def write(self, path: str) -> None:
+        """
+        Writes the snapshot to a temporary file next to ``path`` and renames it into place, so
+        readers only ever see a complete snapshot.
+        """
+        count = len(self._id_ends)
+        ids_start = _HEADER.size + 2 * (count + 1) * _OFFSET
+        contents_start = ids_start + len(self._ids)
+        id_offsets = array("Q", [ids_start])
+        id_offsets.extend(ids_start + end for end in self._id_ends)
+        content_offsets = array("Q", [contents_start])
+        content_offsets.extend(contents_start + end for end in self._content_ends)
+        directory, name = os.path.split(os.path.abspath(path))
+        descriptor, temporary = tempfile.mkstemp(prefix=f".{name}.", dir=directory)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(_HEADER.pack(MAGIC, count, time.time()))
+                file.write(id_offsets.tobytes())
+                file.write(content_offsets.tobytes())
+                file.write(self._ids)
+                file.write(self._contents)
+                file.flush()
+                os.fsync(file.fileno())
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+class SnapshotLock:
+    """
+    Exclusive lock held by the process writing the snapshot at ``path``, so rewrites from several
+    workers are applied one after the other instead of overwriting each other.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = f"{path}.lock"
+        self._file: Optional[Any] = None
+
+    def acquire(self) -> None:
+        file = open(self.path, "a+b")
+        try:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            file.close()
+            raise
+        self._file = file
+
+    def release(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "SnapshotLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
+
+
+def open_snapshot(path: str) -> Optional[JokeSnapshot]:
+    """
+    Maps the snapshot at ``path``, or returns None when there is none yet.
+    """
+    try:
+        return JokeSnapshot(path)
+    except FileNotFoundError:
+        return None
+
+
+def write_snapshot(path: str, jokes: List[Tuple[str, str]]) -> JokeSnapshot:
+    """
+    Writes ``(id, content)`` pairs, in any order, as the snapshot at ``path`` and maps it.
+    """
+    writer = SnapshotWriter()
+    encoded = sorted(
+        (joke_id.encode("utf-8"), content.encode("utf-8")) for joke_id, content in jokes
+    )
+    for joke_id, content in encoded:
+        writer.append_encoded(joke_id, content)
+    writer.write(path)
+    return JokeSnapshot(path)
+
+
+def rewrite_snapshot(path: str, changes: Changes) -> JokeSnapshot:
+    """
+    Applies ``changes`` to the current snapshot at ``path``, whichever process wrote it, and
+    replaces it with the result. Unchanged entries are copied without being decoded. The caller
+    holds the ``SnapshotLock``.
+    """
+    base = open_snapshot(path)
+    updates = sorted(
+        (joke_id.encode("utf-8"), None if content is None else content.encode("utf-8"))
+        for joke_id, content in changes.items()
+    )
+    writer = SnapshotWriter()
+    next_update = 0
+    for position in range(len(base) if base is not None else 0):
+        joke_id, content = base.raw(position)  # type: ignore[union-attr]
+        while next_update < len(updates) and updates[next_update][0] < joke_id:
+            _append_update(writer, *updates[next_update])
+            next_update += 1
+        if next_update < len(updates) and updates[next_update][0] == joke_id:
+            _append_update(writer, *updates[next_update])
+            next_update += 1
+        else:
+            writer.append_encoded(joke_id, content)
+    for update in updates[next_update:]:
+        _append_update(writer, *update)
+    writer.write(path)
+    return JokeSnapshot(path)
+
+
+def _append_update(writer: SnapshotWriter, joke_id: bytes, content: Optional[bytes]) -> None:
+    if content is not None:
+        writer.append_encoded(joke_id, content)
+
+
+class SharedJokeCorpus:
+    """
+    The joke corpus as read from the snapshot, together with the changes this process has made
+    since. Those are kept in a small overlay that answers reads at once, and ``rewrite_delay``
+    seconds later the changed jokes are read back from the database and written into a new
+    snapshot. Snapshots written by other processes are picked up at most ``check_interval``
+    seconds after they appear.
+
+    Until then, this process may keep serving its own edit of a joke that another process has
+    edited since; the rewrite replaces it with the database row.
+
+    Positions run over the snapshot entries first and the jokes this process added after them.
+    Entries the overlay removed keep their position and are skipped when drawn.
+    """
+
+    def __init__(
+        self,
+        path: str = JOKE_SNAPSHOT_PATH,
+        rewrite_delay: float = JOKE_SNAPSHOT_REWRITE_DELAY_SECONDS,
+        check_interval: float = JOKE_SNAPSHOT_CHECK_INTERVAL_SECONDS,
+        max_age: float = JOKE_SNAPSHOT_MAX_AGE_SECONDS,
+        retry_delay: float = JOKE_SNAPSHOT_RETRY_SECONDS,
+    ) -> None:
+        self.path = path
+        self.rewrite_delay = rewrite_delay
+        self.retry_delay = retry_delay
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.snapshot: Optional[JokeSnapshot] = None
+        self._changes: Changes = {}
+        self._fetch_rows: Optional[RowFetcher] = None
+        self._added: List[str] = []
+        self._added_positions: Dict[str, int] = {}
+        self._removed = 0
+        self._checked_at = 0.0
+        self._pending_rewrite: Optional[asyncio.TimerHandle] = None
+        self._rewrite_task: Optional[asyncio.Future] = None
+        self._rewrite_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        if self.snapshot is None:
+            return 0
+        return len(self.snapshot) + len(self._added) - self._removed
+
+    @property
+    def pending(self) -> int:
+        return len(self._changes)
+
+    async def open(
+        self, fetch: Callable[[], Awaitable[List[Tuple[str, str]]]], fetch_rows: RowFetcher
+    ) -> None:
+        """
+        Maps the current snapshot. When there is none, or it is older than ``max_age``, the first
+        process to get here builds it from ``fetch`` while the others wait and then map its result.
+        Rewrites read the jokes they write with ``fetch_rows``.
+        """
+        self._fetch_rows = fetch_rows
+        loop = asyncio.get_running_loop()
+        snapshot = self._open_fresh()
+        if snapshot is None:
+            lock = SnapshotLock(self.path)
+            await loop.run_in_executor(None, lock.acquire)
+            try:
+                snapshot = self._open_fresh()
+                if snapshot is None:
+                    jokes = await fetch()
+                    snapshot = await loop.run_in_executor(None, write_snapshot, self.path, jokes)
+                    logger.info("Wrote joke snapshot of %d jokes to %s", len(snapshot), self.path)
+            finally:
+                lock.release()
+        self._swap(snapshot)
+        self._checked_at = time.monotonic()
+        logger.info(
+            "Mapped joke snapshot of %d jokes, %d MiB, from %s",
+            len(snapshot),
+            snapshot.bytes // (1024 * 1024),
+            self.path,
+        )
+
+    def _open_fresh(self) -> Optional[JokeSnapshot]:
+        try:
+            snapshot = open_snapshot(self.path)
+        except SnapshotFormatError:
+            logger.warning("Ignoring unreadable joke snapshot at %s", self.path)
+            return None
+        if snapshot is not None and self.max_age and time.time() - snapshot.built_at > self.max_age:
+            return None
+        return snapshot
+
+    def random(self) -> Optional[Tuple[str, str]]:
+        snapshot = self._current()
+        if not len(self):
+            return None
+        while True:
+            entry = self._entry(snapshot, random.randrange(len(snapshot) + len(self._added)))
+            if entry is not None:
+                return entry
+
+    def sample(self, k: int) -> List[Tuple[str, str]]:
+        snapshot = self._current()
+        total = len(snapshot) + len(self._added)
+        # Drawing as many extra positions as there are removed entries always leaves k live ones.
+        positions = random.sample(range(total), min(k + self._removed, total))
+        entries: List[Tuple[str, str]] = []
+        for position in positions:
+            entry = self._entry(snapshot, position)
+            if entry is not None:
+                entries.append(entry)
+                if len(entries) == k:
+                    break
+        return entries
+
+    def get(self, joke_id: str) -> Optional[str]:
+        snapshot = self._current()
+        if joke_id in self._changes:
+            return self._changes[joke_id]
+        return snapshot.get(joke_id)
+
+    def ids(self) -> List[str]:
+        snapshot = self._current()
+        ids = [
+            joke_id
+            for joke_id in map(snapshot.id, range(len(snapshot)))
+            if self._changes.get(joke_id, joke_id) is not None
+        ]
+        return ids + self._added
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        snapshot = self._current()
+        for position in range(len(snapshot) + len(self._added)):
+            entry = self._entry(snapshot, position)
+            if entry is not None:
+                yield entry
+
+    def chunks(self, size: int) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Yields the ``(id, content)`` pairs in lists of up to ``size``, with their contents as they
+        are when each list is made. Unlike ``items``, the corpus may change between lists: a joke
+        changed after its list was made is not seen again, and jokes that only appear in a snapshot
+        written meanwhile are not seen at all.
+        """
+        snapshot = self._current()
+        chunk: List[Tuple[str, str]] = []
+        for position in range(len(snapshot)):
+            joke_id = snapshot.id(position)
+            if joke_id in self._changes:
+                content = self._changes[joke_id]
+            elif self.snapshot is snapshot:
+                content = snapshot.content(position)
+            else:
+                # A rewrite has dropped the changes it wrote from the overlay since iteration began.
+                content = self.snapshot.get(joke_id)  # type: ignore[union-attr]
+            if content is not None:
+                chunk.append((joke_id, content))
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        yield chunk + [
+            (joke_id, content)
+            for joke_id, content in self._changes.items()
+            if content is not None and snapshot.find(joke_id) is None
+        ]
+
+    def store(self, joke_id: str, content: str) -> None:
+        self._change(joke_id, content)
+
+    def discard(self, joke_id: str) -> None:
+        self._change(joke_id, None)
+
+    def _entry(self, snapshot: JokeSnapshot, position: int) -> Optional[Tuple[str, str]]:
+        if position >= len(snapshot):
+            joke_id = self._added[position - len(snapshot)]
+            return joke_id, self._changes[joke_id]  # type: ignore[return-value]
+        joke_id = snapshot.id(position)
+        if joke_id not in self._changes:
+            return joke_id, snapshot.content(position)
+        content = self._changes[joke_id]
+        return None if content is None else (joke_id, content)
+
+    def _current(self) -> JokeSnapshot:
+        """
+        Returns the mapped snapshot, first switching to a newer one if another process wrote it.
+        """
+        assert self.snapshot is not None, "The joke snapshot is not open"
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return self.snapshot
+            if (stat.st_dev, stat.st_ino) != self.snapshot.identity:
+                try:
+                    self._swap(JokeSnapshot(self.path))
+                except (OSError, SnapshotFormatError):
+                    logger.exception("Could not map the joke snapshot at %s", self.path)
+        return self.snapshot
+
+    def _swap(self, snapshot: JokeSnapshot) -> None:
+        """
+        Switches to ``snapshot`` and drops the changes it already contains. The old mapping is
+        unmapped once nothing refers to it any more.
+        """
+        self.snapshot = snapshot
+        for joke_id, content in list(self._changes.items()):
+            if snapshot.get(joke_id) == content:
+                del self._changes[joke_id]
+        self._added = []
+        self._added_positions = {}
+        self._removed = 0
+        for joke_id, content in self._changes.items():
+            self._track(joke_id, content, snapshot.find(joke_id) is not None)
+
+    def _change(self, joke_id: str, content: Optional[str]) -> None:
+        snapshot = self._current()
+        in_snapshot = snapshot.find(joke_id) is not None
+        if joke_id in self._changes:
+            self._untrack(joke_id, self._changes[joke_id], in_snapshot)
+        self._changes[joke_id] = content
+        self._track(joke_id, content, in_snapshot)
+        self._schedule_rewrite()
+
+    def _track(self, joke_id: str, content: Optional[str], in_snapshot: bool) -> None:
+        if content is None:
+            if in_snapshot:
+                self._removed += 1
+        elif not in_snapshot:
+            self._added_positions[joke_id] = len(self._added)
+            self._added.append(joke_id)
+
+    def _untrack(self, joke_id: str, content: Optional[str], in_snapshot: bool) -> None:
+        if content is None:
+            if in_snapshot:
+                self._removed -= 1
+            return
+        position = self._added_positions.pop(joke_id, None)
+        if position is None:
+            return
+        last_id = self._added.pop()
+        if position < len(self._added):
+            self._added[position] = last_id
+            self._added_positions[last_id] = position
+
+    def _schedule_rewrite(self, delay: Optional[float] = None) -> None:
+        if self._pending_rewrite is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._pending_rewrite = loop.call_later(
+            self.rewrite_delay if delay is None else delay, self._start_rewrite
+        )
+
+    def _start_rewrite(self) -> None:
+        self._rewrite_task = asyncio.ensure_future(self.rewrite())
+
+    async def rewrite(self) -> None:
+        """
+        Writes the jokes with pending changes into a new snapshot, as the database has them now.
+        On failure the changes stay in the overlay and the rewrite is tried again ``retry_delay``
+        seconds later.
+        """
+        self._pending_rewrite = None
+        async with self._rewrite_lock:
+            if not self._changes or self._fetch_rows is None:
+                return
+            changes = dict(self._changes)
+            loop = asyncio.get_running_loop()
+            lock = SnapshotLock(self.path)
+            try:
+                await loop.run_in_executor(None, lock.acquire)
+                try:
+                    # Read under the lock, so that no rewrite which read these rows earlier can
+                    # land after this one and put back older contents.
+                    rows = await self._fetch_rows(list(changes))
+                    snapshot = await loop.run_in_executor(
+                        None, rewrite_snapshot, self.path, {i: rows.get(i) for i in changes}
+                    )
+                finally:
+                    lock.release()
+            except Exception:
+                logger.exception(
+                    "Failed to rewrite the joke snapshot at %s; retrying in %gs",
+                    self.path,
+                    self.retry_delay,
+                )
+                self._schedule_rewrite(self.retry_delay)
+                return
+            # The snapshot now has the database rows, which win over what this process wrote.
+            for joke_id, content in changes.items():
+                if joke_id in self._changes and self._changes[joke_id] == content:
+                    del self._changes[joke_id]
+            self._swap(snapshot)
+            logger.info(
+                "Rewrote joke snapshot with %d changes, %d jokes", len(changes), len(snapshot)
+            )
+
+    async def close(self) -> None:
+        """
+        Writes any pending changes before the process exits, once; there is no retry after this.
+        """
+        if self._pending_rewrite is not None:
+            self._pending_rewrite.cancel()
+            self._pending_rewrite = None
+        await self.rewrite()
+        if self._pending_rewrite is not None:
+            self._pending_rewrite.cancel()
+            self._pending_rewrite = None
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    # Imported here because the joke index itself depends on this module.
+    from project.joke_index import JokeIndex
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=0,
+        help="rebuild every this many seconds instead of once",
+    )
+    args = parser.parse_args(argv)
+    db = prisma.Prisma(auto_register=True)
+    await db.connect()
+    try:
+        while True:
+            # Held while reading too, so no worker's rewrite lands between the read and the write.
+            with SnapshotLock(JOKE_SNAPSHOT_PATH):
+                jokes = JokeIndex("memory")
+                await jokes.load()
+                snapshot = write_snapshot(JOKE_SNAPSHOT_PATH, list(jokes.items()))
+            print(
+                f"Wrote {len(snapshot)} jokes to {JOKE_SNAPSHOT_PATH}",
+                file=sys.stderr,
+            )
+            if not args.interval:
+                return
+            await asyncio.sleep(args.interval)
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
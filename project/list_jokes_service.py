@@ -0,0 +1,135 @@
+import base64
+import binascii
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import prisma
+import prisma.models
+from project.db import query
+from project.metrics import time_serialization
+from pydantic import BaseModel
+
+# Upper bound for limit on GET /jokes
+JOKES_PAGE_MAX_LIMIT = int(os.getenv("JOKES_PAGE_MAX_LIMIT", "100"))
+# Rows fetched per query while streaming the catalogue as NDJSON
+JOKES_EXPORT_CHUNK_SIZE = int(os.getenv("JOKES_EXPORT_CHUNK_SIZE", "1000"))
+
+# Matches @@index([createdAt, id]) on Joke, so every page is an index range scan.
+_ORDER = [{"createdAt": "asc"}, {"id": "asc"}]
+
+# The (createdAt, id) of the last joke a client has seen.
+Position = Tuple[datetime, str]
+
+
+class ListedJoke(BaseModel):
+    """
+    A joke in the catalogue listing. ``updatedAt`` is its version, to send quoted in If-Match when
+    updating or deleting it.
+    """
+
+    id: str
+    content: str
+    createdAt: datetime
+    updatedAt: datetime
+
+
+class ListJokesResponse(BaseModel):
+    """
+    Response model for one page of the joke catalogue, oldest first.
+    """
+
+    jokes: List[ListedJoke]
+    nextCursor: Optional[str] = None
+
+
+def encode_cursor(created_at: datetime, joke_id: str) -> str:
+    """
+    Returns an opaque cursor pointing just past the given joke.
+    """
+    position = f"{created_at.isoformat()}|{joke_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(position).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Position:
+    try:
+        position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, joke_id = position.split("|", 1)
+        return datetime.fromisoformat(created_at), joke_id
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+
+async def _page(after: Optional[Position], take: int) -> List[prisma.models.Joke]:
+    where: Dict[str, Any] = {}
+    if after is not None:
+        created_at, joke_id = after
+        # (createdAt, id) > (created_at, joke_id), written so that the createdAt bound alone
+        # already narrows the index scan.
+        where = {
+            "createdAt": {"gte": created_at},
+            "OR": [{"createdAt": {"gt": created_at}}, {"id": {"gt": joke_id}}],
+        }
+    return await query(
+        "Joke.find_many",
+        prisma.models.Joke.prisma().find_many(where=where, order=_ORDER, take=take),
+    )
+
+
+async def list_jokes(cursor: Optional[str], limit: int) -> ListJokesResponse:
+    """
+    Returns one page of the joke catalogue ordered by creation time.
+
+    Pagination is by keyset rather than offset: the cursor holds the (createdAt, id) of the last
+    joke returned, and the next page starts right after it, so a deep page costs the same as the
+    first one and concurrent inserts never shift or repeat rows.
+
+    Args:
+        cursor (Optional[str]): The nextCursor of the previous page, or None for the first page.
+        limit (int): The maximum number of jokes to return.
+
+    Returns:
+        ListJokesResponse: Response model for one page of the joke catalogue.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    jokes = await _page(after, limit + 1)
+    next_cursor = None
+    if len(jokes) > limit:
+        jokes = jokes[:limit]
+        next_cursor = encode_cursor(jokes[-1].createdAt, jokes[-1].id)
+    with time_serialization("ListJokesResponse"):
+        return ListJokesResponse(
+            jokes=[
+                ListedJoke(
+                    id=joke.id,
+                    content=joke.content,
+                    createdAt=joke.createdAt,
+                    updatedAt=joke.updatedAt,
+                )
+                for joke in jokes
+            ],
+            nextCursor=next_cursor,
+        )
+
+
+def iter_jokes(cursor: Optional[str] = None) -> AsyncIterator[ListedJoke]:
+    """
+    Iterates over the whole catalogue, or the part after ``cursor``, fetching
+    JOKES_EXPORT_CHUNK_SIZE rows at a time so memory use does not grow with the table.
+
+    The cursor is decoded before iteration starts, so an invalid one raises ValueError here.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    return _iter_jokes(after)
+
+
+async def _iter_jokes(after: Optional[Position]) -> AsyncIterator[ListedJoke]:
+    while True:
+        jokes = await _page(after, JOKES_EXPORT_CHUNK_SIZE)
+        for joke in jokes:
+            yield ListedJoke(
+                id=joke.id, content=joke.content, createdAt=joke.createdAt, updatedAt=joke.updatedAt
+            )
+        if len(jokes) < JOKES_EXPORT_CHUNK_SIZE:
+            return
+        after = (jokes[-1].createdAt, jokes[-1].id)
@@ -0,0 +1,176 @@
+import logging
+import os
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import prisma
+import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.joke_index import JokeIndex, joke_index
+from project.metrics import gauge
+
+logger = logging.getLogger(__name__)
+
+LOCALIZATION_LOAD_BATCH_SIZE = int(os.getenv("LOCALIZATION_LOAD_BATCH_SIZE", "10000"))
+
+
+def normalize_language(tag: str) -> str:
+    """
+    Normalizes a language tag for lookups: "pt_BR" and "PT-br" both become "pt-br".
+    """
+    return tag.strip().replace("_", "-").lower()
+
+
+def localized_text(content: Any) -> Optional[str]:
+    """
+    Extracts the translated joke from a ``Localization.content`` JSON value, which is either a
+    string or an object with a "content" string. Returns None for anything else.
+    """
+    if isinstance(content, dict):
+        content = content.get("content")
+    return content if isinstance(content, str) else None
+
+
+@lru_cache(maxsize=1024)
+def parse_accept_language(header: str) -> Tuple[str, ...]:
+    """
+    Returns the language tags of an Accept-Language header, most preferred first, dropping "*" and
+    anything with q=0. Cached, since clients send the same handful of headers over and over.
+    """
+    weighted: List[Tuple[float, int, str]] = []
+    for position, part in enumerate(header.split(",")):
+        tag, *params = part.split(";")
+        tag = normalize_language(tag)
+        if not tag or tag == "*":
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            weighted.append((-quality, position, tag))
+    return tuple(tag for _, _, tag in sorted(weighted))
+
+
+class LocalizationIndex:
+    """
+    In-process index of joke translations, keyed by language and then by joke ID.
+
+    It is filled from the Localization table at startup and then kept current by the admin
+    localization writes and by joke removals, so serving a localized joke is one extra dictionary
+    lookup after the random pick, without touching the database. Like the joke index, it stays
+    empty when JOKE_INDEX_MODE is "db".
+    """
+
+    def __init__(self, jokes: JokeIndex) -> None:
+        self.jokes = jokes
+        self.loaded = False
+        self._by_language: Dict[str, Dict[str, str]] = {}
+        jokes.subscribe(self._on_joke_changed)
+
+    def __len__(self) -> int:
+        return sum(len(translations) for translations in self._by_language.values())
+
+    @property
+    def languages(self) -> Iterable[str]:
+        return self._by_language.keys()
+
+    async def load(self) -> None:
+        """
+        Loads every localization into memory, paging through the table by ID.
+        """
+        if not self.jokes.in_memory:
+            return
+        by_language: Dict[str, Dict[str, str]] = {}
+        last_id: Optional[str] = None
+        while True:
+            page: Dict[str, Any] = {"take": LOCALIZATION_LOAD_BATCH_SIZE, "order": {"id": "asc"}}
+            if last_id is not None:
+                page.update(skip=1, cursor={"id": last_id})
+            batch = await query(
+                "Localization.find_many",
+                prisma.models.Localization.prisma().find_many(**page),
+                timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+            )
+            for localization in batch:
+                text = localized_text(localization.content)
+                if text is not None:
+                    by_language.setdefault(normalize_language(localization.language), {})[
+                        localization.jokeId
+                    ] = text
+            if len(batch) < LOCALIZATION_LOAD_BATCH_SIZE:
+                break
+            last_id = batch[-1].id
+        self._by_language = by_language
+        self.loaded = True
+        logger.info(
+            "Loaded %d localizations in %d languages", len(self), len(by_language)
+        )
+
+    def get(self, joke_id: str, language: str) -> Optional[str]:
+        translations = self._by_language.get(language)
+        if translations is None:
+            return None
+        return translations.get(joke_id)
+
+    def translated(self, language: str) -> List[str]:
+        """
+        Returns the IDs of the jokes translated into ``language``.
+        """
+        return list(self._by_language.get(language, ()))
+
+    def negotiate(self, lang: Optional[str], accept_language: Optional[str]) -> Optional[str]:
+        """
+        Picks the language to serve: an explicit ``lang`` wins, otherwise the most preferred
+        Accept-Language entry that has translations, trying "de-ch" before falling back to "de".
+        Returns None when nothing matches, meaning the base joke content.
+
+        Without a loaded index the available languages are unknown, so the client's first choice is
+        used as is.
+        """
+        if lang:
+            return normalize_language(lang)
+        if not accept_language:
+            return None
+        tags = parse_accept_language(accept_language)
+        if not self.loaded:
+            return tags[0] if tags else None
+        for tag in tags:
+            if tag in self._by_language:
+                return tag
+            primary = tag.split("-", 1)[0]
+            if primary in self._by_language:
+                return primary
+        return None
+
+    def set(self, joke_id: str, language: str, content: str) -> None:
+        if self.loaded:
+            self._by_language.setdefault(language, {})[joke_id] = content
+
+    def remove(self, joke_id: str, language: str) -> None:
+        translations = self._by_language.get(language)
+        if translations is None:
+            return
+        translations.pop(joke_id, None)
+        if not translations:
+            del self._by_language[language]
+
+    def _on_joke_changed(self, event: str, joke_id: str, content: Optional[str]) -> None:
+        # Translations go with their joke, as the cascading foreign key does in the database.
+        if event != "remove":
+            return
+        for language in list(self._by_language):
+            self.remove(joke_id, language)
+
+
+localization_index = LocalizationIndex(joke_index)
+
+gauge(
+    "localization_index_size",
+    "Joke translations held in the resident localization index.",
+    function=lambda: len(localization_index),
+)
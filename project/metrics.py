@@ -0,0 +1,345 @@
+import hmac
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from starlette.routing import Match
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Bearer token GET /metrics requires. Empty, the default, leaves the endpoint open to anyone who
+# can reach the port, so either set it or block /metrics in front of the app.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Request methods recorded as they are; any other method a client sends is labelled "other", so
+# that it cannot create label sets of its own.
+HTTP_METHODS = frozenset(
+    ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT")
+)
+
+# Metrics are only updated from the event loop thread, so plain dict and list increments are safe
+# without locks; there is nothing shared between processes or contended between threads.
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterator[str]:
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. With ``function`` set, the value is read from it at scrape time.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], float]] = None,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.function = function
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def value(self, *label_values: str) -> float:
+        if self.function is not None:
+            return self.function()
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> Iterator[str]:
+        if self.function is not None:
+            yield f"{self.name} {_format_value(self.function())}"
+            return
+        for label_values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """
+    Fixed-bucket histogram. An observation increments exactly one bucket, found by bisection;
+    cumulative bucket counts are only computed when the metrics are scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def samples(self) -> Iterator[str]:
+        for label_values, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(
+                    self.labels, label_values, f'le="{_format_value(bound)}"'
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Renders every registered metric in the Prometheus text exposition format, version 0.0.4.
+        """
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labels))
+
+
+def gauge(
+    name: str,
+    help: str,
+    labels: Sequence[str] = (),
+    function: Optional[Callable[[], float]] = None,
+) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labels, function))
+
+
+def histogram(
+    name: str,
+    help: str,
+    labels: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labels, buckets))
+
+
+HTTP_REQUESTS = counter(
+    "http_requests_total",
+    "HTTP requests by method, route template and status code.",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "Time from receiving an HTTP request to sending the last byte of its response.",
+    ("method", "route"),
+)
+HTTP_REQUESTS_IN_FLIGHT = gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled.",
+    ("method", "route"),
+)
+DB_QUERY_SECONDS = histogram(
+    "db_query_duration_seconds",
+    'Time spent waiting on Prisma queries, by operation, such as "Joke.find_many".',
+    ("operation",),
+)
+DB_QUERY_ERRORS = counter(
+    "db_query_errors_total",
+    'Prisma queries that raised, by operation, such as "Joke.find_many".',
+    ("operation",),
+)
+SERIALIZATION_SECONDS = histogram(
+    "response_serialization_duration_seconds",
+    "Time spent constructing pydantic response models, by model.",
+    ("model",),
+)
+
+
+def time_serialization(model: str):
+    """
+    Context manager that records how long building a response model takes.
+    """
+    return SERIALIZATION_SECONDS.time(model)
+
+
+class RouteTemplates:
+    """
+    Maps requests to the template of the route they match, such as ``/jokes/{jokeId}``.
+
+    Templates are remembered per method and path, so the routes are only matched once for each; the
+    memo is cleared when it grows past ``_MAX_TEMPLATES``.
+    """
+
+    _MAX_TEMPLATES = 4096
+
+    def __init__(self, routes_app) -> None:
+        self.routes_app = routes_app
+        self._templates: Dict[Tuple[str, str], str] = {}
+
+    def get(self, scope) -> str:
+        key = (scope["method"], scope["path"])
+        template = self._templates.get(key)
+        if template is None:
+            if len(self._templates) >= self._MAX_TEMPLATES:
+                self._templates.clear()
+            template = self._templates[key] = self._match(scope)
+        return template
+
+    def _match(self, scope) -> str:
+        partial = None
+        for route in self.routes_app.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+            if match == Match.PARTIAL and partial is None:
+                partial = route.path
+        return partial or "unmatched"
+
+
+def metrics_authorized(authorization: Optional[str]) -> bool:
+    """
+    Returns whether an Authorization header may read the metrics: always when METRICS_TOKEN is
+    not set, and otherwise only with that token as a bearer token.
+    """
+    if not METRICS_TOKEN:
+        return True
+    expected = f"Bearer {METRICS_TOKEN}".encode("utf-8")
+    return hmac.compare_digest((authorization or "").encode("utf-8"), expected)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route request counts, latency and in-flight requests.
+
+    Requests are labelled with the route template rather than the raw path, so that path parameters
+    do not create unbounded label sets.
+    """
+
+    def __init__(self, app, routes_app) -> None:
+        self.app = app
+        self.templates = RouteTemplates(routes_app)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"] if scope["method"] in HTTP_METHODS else "other"
+        route = self.templates.get(scope)
+        status = "500"
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method, route)
+            HTTP_REQUESTS.inc(method, route, status)
+            HTTP_REQUESTS_IN_FLIGHT.dec(method, route)
@@ -0,0 +1,157 @@
+"""
+Offline duplicate report over the Joke table.
+
+    python -m project.near_duplicates [--max-distance 3] [--backfill]
+
+Prints one JSON object per line for every pair of jokes whose content is identical once normalized
+(distance 0) or whose 64-bit SimHash fingerprints differ in at most ``--max-distance`` bits, which
+catches reworded copies that the exact content hash misses. Nothing is changed unless
+``--backfill`` is given, in which case jokes without a ``contentHash`` get one, except where that
+would collide with a joke that already holds the hash; those are left for an admin to resolve.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+import prisma
+import prisma.errors
+import prisma.models
+from project.joke_dedupe import content_hash, normalize_content
+
+SIMHASH_BITS = 64
+# Fingerprints within three bits of each other agree exactly on at least one of four 16-bit
+# bands, so only jokes sharing a band are compared.
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+PAGE_SIZE = 10000
+
+
+def _features(content: str) -> Iterator[str]:
+    words = normalize_content(content).split()
+    yield from words
+    for first, second in zip(words, words[1:]):
+        yield f"{first} {second}"
+
+
+def simhash(content: str) -> int:
+    """
+    Returns the 64-bit SimHash of a joke's normalized words and word pairs. Similar texts get
+    fingerprints that differ in few bits.
+    """
+    weights = [0] * SIMHASH_BITS
+    for feature in _features(content):
+        value = int.from_bytes(
+            hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def _bands(fingerprint: int) -> Iterator[Tuple[int, int]]:
+    mask = (1 << BAND_BITS) - 1
+    for band in range(BANDS):
+        yield band, fingerprint >> (band * BAND_BITS) & mask
+
+
+async def _jokes() -> AsyncIterator[Any]:
+    last_id: Optional[str] = None
+    while True:
+        page: Dict[str, Any] = {"take": PAGE_SIZE, "order": {"id": "asc"}}
+        if last_id is not None:
+            page.update(skip=1, cursor={"id": last_id})
+        batch = await prisma.models.Joke.prisma().find_many(**page)
+        for joke in batch:
+            yield joke
+        if len(batch) < PAGE_SIZE:
+            return
+        last_id = batch[-1].id
+
+
+async def report(max_distance: int, backfill: bool) -> int:
+    """
+    Writes the duplicate pairs to stdout and returns how many were found.
+    """
+    if max_distance >= BANDS:
+        raise ValueError(f"--max-distance must be below {BANDS} for the band lookup to be exact")
+    owners: Dict[str, str] = {}
+    # Jokes whose contentHash is missing or stale, and hashes some joke already holds.
+    unhashed: Dict[str, str] = {}
+    held: Set[str] = set()
+    fingerprints: Dict[str, int] = {}
+    buckets: Dict[Tuple[int, int], List[str]] = defaultdict(list)
+    pairs = 0
+
+    def emit(first: str, second: str, distance: int) -> None:
+        nonlocal pairs
+        pairs += 1
+        print(json.dumps({"jokeId": first, "duplicateOf": second, "distance": distance}))
+
+    async for joke in _jokes():
+        hashed = content_hash(joke.content)
+        if joke.contentHash == hashed:
+            held.add(hashed)
+        else:
+            unhashed[joke.id] = hashed
+        owner = owners.setdefault(hashed, joke.id)
+        if owner != joke.id:
+            emit(joke.id, owner, 0)
+            continue
+        fingerprint = simhash(joke.content)
+        fingerprints[joke.id] = fingerprint
+        candidates = set()
+        for band in _bands(fingerprint):
+            candidates.update(buckets[band])
+            buckets[band].append(joke.id)
+        for other in sorted(candidates):
+            distance = bin(fingerprint ^ fingerprints[other]).count("1")
+            if distance <= max_distance:
+                emit(joke.id, other, distance)
+
+    if backfill:
+        filled = 0
+        for joke_id, hashed in unhashed.items():
+            if hashed in held:
+                continue
+            try:
+                await prisma.models.Joke.prisma().update(
+                    where={"id": joke_id}, data={"contentHash": hashed}
+                )
+            except prisma.errors.UniqueViolationError:
+                # Written by the app since this joke was read; the pair was reported above.
+                continue
+            held.add(hashed)
+            filled += 1
+        print(f"Backfilled contentHash on {filled} jokes", file=sys.stderr)
+    return pairs
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--max-distance",
+        type=int,
+        default=3,
+        help="largest SimHash Hamming distance reported as a near duplicate (0-3)",
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="set contentHash on jokes that lack it, skipping duplicates",
+    )
+    args = parser.parse_args(argv)
+    db = prisma.Prisma(auto_register=True)
+    await db.connect()
+    try:
+        pairs = await report(args.max_distance, args.backfill)
+    finally:
+        await db.disconnect()
+    print(f"Found {pairs} duplicate pairs", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
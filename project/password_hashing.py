@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import bcrypt
+from project.metrics import counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+# "thread" or "process". bcrypt releases the GIL, so threads are usually enough.
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread").lower()
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "1"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+
+class PasswordHasherSaturatedError(Exception):
+    """
+    Raised when the password hashing pool already has as many calls queued as it accepts.
+    """
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Password hashing is saturated, please retry later")
+        self.retry_after = retry_after
+
+
+PASSWORD_HASH_SECONDS = histogram(
+    "password_hash_duration_seconds",
+    "Time from submitting a bcrypt call to the pool until it completes, including queueing.",
+    ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+PASSWORD_HASH_REJECTED = counter(
+    "password_hash_rejected_total",
+    "bcrypt calls shed because the pool already had the maximum number pending.",
+    ("operation",),
+)
+
+
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a bounded worker pool, off the event loop.
+
+    At most ``max_pending`` calls may be queued or running at once; further calls fail fast with
+    PasswordHasherSaturatedError instead of piling up behind a login burst.
+    """
+
+    def __init__(
+        self,
+        kind: str = PASSWORD_HASH_EXECUTOR,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        rounds: int = BCRYPT_ROUNDS,
+    ) -> None:
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    async def _run(self, operation: str, func: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            PASSWORD_HASH_REJECTED.inc(operation)
+            raise PasswordHasherSaturatedError(PASSWORD_HASH_RETRY_AFTER)
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), func, *args
+            )
+        finally:
+            self.pending -= 1
+            PASSWORD_HASH_SECONDS.observe(time.perf_counter() - start, operation)
+
+    async def hash(self, password: str) -> str:
+        """
+        Hashes a password with the configured bcrypt cost factor.
+        """
+        hashed = await self._run("hash", _hashpw, password.encode("utf-8"), self.rounds)
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """
+        Checks a password against a stored bcrypt hash.
+        """
+        return await self._run(
+            "verify", _checkpw, password.encode("utf-8"), hashed.encode("utf-8")
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+gauge(
+    "password_hash_pending",
+    "bcrypt calls queued or running on the password hashing pool.",
+    function=lambda: password_hasher.pending,
+)
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Generic, Optional, Set, Tuple, TypeVar
+
+from project.db import DatabaseUnavailableError
+from project.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "10000"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+# How long past its TTL an entry may still be served while it is refreshed in the background.
+PROFILE_CACHE_STALE_SECONDS = float(os.getenv("PROFILE_CACHE_STALE_SECONDS", "3600"))
+
+PROFILE_CACHE_LOOKUPS = counter(
+    "profile_cache_lookups_total",
+    "User profile cache lookups, by result: hit, stale, miss or expired.",
+    ("result",),
+)
+PROFILE_CACHE_EVICTIONS = counter(
+    "profile_cache_evictions_total",
+    "User profiles evicted from the cache to stay within its entry limit.",
+)
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    Bounded LRU cache whose entries also expire ``ttl`` seconds after they were stored.
+
+    ``get_or_load`` coalesces concurrent misses for the same key into a single load. ``invalidate``
+    drops the entry and detaches any load in flight for it, so that a value read before a write can
+    never be stored after that write's invalidation.
+
+    For ``stale`` seconds after expiring, ``get_or_load`` still returns an entry straight away and
+    reloads it in the background, stale-while-revalidate. The entry stays in place if that reload
+    fails, so a database outage is served from the last known values rather than with errors.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PROFILE_CACHE_MAX_ENTRIES,
+        ttl: float = PROFILE_CACHE_TTL_SECONDS,
+        stale: float = PROFILE_CACHE_STALE_SECONDS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale = stale
+        self._entries: "OrderedDict[str, Tuple[float, V]]" = OrderedDict()
+        self._loading: Dict[str, "asyncio.Future[V]"] = {}
+        self._revalidating: Set["asyncio.Task[None]"] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[V]:
+        value, fresh = self._lookup(key)
+        return value if fresh else None
+
+    def _lookup(self, key: str) -> Tuple[Optional[V], bool]:
+        """
+        Returns the entry for ``key`` and whether it is still fresh. Entries past their stale window
+        are dropped and reported as missing.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            PROFILE_CACHE_LOOKUPS.inc("miss")
+            return None, False
+        expires_at, value = entry
+        now = time.monotonic()
+        if now >= expires_at:
+            if now >= expires_at + self.stale:
+                del self._entries[key]
+                PROFILE_CACHE_LOOKUPS.inc("expired")
+                return None, False
+            PROFILE_CACHE_LOOKUPS.inc("stale")
+            return value, False
+        self._entries.move_to_end(key)
+        PROFILE_CACHE_LOOKUPS.inc("hit")
+        return value, True
+
+    def put(self, key: str, value: V) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            PROFILE_CACHE_EVICTIONS.inc()
+
+    def invalidate(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._loading.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._loading.clear()
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[Optional[V]]]) -> Optional[V]:
+        """
+        Returns the cached value, or awaits ``load`` once for all concurrent callers and caches its
+        result. A None result is returned but not cached. A stale value is returned as it is while
+        ``load`` runs in the background.
+        """
+        value, fresh = self._lookup(key)
+        if fresh:
+            return value
+        if value is not None:
+            if key not in self._loading:
+                task = asyncio.ensure_future(self._revalidate(key, load))
+                self._revalidating.add(task)
+                task.add_done_callback(self._revalidating.discard)
+            return value
+        while key in self._loading:
+            pending = self._loading[key]
+            try:
+                # Shielded so that a cancelled waiter does not cancel the load for everyone else.
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The caller that started the load was cancelled; start another one.
+        return await self._load(key, load)
+
+    async def _load(self, key: str, load: Callable[[], Awaitable[Optional[V]]]) -> Optional[V]:
+        pending = asyncio.get_running_loop().create_future()
+        self._loading[key] = pending
+        try:
+            value = await load()
+        except BaseException as e:
+            if self._loading.get(key) is pending:
+                del self._loading[key]
+            if isinstance(e, asyncio.CancelledError):
+                pending.cancel()
+            else:
+                pending.set_exception(e)
+                # Waiters re-raise the error; mark it retrieved so that it is not reported twice.
+                pending.exception()
+            raise
+        if self._loading.get(key) is pending:
+            del self._loading[key]
+            if value is not None:
+                self.put(key, value)
+            else:
+                self._entries.pop(key, None)
+        pending.set_result(value)
+        return value
+
+    async def _revalidate(self, key: str, load: Callable[[], Awaitable[Optional[V]]]) -> None:
+        try:
+            await self._load(key, load)
+        except DatabaseUnavailableError:
+            pass
+        except Exception:
+            logger.exception("Failed to refresh a stale cache entry")
+
+
+profile_cache: TTLCache = TTLCache()
+
+gauge(
+    "profile_cache_entries",
+    "User profiles held in the profile cache.",
+    function=lambda: len(profile_cache),
+)
@@ -0,0 +1,50 @@
+import os
+
+from project.joke_errors import JokeNotFoundError
+from project.joke_index import joke_index
+from project.metrics import time_serialization
+from project.rating_buffer import BufferedRating, rating_buffer
+from pydantic import BaseModel
+
+RATING_MIN_SCORE = int(os.getenv("RATING_MIN_SCORE", "1"))
+RATING_MAX_SCORE = int(os.getenv("RATING_MAX_SCORE", "5"))
+
+
+class RateJokeResponse(BaseModel):
+    """
+    Acknowledgment that a rating was accepted. The rating is written to the database shortly after.
+    """
+
+    success: bool
+    message: str
+    jokeId: str
+    score: int
+
+
+async def rate_joke(jokeId: str, userId: str, score: int) -> RateJokeResponse:
+    """
+    Accepts a rating for a joke and hands it to the write-behind rating buffer.
+
+    The rating is not written synchronously: the buffer coalesces ratings from many requests and
+    inserts them in batches. Ratings for unknown jokes are rejected up front when the joke index is
+    loaded; otherwise they are discarded when their batch is written.
+
+    Args:
+        jokeId (str): The unique identifier of the joke being rated.
+        userId (str): The ID of the logged-in user, as resolved from their session token.
+        score (int): The score given to the joke, between RATING_MIN_SCORE and RATING_MAX_SCORE.
+
+    Returns:
+        RateJokeResponse: Acknowledgment that a rating was accepted.
+    """
+    if not RATING_MIN_SCORE <= score <= RATING_MAX_SCORE:
+        raise ValueError(
+            f"Score must be between {RATING_MIN_SCORE} and {RATING_MAX_SCORE}"
+        )
+    if joke_index.loaded and joke_index.get(jokeId) is None:
+        raise JokeNotFoundError(jokeId)
+    await rating_buffer.submit(BufferedRating(jokeId=jokeId, userId=userId, score=score))
+    with time_serialization("RateJokeResponse"):
+        return RateJokeResponse(
+            success=True, message="Rating accepted.", jokeId=jokeId, score=score
+        )
@@ -0,0 +1,357 @@
+"""
+Token-bucket rate limiting for every route, per client.
+
+Each route has a policy of ``limit`` requests per ``window`` seconds: a client's bucket holds up to
+``limit`` tokens, refills at ``limit / window`` tokens per second, and every request takes one.
+Policies are read from RATE_LIMITS, a comma-separated list of ``METHOD /template=limit/window``
+entries plus ``*=limit/window`` for every other route; a limit of 0 leaves a route unlimited and an
+empty RATE_LIMITS, the default, turns rate limiting off. Clients are told where they stand with the
+``RateLimit-Limit``, ``RateLimit-Remaining``, ``RateLimit-Reset`` and ``RateLimit-Policy`` headers
+of the IETF httpapi draft, and refused requests get 429 with ``Retry-After``.
+
+Clients are identified by their session when they send a valid bearer token and by their address
+otherwise; behind a proxy, run uvicorn with ``--forwarded-allow-ips`` so that the address is the
+client's, as the Dockerfile does, or every anonymous client shares the proxy's bucket. A bucket that has refilled completely is the same as no bucket, so idle clients are
+simply dropped.
+
+With RATE_LIMIT_BACKEND "local" every worker process counts on its own, so a client gets the limit
+once per worker. "shared" keeps the buckets in a file at RATE_LIMIT_SHARED_PATH that all workers on
+the host map, so they enforce one limit together. Its file locks can block, so it is called from
+the default executor rather than on the event loop.
+"""
+import asyncio
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from project.metrics import RouteTemplates, counter, gauge
+from project.responses import dumps
+from project.sessions import InvalidSessionError, session_signer
+
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local").lower()
+RATE_LIMIT_SHARED_PATH = os.getenv(
+    "RATE_LIMIT_SHARED_PATH", os.path.join(tempfile.gettempdir(), "rate_limit.buckets")
+)
+# Buckets kept at most, per process with the local backend and per host with the shared one. The
+# least recently used are dropped beyond it, which hands their clients a full bucket.
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Buckets are spread over this many shards by key. Each local shard evicts on its own, and each
+# shared shard is a separately locked byte range of the file, so workers rarely wait on each other.
+RATE_LIMIT_SHARDS = 64
+
+RATE_LIMITED = counter(
+    "rate_limited_requests_total",
+    "Requests refused with 429 by the rate limiter, by policy.",
+    ("policy",),
+)
+RATE_LIMIT_EVICTIONS = counter(
+    "rate_limit_evictions_total",
+    "Rate limit buckets dropped before they had refilled, to stay within RATE_LIMIT_MAX_KEYS.",
+)
+
+
+class RateLimitPolicy(NamedTuple):
+    limit: int
+    window: float
+
+    @property
+    def rate(self) -> float:
+        return self.limit / self.window
+
+    def header(self) -> str:
+        return f"{self.limit};w={self.window:g}"
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: int
+    # Seconds until the bucket is full again, and until it holds a token when it is empty.
+    reset: float
+    retry_after: float
+
+
+def parse_policies(spec: str) -> Dict[str, Optional[RateLimitPolicy]]:
+    """
+    Parses RATE_LIMITS into policies by ``"METHOD /template"`` or ``"*"``; None is unlimited.
+    """
+    policies: Dict[str, Optional[RateLimitPolicy]] = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        route, separator, value = entry.rpartition("=")
+        if not separator:
+            raise ValueError(f"Invalid RATE_LIMITS entry '{entry}', expected route=limit/window")
+        limit, _, window = value.partition("/")
+        policy = RateLimitPolicy(int(limit), float(window or "1"))
+        if policy.limit < 0 or policy.window <= 0:
+            raise ValueError(f"Invalid RATE_LIMITS entry '{entry}'")
+        route = " ".join(route.split())
+        method, _, template = route.partition(" ")
+        policies[f"{method.upper()} {template}" if template else route] = (
+            policy if policy.limit > 0 else None
+        )
+    return policies
+
+
+def _take(full_at: float, now: float, policy: RateLimitPolicy) -> Tuple[float, Decision]:
+    """
+    Takes a token from the bucket that is full again at ``full_at`` and returns when it is full
+    after that. Storing that one time rather than tokens and a timestamp is all a bucket needs.
+    """
+    tokens = policy.limit - max(0.0, full_at - now) * policy.rate
+    # Tolerates the rounding of full_at, which would otherwise cost a burst its last token.
+    allowed = tokens >= 1 - 1e-9
+    if allowed:
+        tokens = max(0.0, tokens - 1)
+    reset = (policy.limit - tokens) / policy.rate
+    return now + reset, Decision(
+        allowed=allowed,
+        remaining=int(tokens + 1e-9),
+        reset=reset,
+        retry_after=0.0 if allowed else (1 - tokens) / policy.rate,
+    )
+
+
+class LocalBuckets:
+    """
+    The buckets of one process, in least recently used order per shard.
+    """
+
+    # Cheap enough to run on the event loop.
+    blocking = False
+
+    def __init__(
+        self, max_keys: int = RATE_LIMIT_MAX_KEYS, shards: int = RATE_LIMIT_SHARDS
+    ) -> None:
+        self._shards: List["OrderedDict[str, float]"] = [OrderedDict() for _ in range(shards)]
+        self._max_shard_keys = max(1, max_keys // shards)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def take(self, key: str, policy: RateLimitPolicy, now: float) -> Decision:
+        shard = self._shards[hash(key) % len(self._shards)]
+        # A bucket that has refilled is the same as none; dropping those keeps only active clients.
+        while shard and next(iter(shard.values())) <= now:
+            shard.popitem(last=False)
+        full_at = shard.pop(key, now)
+        shard[key], decision = _take(full_at, now, policy)
+        if len(shard) > self._max_shard_keys:
+            shard.popitem(last=False)
+            RATE_LIMIT_EVICTIONS.inc()
+        return decision
+
+
+class SharedBuckets:
+    """
+    Buckets in a file that every worker process on the host maps read-write.
+
+    The file is a header followed by a fixed table of slots, each a 64-bit key fingerprint (0 when
+    free) and the Unix time at which that key's bucket is full again:
+
+        magic   8 bytes, b"RATELIM1"
+        slots   uint64
+        slot    uint64 fingerprint, float64 full_at, repeated ``slots`` times
+
+    The table is split into shards of consecutive slots. A key lives in one shard, at its home slot
+    or one of the next ``_PROBES`` after it, and a shard is only read or written while holding an
+    fcntl lock on its byte range. A slot whose bucket is full is free to reuse; when all probed
+    slots are in use, the one closest to full is taken over. fcntl locks are held per process, so
+    the threads of one process also take a shard's threading lock first.
+    """
+
+    # Waits on other processes' locks, so it is called off the event loop.
+    blocking = True
+
+    MAGIC = b"RATELIM1"
+    _HEADER = struct.Struct("=8sQ")
+    _SLOT = struct.Struct("=Qd")
+    _PROBES = 8
+
+    def __init__(
+        self,
+        path: str = RATE_LIMIT_SHARED_PATH,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        shards: int = RATE_LIMIT_SHARDS,
+    ) -> None:
+        self.path = path
+        self.shards = shards
+        self.shard_slots = max(self._PROBES, math.ceil(max_keys / shards))
+        self.slots = self.shard_slots * shards
+        self._locks = [threading.Lock() for _ in range(shards)]
+        size = self._HEADER.size + self.slots * self._SLOT.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(self._fd, self._HEADER.size, 0)
+                if header != self._HEADER.pack(self.MAGIC, self.slots):
+                    # New, or written with another size: start over with empty buckets.
+                    os.ftruncate(self._fd, 0)
+                    os.ftruncate(self._fd, size)
+                    os.pwrite(self._fd, self._HEADER.pack(self.MAGIC, self.slots), 0)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(self._fd, size)
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def __len__(self) -> int:
+        now = time.time()
+        view = memoryview(self._map)[self._HEADER.size :]
+        try:
+            return sum(
+                1
+                for fingerprint, full_at in self._SLOT.iter_unpack(view)
+                if fingerprint and full_at > now
+            )
+        finally:
+            view.release()
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    def take(self, key: str, policy: RateLimitPolicy, now: float) -> Decision:
+        fingerprint = int.from_bytes(
+            hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little"
+        ) or 1
+        shard = fingerprint % self.shards
+        first = self._HEADER.size + shard * self.shard_slots * self._SLOT.size
+        length = self.shard_slots * self._SLOT.size
+        home = (fingerprint // self.shards) % self.shard_slots
+        with self._locks[shard]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, first)
+            try:
+                offset, full_at = self._find(fingerprint, now, first, home)
+                full_at, decision = _take(full_at, now, policy)
+                self._SLOT.pack_into(self._map, offset, fingerprint, full_at)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, first)
+        return decision
+
+    def _find(self, fingerprint: int, now: float, first: int, home: int) -> Tuple[int, float]:
+        """
+        Returns the offset of the key's slot and when its bucket is full, claiming a slot with a
+        full bucket when the key has none.
+        """
+        free: Optional[int] = None
+        closest: Optional[Tuple[float, int]] = None
+        for probe in range(self._PROBES):
+            offset = first + (home + probe) % self.shard_slots * self._SLOT.size
+            held, full_at = self._SLOT.unpack_from(self._map, offset)
+            if held == fingerprint:
+                return offset, full_at
+            if free is None:
+                if not held or full_at <= now:
+                    free = offset
+                elif closest is None or full_at < closest[0]:
+                    closest = (full_at, offset)
+        if free is None:
+            RATE_LIMIT_EVICTIONS.inc()
+            free = closest[1]  # type: ignore[index]
+        return free, now
+
+
+def client_key(scope: Dict[str, Any]) -> str:
+    """
+    Returns ``user:<id>`` for a request with a valid session token, and ``ip:<address>`` otherwise.
+    """
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            try:
+                return f"user:{session_signer.authenticate(value.decode('latin-1'))}"
+            except InvalidSessionError:
+                break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def make_backend(backend: str = RATE_LIMIT_BACKEND) -> Any:
+    if backend == "local":
+        return LocalBuckets()
+    if backend == "shared":
+        return SharedBuckets()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{backend}', expected local or shared")
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware applying the rate limit policy of each request's route to its client.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        routes_app: Any,
+        policies: Optional[Dict[str, Optional[RateLimitPolicy]]] = None,
+        backend: Optional[Any] = None,
+    ) -> None:
+        self.app = app
+        self.policies = parse_policies(RATE_LIMITS) if policies is None else policies
+        self.backend = backend if backend is not None else make_backend()
+        self.templates = RouteTemplates(routes_app)
+        _backends.append(self.backend)
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not self.policies:
+            await self.app(scope, receive, send)
+            return
+        name = f"{scope['method']} {self.templates.get(scope)}"
+        if name not in self.policies:
+            name = "*"
+        policy = self.policies.get(name)
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+        key = f"{name} {client_key(scope)}"
+        if self.backend.blocking:
+            decision = await asyncio.get_running_loop().run_in_executor(
+                None, self.backend.take, key, policy, time.time()
+            )
+        else:
+            decision = self.backend.take(key, policy, time.time())
+        headers = [
+            (b"ratelimit-limit", str(policy.limit).encode("ascii")),
+            (b"ratelimit-remaining", str(decision.remaining).encode("ascii")),
+            (b"ratelimit-reset", str(math.ceil(decision.reset)).encode("ascii")),
+            (b"ratelimit-policy", policy.header().encode("ascii")),
+        ]
+        if not decision.allowed:
+            RATE_LIMITED.inc(name)
+            retry_after = str(max(1, math.ceil(decision.retry_after)))
+            body = dumps({"error": f"Rate limit exceeded; retry in {retry_after} seconds"})
+            headers += [
+                (b"retry-after", retry_after.encode("ascii")),
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ]
+            await send({"type": "http.response.start", "status": 429, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message["headers"], *headers]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+_backends: List[Any] = []
+
+gauge(
+    "rate_limit_keys",
+    "Rate limit buckets currently held.",
+    function=lambda: sum(len(backend) for backend in _backends),
+)
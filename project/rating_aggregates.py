@@ -0,0 +1,266 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import prisma
+import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.joke_index import joke_index
+
+logger = logging.getLogger(__name__)
+
+# Window name -> number of UTC calendar days it covers, including today. None means all time.
+LEADERBOARD_WINDOWS: Dict[str, Optional[int]] = {
+    "all": None,
+    "day": 1,
+    "week": 7,
+    "month": 30,
+}
+# Ratings are additionally bucketed by day for as long as the longest window needs them.
+RATING_BUCKET_DAYS = max(days for days in LEADERBOARD_WINDOWS.values() if days)
+LEADERBOARD_MAX_N = int(os.getenv("LEADERBOARD_MAX_N", "100"))
+# Ratings a joke needs before it is ranked, so that one or two top scores cannot lead the board.
+LEADERBOARD_MIN_RATINGS = int(os.getenv("LEADERBOARD_MIN_RATINGS", "5"))
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "1"))
+RATING_RECONCILE_INTERVAL_SECONDS = float(
+    os.getenv("RATING_RECONCILE_INTERVAL_SECONDS", "300")
+)
+
+# (joke_id, count, sum)
+RankedJoke = Tuple[str, int, int]
+# (joke_id, score, UTC day)
+JournaledRating = Tuple[str, int, date]
+
+
+def _utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, dt_time.min, tzinfo=timezone.utc)
+
+
+class RatingAggregates:
+    """
+    Per-joke rating count and sum, maintained incrementally as ratings are written.
+
+    All-time totals live in one dictionary and recent ratings are also bucketed by UTC day, which is
+    enough to answer the day/week/month windows without touching the Rating table. Each window's
+    ranking is cached and recomputed with a bounded heap at most once per refresh interval, and only
+    after a write. A background task periodically replaces the in-memory state with fresh
+    ``group_by`` results so that drift, missed writes and expired days are corrected.
+
+    Writers hold ``writes`` from writing ratings until they are recorded. Reconciling reads without
+    it and journals the ratings recorded meanwhile, adding each one to the reads made before it was
+    written; a read that overlapped a write is repeated holding ``writes``, as it cannot tell
+    whether it saw that write. Ratings still waiting to be written are recorded as usual once they
+    are.
+    """
+
+    def __init__(self) -> None:
+        self._totals: Dict[str, List[int]] = {}
+        self._days: Dict[date, Dict[str, List[int]]] = {}
+        self._rankings: Dict[str, Tuple[float, date, List[RankedJoke]]] = {}
+        self._dirty = set(LEADERBOARD_WINDOWS)
+        self._listeners: List[Callable[[str], None]] = []
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._journal: Optional[List[JournaledRating]] = None
+        self.writes = asyncio.Lock()
+        joke_index.subscribe(self._on_joke_changed)
+
+    def subscribe(self, listener: Callable[[str], None]) -> None:
+        """
+        Registers a callback that receives the joke ID whenever that joke's aggregate changes.
+        """
+        self._listeners.append(listener)
+
+    def record(self, joke_id: str, score: int, created_at: Optional[datetime] = None) -> None:
+        """
+        Adds one rating to the aggregates. Call this once the rating has been written to the database,
+        before releasing ``writes``.
+        """
+        day = (created_at or datetime.now(timezone.utc)).astimezone(timezone.utc).date()
+        _add(self._totals, joke_id, 1, score)
+        if self._journal is not None:
+            self._journal.append((joke_id, score, day))
+        if (_utc_today() - day).days < RATING_BUCKET_DAYS:
+            _add(self._days.setdefault(day, {}), joke_id, 1, score)
+        self._dirty.update(LEADERBOARD_WINDOWS)
+        for listener in self._listeners:
+            listener(joke_id)
+
+    def score_total(self, joke_id: str) -> int:
+        aggregate = self._totals.get(joke_id)
+        return aggregate[1] if aggregate else 0
+
+    def totals(self) -> Dict[str, List[int]]:
+        """
+        Returns a copy of the all-time ``[count, sum]`` aggregates by joke ID, which may be read off
+        the event loop. The pairs themselves are shared, so a later rating may still show in them.
+        """
+        return dict(self._totals)
+
+    def get(self, joke_id: str) -> Tuple[int, int]:
+        """
+        Returns the all-time ``(count, sum)`` for a joke.
+        """
+        count, total = self._totals.get(joke_id, (0, 0))
+        return count, total
+
+    def top(self, window: str, n: int) -> List[RankedJoke]:
+        """
+        Returns up to n jokes ranked by mean score, then by rating count, for the given window.
+        """
+        today = _utc_today()
+        cached = self._rankings.get(window)
+        stale = (
+            cached is None
+            or cached[1] != today
+            or (
+                window in self._dirty
+                and time.monotonic() - cached[0] >= LEADERBOARD_REFRESH_SECONDS
+            )
+        )
+        if stale:
+            ranked = heapq.nlargest(
+                LEADERBOARD_MAX_N,
+                (
+                    (joke_id, count, total)
+                    for joke_id, (count, total) in self._window(window, today).items()
+                    if count >= LEADERBOARD_MIN_RATINGS
+                ),
+                key=lambda entry: (entry[2] / entry[1], entry[1]),
+            )
+            cached = (time.monotonic(), today, ranked)
+            self._rankings[window] = cached
+            self._dirty.discard(window)
+        return cached[2][:n]
+
+    def _window(self, window: str, today: date) -> Dict[str, List[int]]:
+        days = LEADERBOARD_WINDOWS[window]
+        if days is None:
+            return self._totals
+        merged: Dict[str, List[int]] = {}
+        for offset in range(days):
+            for joke_id, (count, total) in self._days.get(
+                today - timedelta(days=offset), {}
+            ).items():
+                _add(merged, joke_id, count, total)
+        return merged
+
+    def _on_joke_changed(self, event: str, joke_id: str, content: Optional[str]) -> None:
+        if event != "remove":
+            return
+        self._totals.pop(joke_id, None)
+        for bucket in self._days.values():
+            bucket.pop(joke_id, None)
+        self._dirty.update(LEADERBOARD_WINDOWS)
+
+    async def reconcile(self) -> None:
+        """
+        Rebuilds every aggregate from the Rating table: one ``group_by`` for all time and one per day
+        still covered by a window. Rating writes only wait for a read that overlapped one of them,
+        and for the results to be applied.
+        """
+        today = _utc_today()
+        journal: List[JournaledRating] = []
+        self._journal = journal
+        try:
+            reads = [(None, *await self._read(journal))]
+            for offset in range(RATING_BUCKET_DAYS):
+                day = today - timedelta(days=offset)
+                reads.append((day, *await self._read(journal, day)))
+            async with self.writes:
+                for day, scores, position in reads:
+                    # Ratings recorded after a read were written after it, so it is missing them.
+                    for joke_id, score, rated in journal[position:]:
+                        if day is None or rated == day:
+                            _add(scores, joke_id, 1, score)
+                self._apply(reads[0][1], {day: scores for day, scores, _ in reads[1:] if scores})
+        finally:
+            self._journal = None
+
+    async def _read(
+        self, journal: List[JournaledRating], day: Optional[date] = None
+    ) -> Tuple[Dict[str, List[int]], int]:
+        """
+        Reads all-time aggregates, or those of one day, and returns them with the journal position
+        from which recorded ratings are missing from them.
+        """
+        where = None
+        if day is not None:
+            where = {
+                "createdAt": {"gte": _day_start(day), "lt": _day_start(day + timedelta(days=1))}
+            }
+        position = len(journal)
+        writing = self.writes.locked()
+        scores = await _group_scores(where)
+        if writing or self.writes.locked() or len(journal) != position:
+            async with self.writes:
+                position = len(journal)
+                scores = await _group_scores(where)
+        return scores, position
+
+    def _apply(self, totals: Dict[str, List[int]], days: Dict[date, Dict[str, List[int]]]) -> None:
+        changed = set(totals) | set(self._totals)
+        self._totals = totals
+        self._days = days
+        self._dirty.update(LEADERBOARD_WINDOWS)
+        for joke_id in changed:
+            for listener in self._listeners:
+                listener(joke_id)
+        logger.info("Reconciled rating aggregates for %d jokes", len(totals))
+
+    def start(self) -> None:
+        self._reconcile_task = asyncio.create_task(self._reconcile_forever())
+
+    async def stop(self) -> None:
+        if self._reconcile_task is None:
+            return
+        self._reconcile_task.cancel()
+        try:
+            await self._reconcile_task
+        except asyncio.CancelledError:
+            pass
+        self._reconcile_task = None
+
+    async def _reconcile_forever(self) -> None:
+        while True:
+            await asyncio.sleep(RATING_RECONCILE_INTERVAL_SECONDS)
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Failed to reconcile rating aggregates")
+
+
+def _add(aggregates: Dict[str, List[int]], joke_id: str, count: int, total: int) -> None:
+    aggregate = aggregates.get(joke_id)
+    if aggregate is None:
+        aggregates[joke_id] = [count, total]
+    else:
+        aggregate[0] += count
+        aggregate[1] += total
+
+
+async def _group_scores(where: Optional[dict] = None) -> Dict[str, List[int]]:
+    groups = await query(
+        "Rating.group_by",
+        prisma.models.Rating.prisma().group_by(
+            by=["jokeId"], where=where, count=True, sum={"score": True}
+        ),
+        timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+    )
+    return {
+        group["jokeId"]: [
+            (group.get("_count") or {}).get("_all") or 0,
+            (group.get("_sum") or {}).get("score") or 0,
+        ]
+        for group in groups
+    }
+
+
+rating_aggregates = RatingAggregates()
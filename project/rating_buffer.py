@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import prisma
+import prisma.errors
+import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, DatabaseUnavailableError, query
+from project.metrics import counter, gauge, histogram
+from project.rating_aggregates import rating_aggregates
+
+logger = logging.getLogger(__name__)
+
+RATING_BUFFER_MAX_SIZE = int(os.getenv("RATING_BUFFER_MAX_SIZE", "10000"))
+RATING_BUFFER_FLUSH_SIZE = int(os.getenv("RATING_BUFFER_FLUSH_SIZE", "500"))
+RATING_BUFFER_FLUSH_INTERVAL_SECONDS = float(
+    os.getenv("RATING_BUFFER_FLUSH_INTERVAL_SECONDS", "1")
+)
+# How long a rating may wait for room in a full buffer before the request is shed.
+RATING_BUFFER_ENQUEUE_TIMEOUT_SECONDS = float(
+    os.getenv("RATING_BUFFER_ENQUEUE_TIMEOUT_SECONDS", "0.5")
+)
+RATING_BUFFER_RETRY_AFTER = int(os.getenv("RATING_BUFFER_RETRY_AFTER", "1"))
+
+# Errors that mean the database could not be reached. Only these put a batch back to be retried;
+# any other error is taken to be about the batch itself, which would fail again.
+_UNREACHABLE_ERRORS = (
+    DatabaseUnavailableError,
+    ConnectionError,
+    prisma.errors.ClientNotConnectedError,
+)
+
+
+class RatingBufferFullError(Exception):
+    """
+    Raised when the rating buffer stays full for longer than the enqueue timeout.
+    """
+
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("Rating buffer is full, please retry later")
+        self.retry_after = retry_after
+
+
+@dataclass
+class BufferedRating:
+    jokeId: str
+    userId: str
+    score: int
+    createdAt: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+RATING_BUFFER_ENQUEUED = counter(
+    "rating_buffer_enqueued_total", "Ratings accepted into the write-behind buffer."
+)
+RATING_BUFFER_REJECTED = counter(
+    "rating_buffer_rejected_total", "Ratings shed because the buffer stayed full."
+)
+RATING_BUFFER_WRITTEN = counter(
+    "rating_buffer_written_total", "Buffered ratings written to the database."
+)
+RATING_BUFFER_DROPPED = counter(
+    "rating_buffer_dropped_total",
+    "Buffered ratings discarded: refused by the database, such as for an unknown joke or user, "
+    "or not written by shutdown.",
+)
+RATING_BUFFER_FAILED_FLUSHES = counter(
+    "rating_buffer_failed_flushes_total",
+    "Flushes whose batch was put back because the database could not be reached.",
+)
+RATING_BUFFER_FLUSH_SECONDS = histogram(
+    "rating_buffer_flush_duration_seconds", "Time taken to write one batch of ratings."
+)
+RATING_BUFFER_BATCH_SIZE = histogram(
+    "rating_buffer_batch_size",
+    "Number of ratings in each successfully flushed batch.",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000),
+)
+
+
+class RatingWriteBuffer:
+    """
+    In-process write-behind buffer for ratings.
+
+    Ratings are appended to memory and written with ``create_many`` in batches, whenever
+    ``flush_size`` ratings are waiting or every ``flush_interval`` seconds, whichever comes first.
+    When ``max_size`` ratings are pending, writers wait briefly for a flush and are then shed with
+    RatingBufferFullError. Ratings are added to the in-memory rating aggregates once written.
+    """
+
+    def __init__(
+        self,
+        max_size: int = RATING_BUFFER_MAX_SIZE,
+        flush_size: int = RATING_BUFFER_FLUSH_SIZE,
+        flush_interval: float = RATING_BUFFER_FLUSH_INTERVAL_SECONDS,
+        enqueue_timeout: float = RATING_BUFFER_ENQUEUE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._pending: List[BufferedRating] = []
+        self._flush_requested = asyncio.Event()
+        self._space_available = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def submit(self, rating: BufferedRating) -> None:
+        """
+        Adds a rating to the buffer, waiting up to the enqueue timeout if the buffer is full.
+        """
+        deadline = time.monotonic() + self.enqueue_timeout
+        while len(self._pending) >= self.max_size:
+            self._space_available.clear()
+            self._flush_requested.set()
+            remaining = deadline - time.monotonic()
+            try:
+                await asyncio.wait_for(self._space_available.wait(), max(remaining, 0))
+            except asyncio.TimeoutError:
+                RATING_BUFFER_REJECTED.inc()
+                raise RatingBufferFullError(RATING_BUFFER_RETRY_AFTER)
+        self._pending.append(rating)
+        RATING_BUFFER_ENQUEUED.inc()
+        if len(self._pending) >= self.flush_size:
+            self._flush_requested.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._flush_forever())
+
+    async def drain(self) -> None:
+        """
+        Stops the background flusher and writes every pending rating. Called on shutdown.
+        """
+        if self._task is not None:
+            # Taking the flush lock first keeps the flusher from being cancelled mid-write, which
+            # would lose its batch whether or not the database had committed it.
+            async with self._flush_lock:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._task = None
+        while self._pending:
+            if not await self.flush():
+                RATING_BUFFER_DROPPED.inc(amount=len(self._pending))
+                logger.error(
+                    "Dropping %d buffered ratings that could not be written on shutdown",
+                    len(self._pending),
+                )
+                self._pending.clear()
+
+    async def _flush_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._flush_requested.wait(), self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            while self._pending:
+                if not await self.flush():
+                    await asyncio.sleep(self.flush_interval)
+                    break
+                if len(self._pending) < self.flush_size:
+                    break
+
+    async def flush(self) -> bool:
+        """
+        Writes one batch of up to ``flush_size`` ratings. Returns False if the unwritten part of
+        the batch was put back because the database could not be reached; ratings the database
+        refused are dropped instead, since retrying them would fail the same way.
+        """
+        # Holding ``writes`` from the write until the batch is recorded lets reconciling tell
+        # whether a read overlapped it. The batch is only taken once both locks are held, so that a
+        # flush cancelled while waiting for them loses nothing.
+        async with self._flush_lock, rating_aggregates.writes:
+            batch = self._pending[: self.flush_size]
+            if not batch:
+                return True
+            del self._pending[: len(batch)]
+            self._space_available.set()
+            start = time.perf_counter()
+            written: List[BufferedRating] = []
+            dropped: List[BufferedRating] = []
+            reached = True
+            try:
+                await self._write(batch, written, dropped)
+                RATING_BUFFER_FLUSH_SECONDS.observe(time.perf_counter() - start)
+                RATING_BUFFER_BATCH_SIZE.observe(len(batch))
+            except _UNREACHABLE_ERRORS:
+                # Halves already written or dropped while splitting the batch are settled.
+                settled = {id(rating) for rating in written + dropped}
+                unwritten = [rating for rating in batch if id(rating) not in settled]
+                logger.exception(
+                    "Failed to flush %d buffered ratings; they will be retried", len(unwritten)
+                )
+                RATING_BUFFER_FAILED_FLUSHES.inc()
+                self._pending[:0] = unwritten
+                reached = False
+            except Exception:
+                settled = {id(rating) for rating in written + dropped}
+                unwritten = [rating for rating in batch if id(rating) not in settled]
+                logger.exception(
+                    "Dropping %d buffered ratings that failed to write", len(unwritten)
+                )
+                RATING_BUFFER_DROPPED.inc(amount=len(unwritten))
+            RATING_BUFFER_WRITTEN.inc(amount=len(written))
+            for rating in written:
+                rating_aggregates.record(rating.jokeId, rating.score, rating.createdAt)
+            return reached
+
+    async def _write(
+        self,
+        batch: List[BufferedRating],
+        written: List[BufferedRating],
+        dropped: List[BufferedRating],
+    ) -> None:
+        """
+        Inserts a batch with one ``create_many``, adding it to ``written``. A rating the database
+        refuses, such as one for a missing joke or user, would fail the whole statement, so on a
+        data error the batch is split in halves until the offending rows are isolated and moved
+        to ``dropped``.
+        """
+        try:
+            await query(
+                "Rating.create_many",
+                prisma.models.Rating.prisma().create_many(
+                    data=[
+                        {
+                            "jokeId": rating.jokeId,
+                            "userId": rating.userId,
+                            "score": rating.score,
+                            "createdAt": rating.createdAt,
+                        }
+                        for rating in batch
+                    ]
+                ),
+                timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+            )
+            written.extend(batch)
+        except prisma.errors.DataError as e:
+            if len(batch) == 1:
+                RATING_BUFFER_DROPPED.inc()
+                dropped.append(batch[0])
+                logger.warning(
+                    "Dropping rating of joke %s by user %s: %s",
+                    batch[0].jokeId,
+                    batch[0].userId,
+                    "unknown joke or user"
+                    if isinstance(e, prisma.errors.ForeignKeyViolationError)
+                    else e,
+                )
+                return
+            middle = len(batch) // 2
+            await self._write(batch[:middle], written, dropped)
+            await self._write(batch[middle:], written, dropped)
+
+rating_buffer = RatingWriteBuffer()
+
+gauge(
+    "rating_buffer_depth",
+    "Ratings waiting in the write-behind buffer.",
+    function=lambda: rating_buffer.depth,
+)
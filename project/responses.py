@@ -0,0 +1,269 @@
+"""
+The response layer shared by every route: JSON rendering and response compression.
+
+Routes hand their service's response model to ``model_response``, which renders it straight to
+bytes. FastAPI only validates and re-encodes what a route returns when it is not already a
+``Response``, so the model is not checked a second time against ``response_model``, which is then
+only used for the OpenAPI schema. Bodies are encoded with orjson when it is installed and with the
+standard library otherwise; the output is the same JSON either way.
+"""
+import enum
+import gzip
+import json
+import os
+import uuid
+import zlib
+from datetime import date, datetime, time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional, gzip is used instead
+    brotli = None
+
+# Responses smaller than this are sent uncompressed; "0" turns compression off entirely.
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+_NDJSON = b"application/x-ndjson"
+_COMPRESSIBLE_TYPES = (b"application/json", _NDJSON, b"text/")
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.__dict__
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.__dict__
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encodes dicts, lists, scalars and pydantic models, nested in any combination, as compact JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(
+        content,
+        default=_json_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with ``dumps``. Content that is already ``bytes`` is taken to be
+    serialized JSON and sent as it is.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def model_response(
+    model: BaseModel,
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None,
+    exclude_none: bool = False,
+) -> FastJSONResponse:
+    """
+    Renders a response model a service has built. ``exclude_none`` drops top-level fields that are
+    None, like ``response_model_exclude_none``.
+    """
+    content: Any = model
+    if exclude_none:
+        content = {name: value for name, value in model.__dict__.items() if value is not None}
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
+
+
+def _accepted_encoding(headers: List[Tuple[bytes, bytes]]) -> Optional[str]:
+    """
+    Returns "br" or "gzip" when Accept-Encoding allows it, preferring brotli when it is installed.
+    """
+    for name, value in headers:
+        if name != b"accept-encoding":
+            continue
+        accepted = set()
+        for coding in value.decode("latin-1").lower().split(","):
+            token, _, params = coding.partition(";")
+            params = params.replace(" ", "")
+            if params.startswith("q=") and _quality(params[2:]) == 0:
+                continue
+            accepted.add(token.strip())
+        if brotli is not None and ({"br", "*"} & accepted):
+            return "br"
+        if {"gzip", "*"} & accepted:
+            return "gzip"
+        return None
+    return None
+
+
+def _quality(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return 0.0
+
+
+class _Compressor:
+    """
+    Compresses a streamed body. With ``flush`` every chunk is flushed as it is compressed, so that
+    the client can decode each one on arrival instead of when the encoder's buffer fills.
+    """
+
+    def __init__(self, encoding: str, flush: bool = False) -> None:
+        self._flush = flush
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            self._gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            data = self._brotli.process(data)
+            return data + self._brotli.flush() if self._flush else data
+        data = self._gzip.compress(data)
+        return data + self._gzip.flush(zlib.Z_SYNC_FLUSH) if self._flush else data
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._gzip.flush()
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON, NDJSON and text responses of at least ``minimum_size`` bytes
+    with brotli or gzip, whichever the client accepts. Streamed responses are compressed as they
+    are sent, NDJSON ones flushed chunk by chunk, and the ETag of a compressed response is made
+    weak. Requests that accept neither
+    encoding pass through untouched.
+    """
+
+    def __init__(self, app: Any, minimum_size: int = COMPRESSION_MIN_BYTES) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        encoding = None
+        if scope["type"] == "http" and self.minimum_size > 0:
+            encoding = _accepted_encoding(scope["headers"])
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    def __init__(self, send: Any, encoding: str, minimum_size: int) -> None:
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Dict[str, Any]] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.passthrough = not _compressible(message["headers"])
+            if self.passthrough:
+                await self.send(message)
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            headers = [
+                (name, _weak_etag(value) if name == b"etag" else value)
+                for name, value in start["headers"]
+                if name not in (b"content-length", b"vary")
+            ]
+            headers.append((b"content-encoding", self.encoding.encode("ascii")))
+            headers.append((b"vary", _vary(start["headers"])))
+            if more_body:
+                # NDJSON is read a line at a time, so each chunk is flushed to the client whole.
+                self.compressor = _Compressor(
+                    self.encoding, flush=_content_type(start["headers"]).startswith(_NDJSON)
+                )
+                body = self.compressor.compress(body)
+            else:
+                body = compress(body, self.encoding)
+                headers.append((b"content-length", str(len(body)).encode("ascii")))
+            await self.send({**start, "headers": headers})
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+        if self.compressor is not None:
+            body = self.compressor.compress(body)
+            if not more_body:
+                body += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+def _compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+    content_type = b""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value
+    return content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+def _content_type(headers: List[Tuple[bytes, bytes]]) -> bytes:
+    for name, value in headers:
+        if name == b"content-type":
+            return value
+    return b""
+
+
+def _weak_etag(value: bytes) -> bytes:
+    # A strong ETag names the exact bytes sent, which the compressed body no longer are.
+    return value if value.startswith(b"W/") else b"W/" + value
+
+
+def _vary(headers: List[Tuple[bytes, bytes]]) -> bytes:
+    for name, value in headers:
+        if name == b"vary":
+            if b"accept-encoding" in value.lower():
+                return value
+            return value + b", Accept-Encoding"
+    return b"Accept-Encoding"
@@ -0,0 +1,435 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import math
+import os
+import re
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import prisma
+import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.joke_index import JokeIndex, joke_index
+from project.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+# Estimated bytes the index may use; jokes that would push it past this are left out of search.
+SEARCH_INDEX_MAX_BYTES = int(os.getenv("SEARCH_INDEX_MAX_BYTES", str(256 * 1024 * 1024)))
+SEARCH_INDEX_LOAD_BATCH_SIZE = int(os.getenv("SEARCH_INDEX_LOAD_BATCH_SIZE", "10000"))
+# Upper bound for n on GET /jokes/search
+SEARCH_MAX_N = int(os.getenv("SEARCH_MAX_N", "50"))
+# How many indexed terms the last, possibly unfinished, word of a query may expand to; the ones
+# found in the most jokes are kept.
+SEARCH_MAX_PREFIX_TERMS = int(os.getenv("SEARCH_MAX_PREFIX_TERMS", "64"))
+# Recent searches whose results, and prefixes whose expansions, are kept until the corpus next
+# changes.
+SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "1024"))
+SEARCH_MAX_QUERY_TERMS = 8
+
+# Okapi BM25 parameters, and the discount for matching a longer word by its prefix.
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_MATCH_WEIGHT = 0.5
+
+# Amortized CPython sizes, measured with tracemalloc on a 100k-joke corpus: one posting entry, a
+# term with its postings dictionary and vocabulary slot, and a document's bookkeeping.
+_POSTING_BYTES = 85
+_TERM_BYTES = 300
+_DOCUMENT_BYTES = 330
+
+_WORD = re.compile(r"\w+")
+
+SEARCH_CACHE_LOOKUPS = counter(
+    "search_cache_lookups_total",
+    "Full-text search result cache lookups, by result: hit or miss.",
+    ("result",),
+)
+
+# document number -> term frequency
+Postings = Dict[int, int]
+# The postings an indexed term matches a query word with, and the weight of that match.
+Match = Tuple[Postings, float]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into case-folded words. Punctuation separates words, so "don't" is "don" and "t".
+    """
+    return _WORD.findall(text.casefold())
+
+
+class SearchIndex:
+    """
+    In-process inverted index over joke contents, ranked with BM25.
+
+    Each joke gets a small integer document number; every term maps to the documents containing it
+    and how often. A sorted vocabulary list answers prefix lookups with a binary search, so the last
+    word of a query may still be being typed. A search only touches the postings of its own terms,
+    and recent results are cached until the corpus changes.
+
+    It is built at startup, from the joke index when that holds the corpus and from the Joke table
+    otherwise, or in the background after startup in "snapshot" mode, when searches wait for it;
+    it then follows every change to the corpus through the joke index's listeners. Its size is
+    tracked as an estimate; once that reaches ``max_bytes`` further jokes are not indexed and are
+    counted in ``skipped`` instead.
+    """
+
+    def __init__(self, jokes: JokeIndex, max_bytes: int = SEARCH_INDEX_MAX_BYTES) -> None:
+        self.jokes = jokes
+        self.max_bytes = max_bytes
+        self.loaded = False
+        self.bytes = 0
+        self.skipped = 0
+        self._loading = asyncio.Lock()
+        self._building = False
+        self._postings: Dict[str, Postings] = {}
+        self._vocabulary: List[str] = []
+        self._documents: Dict[str, int] = {}
+        self._joke_ids: Dict[int, str] = {}
+        self._terms: Dict[int, Tuple[str, ...]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._next_document = 0
+        self._results: "OrderedDict[Tuple[Tuple[str, ...], int], List[Tuple[str, float]]]" = (
+            OrderedDict()
+        )
+        self._expansions: "OrderedDict[str, List[str]]" = OrderedDict()
+        jokes.subscribe(self._on_joke_changed)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def terms(self) -> int:
+        return len(self._postings)
+
+    async def load(self) -> None:
+        """
+        Indexes every joke. Reads the resident joke index when it is loaded, a chunk at a time in
+        "snapshot" mode, and otherwise pages through the Joke table by ID.
+        """
+        self._reset()
+        self._building = True
+        try:
+            await self._load()
+        finally:
+            self._building = False
+        self._vocabulary = sorted(self._postings)
+        self.loaded = True
+        logger.info(
+            "Indexed %d jokes and %d terms for search, about %d MiB",
+            len(self),
+            self.terms,
+            self.bytes // (1024 * 1024),
+        )
+
+    async def _load(self) -> None:
+        if self.jokes.loaded:
+            async for chunk in self.jokes.chunks():
+                for joke_id, content in chunk:
+                    # The listener may have indexed it while an earlier chunk was being built.
+                    self._unindex(joke_id)
+                    self._index(joke_id, content, sort=False)
+        else:
+            last_id: Optional[str] = None
+            while True:
+                page: Dict[str, Any] = {
+                    "take": SEARCH_INDEX_LOAD_BATCH_SIZE,
+                    "order": {"id": "asc"},
+                }
+                if last_id is not None:
+                    page.update(skip=1, cursor={"id": last_id})
+                batch = await query(
+                    "Joke.find_many",
+                    prisma.models.Joke.prisma().find_many(**page),
+                    timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+                )
+                for joke in batch:
+                    self._unindex(joke.id)
+                    self._index(joke.id, joke.content, sort=False)
+                if len(batch) < SEARCH_INDEX_LOAD_BATCH_SIZE:
+                    break
+                last_id = batch[-1].id
+
+    async def ensure_loaded(self) -> None:
+        """
+        Builds the index if it has not been, once however many searches are waiting for it, which
+        in "snapshot" mode is the build started after startup.
+        """
+        if self.loaded:
+            return
+        async with self._loading:
+            if not self.loaded:
+                await self.load()
+
+    def search(self, text: str, n: int) -> List[Tuple[str, float]]:
+        """
+        Returns up to ``n`` ``(joke_id, score)`` pairs for the jokes containing every word of
+        ``text``, best first. The last word also matches the indexed words it is a prefix of.
+        """
+        words = tuple(dict.fromkeys(tokenize(text)))[:SEARCH_MAX_QUERY_TERMS]
+        if not words or not self._documents:
+            return []
+        key = (words, n)
+        results = self._results.get(key)
+        if results is not None:
+            self._results.move_to_end(key)
+            SEARCH_CACHE_LOOKUPS.inc("hit")
+            return results
+        SEARCH_CACHE_LOOKUPS.inc("miss")
+        results = self._search(words, n)
+        self._results[key] = results
+        if len(self._results) > SEARCH_RESULT_CACHE_SIZE:
+            self._results.popitem(last=False)
+        return results
+
+    def _search(self, words: Tuple[str, ...], n: int) -> List[Tuple[str, float]]:
+        groups: List[List[Match]] = []
+        for word in words[:-1]:
+            postings = self._postings.get(word)
+            if postings is None:
+                return []
+            groups.append([(postings, self._idf(len(postings)))])
+        last = words[-1]
+        groups.append(
+            [
+                (
+                    self._postings[term],
+                    self._idf(len(self._postings[term]))
+                    * (1.0 if term == last else PREFIX_MATCH_WEIGHT),
+                )
+                for term in self._expand(last)
+            ]
+        )
+        # Start from the documents of the most selective word and narrow them down word by word.
+        groups.sort(key=lambda group: sum(len(postings) for postings, _ in group))
+        candidates = set().union(*(postings.keys() for postings, _ in groups[0]))
+        for group in groups[1:]:
+            if not candidates:
+                return []
+            if len(group) == 1:
+                candidates = group[0][0].keys() & candidates
+                continue
+            matched: Set[int] = set()
+            for postings, _ in group:
+                matched |= postings.keys() & candidates
+            candidates = matched
+        if not candidates:
+            return []
+        return [
+            (self._joke_ids[document], score)
+            for document, score in self._top(groups, candidates, n)
+        ]
+
+    def _top(
+        self, groups: List[List[Match]], candidates: Set[int], n: int
+    ) -> List[Tuple[int, float]]:
+        """
+        Scores the candidates, which match every group, and returns the ``n`` best ``(document,
+        score)`` pairs, best first and then by document number.
+
+        A word's score falls as the document gets longer, so each group's best possible score for
+        a length, from its highest weight and frequency, bounds that of any document of that
+        length. Candidates are scored shortest first, and the walk stops once the bound drops
+        below the n-th best score so far; a query matching most of the corpus only scores a few
+        documents in full.
+        """
+        lengths = self._lengths
+        average_length = self._total_length / len(lengths)
+        ceilings = [
+            (
+                max(weight for _, weight in group),
+                max(_peak(postings, candidates) for postings, _ in group),
+            )
+            for group in groups
+        ]
+        bounds: Dict[int, float] = {}
+        order = sorted(candidates)
+        order.sort(key=lengths.__getitem__)
+        # The n best (score, -document) pairs so far, the worst of them first.
+        best: List[Tuple[float, int]] = []
+        for document in order:
+            length = lengths[document]
+            if len(best) == n:
+                bound = bounds.get(length)
+                if bound is None:
+                    bound = bounds[length] = sum(
+                        _bm25(weight, frequency, length, average_length)
+                        for weight, frequency in ceilings
+                    )
+                # At the bound a document could only tie, and ties go to the lower document
+                # number; the rest of this length come later in document order.
+                if bound < best[0][0] or (bound == best[0][0] and -document < best[0][1]):
+                    break
+            score = 0.0
+            for group in groups:
+                if len(group) == 1:
+                    postings, weight = group[0]
+                    score += _bm25(weight, postings[document], length, average_length)
+                    continue
+                score += max(
+                    _bm25(weight, postings[document], length, average_length)
+                    for postings, weight in group
+                    if document in postings
+                )
+            if len(best) < n:
+                heapq.heappush(best, (score, -document))
+            elif (score, -document) > best[0]:
+                heapq.heapreplace(best, (score, -document))
+        return [(-document, score) for score, document in sorted(best, reverse=True)]
+
+    def _expand(self, prefix: str) -> List[str]:
+        """
+        Returns the indexed terms starting with ``prefix``. When there are more than
+        SEARCH_MAX_PREFIX_TERMS, those found in the most jokes are kept, as they cover the most
+        matches, instead of the first ones alphabetically. A short prefix can span thousands of
+        terms, so expansions are cached like results, until the corpus changes.
+        """
+        terms = self._expansions.get(prefix)
+        if terms is not None:
+            self._expansions.move_to_end(prefix)
+            return terms
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\U0010ffff", start)
+        terms = self._vocabulary[start:end]
+        if len(terms) > SEARCH_MAX_PREFIX_TERMS:
+            terms = heapq.nlargest(
+                SEARCH_MAX_PREFIX_TERMS, terms, key=lambda term: len(self._postings[term])
+            )
+        self._expansions[prefix] = terms
+        if len(self._expansions) > SEARCH_RESULT_CACHE_SIZE:
+            self._expansions.popitem(last=False)
+        return terms
+
+    def _idf(self, document_frequency: int) -> float:
+        return math.log(
+            1 + (len(self._documents) - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+
+    def _reset(self) -> None:
+        self.loaded = False
+        self.bytes = 0
+        self.skipped = 0
+        self._postings = {}
+        self._vocabulary = []
+        self._documents = {}
+        self._joke_ids = {}
+        self._terms = {}
+        self._lengths = {}
+        self._total_length = 0
+        self._results.clear()
+        self._expansions.clear()
+
+    def _index(self, joke_id: str, content: str, sort: bool = True) -> None:
+        words = tokenize(content)
+        frequencies: Dict[str, int] = {}
+        for word in words:
+            frequencies[word] = frequencies.get(word, 0) + 1
+        terms = tuple(frequencies)
+        cost = _document_bytes(joke_id, terms) + sum(
+            _term_bytes(term) for term in terms if term not in self._postings
+        )
+        if self.bytes + cost > self.max_bytes:
+            if not self.skipped:
+                logger.warning(
+                    "Search index reached SEARCH_INDEX_MAX_BYTES=%d; further jokes are not "
+                    "searchable",
+                    self.max_bytes,
+                )
+            self.skipped += 1
+            return
+        document = self._next_document
+        self._next_document += 1
+        self._documents[joke_id] = document
+        self._joke_ids[document] = joke_id
+        self._terms[document] = terms
+        self._lengths[document] = len(words)
+        self._total_length += len(words)
+        self.bytes += cost
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if sort:
+                    bisect.insort(self._vocabulary, term)
+            postings[document] = frequency
+
+    def _unindex(self, joke_id: str) -> None:
+        document = self._documents.pop(joke_id, None)
+        if document is None:
+            return
+        del self._joke_ids[document]
+        terms = self._terms.pop(document)
+        self._total_length -= self._lengths.pop(document)
+        self.bytes -= _document_bytes(joke_id, terms)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[document]
+            if not postings:
+                del self._postings[term]
+                if self.loaded:
+                    # While the index is being built the vocabulary is only sorted at the end.
+                    del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+                self.bytes -= _term_bytes(term)
+
+    def _on_joke_changed(self, event: str, joke_id: str, content: Optional[str]) -> None:
+        if not self.loaded and not self._building:
+            return
+        self._results.clear()
+        self._expansions.clear()
+        self._unindex(joke_id)
+        if content is not None:
+            self._index(joke_id, content, sort=self.loaded)
+
+
+def _bm25(weight: float, frequency: int, length: int, average_length: float) -> float:
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+    return weight * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+
+def _peak(postings: Postings, candidates: Set[int]) -> int:
+    """
+    Returns the highest frequency among the candidates in ``postings``, reading whichever of the
+    two is smaller.
+    """
+    if len(candidates) < len(postings):
+        return max((postings.get(document, 0) for document in candidates), default=0)
+    return max(postings.values())
+
+
+def _document_bytes(joke_id: str, terms: Tuple[str, ...]) -> int:
+    return (
+        _DOCUMENT_BYTES + sys.getsizeof(joke_id) + sys.getsizeof(terms) + _POSTING_BYTES * len(terms)
+    )
+
+
+def _term_bytes(term: str) -> int:
+    return _TERM_BYTES + sys.getsizeof(term)
+
+
+search_index = SearchIndex(joke_index)
+
+gauge(
+    "search_index_documents",
+    "Jokes held in the full-text search index.",
+    function=lambda: len(search_index),
+)
+gauge(
+    "search_index_terms",
+    "Distinct terms in the full-text search index.",
+    function=lambda: search_index.terms,
+)
+gauge(
+    "search_index_bytes",
+    "Estimated memory used by the full-text search index.",
+    function=lambda: search_index.bytes,
+)
+gauge(
+    "search_index_skipped_documents",
+    "Jokes left out of the full-text search index because it reached its memory limit.",
+    function=lambda: search_index.skipped,
+)
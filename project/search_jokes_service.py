@@ -0,0 +1,72 @@
+from typing import Dict, List
+
+import prisma
+import prisma.models
+from project.db import query
+from project.joke_index import joke_index
+from project.metrics import time_serialization
+from project.search_index import search_index, tokenize
+from pydantic import BaseModel
+
+
+class SearchHit(BaseModel):
+    """
+    A joke matching a search, with its relevance score.
+    """
+
+    id: str
+    content: str
+    score: float
+
+
+class SearchJokesResponse(BaseModel):
+    """
+    Response model for a full-text joke search, best match first.
+    """
+
+    query: str
+    jokes: List[SearchHit]
+
+
+async def search_jokes(q: str, n: int) -> SearchJokesResponse:
+    """
+    Returns the n jokes that best match a search query, read from the in-process search index.
+
+    Every word of the query must occur in a joke; the last word also matches longer words it
+    starts, so the endpoint can be called as the user types. Joke contents come from the resident
+    joke index, or from a single ``find_many`` by ID when the index is not loaded.
+
+    Args:
+        q (str): The search query.
+        n (int): The maximum number of jokes to return.
+
+    Returns:
+        SearchJokesResponse: Response model for a full-text joke search.
+    """
+    if not tokenize(q):
+        raise ValueError("The search query must contain at least one word")
+    await search_index.ensure_loaded()
+    ranked = search_index.search(q, n)
+    if joke_index.loaded:
+        contents: Dict[str, str] = {
+            joke_id: content
+            for joke_id, _ in ranked
+            if (content := joke_index.get(joke_id)) is not None
+        }
+    else:
+        jokes = await query(
+            "Joke.find_many",
+            prisma.models.Joke.prisma().find_many(
+                where={"id": {"in": [joke_id for joke_id, _ in ranked]}}
+            ),
+        )
+        contents = {joke.id: joke.content for joke in jokes}
+    with time_serialization("SearchJokesResponse"):
+        return SearchJokesResponse(
+            query=q,
+            jokes=[
+                SearchHit(id=joke_id, content=contents[joke_id], score=score)
+                for joke_id, score in ranked
+                if joke_id in contents
+            ],
+        )
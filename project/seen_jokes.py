@@ -0,0 +1,252 @@
+import logging
+import os
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from project.joke_index import JokeIndex, joke_index
+from project.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+# Memory all clients' seen bitmaps may use together; the least recently active clients are dropped
+# to stay within it. 0 disables no_repeat, and with it the per-joke numbering.
+NO_REPEAT_MAX_BYTES = int(os.getenv("NO_REPEAT_MAX_BYTES", str(64 * 1024 * 1024)))
+# Clients that ask for no joke for this long are forgotten and start over.
+NO_REPEAT_IDLE_SECONDS = float(os.getenv("NO_REPEAT_IDLE_SECONDS", "86400"))
+# Random draws tried before a client's bitmap is scanned for a joke it has not seen.
+NO_REPEAT_DRAWS = 8
+
+# Amortized CPython size of a client entry besides its bitmap: key, ordered dict node, tuple and
+# bytearray header.
+_CLIENT_BYTES = 250
+# Removed jokes leave unused numbers behind; once they outnumber the live jokes and this floor,
+# jokes are renumbered and every client starts over.
+_MIN_COMPACT_HOLES = 1024
+
+# A byte with at least one unseen joke.
+_UNSEEN_BYTE = re.compile(rb"[^\xff]")
+
+NO_REPEAT_EVICTIONS = counter(
+    "no_repeat_evictions_total",
+    "Clients whose seen jokes were forgotten, by reason: idle or memory.",
+    ("reason",),
+)
+NO_REPEAT_CYCLES = counter(
+    "no_repeat_cycles_total",
+    "Times a client had seen every joke and started over.",
+)
+
+
+class SeenJokes:
+    """
+    Per-client record of the jokes already served, for ``/joke?no_repeat=true``.
+
+    Every joke gets a small, stable number, and each client has a bitmap with one bit per number,
+    so a client who has seen a million jokes costs 125 KiB rather than a set of a million ID
+    strings. Bitmaps only grow as far as the highest number a client has seen.
+
+    A joke is picked by drawing at random until an unseen one comes up. Once a client has seen most
+    of the corpus that stops working, so after ``NO_REPEAT_DRAWS`` misses the bitmap is scanned for
+    a clear bit from a random starting point instead. When no joke is left the bitmap is cleared and
+    the client starts a new round.
+
+    Numbers of removed jokes are not handed out again while any bitmap may still have them set;
+    they are skipped as if seen. Clients are kept in least recently active order and dropped when
+    idle for ``idle_seconds`` or when the bitmaps together exceed ``max_bytes``. All of this is
+    per process, so a client spread over several workers only avoids repeats within each.
+    """
+
+    def __init__(
+        self,
+        jokes: JokeIndex,
+        max_bytes: int = NO_REPEAT_MAX_BYTES,
+        idle_seconds: float = NO_REPEAT_IDLE_SECONDS,
+    ) -> None:
+        self.jokes = jokes
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.loaded = False
+        self.bytes = 0
+        self._building = False
+        self._numbers: Dict[str, int] = {}
+        self._joke_ids: List[Optional[str]] = []
+        self._holes = 0
+        self._clients: "OrderedDict[str, Tuple[float, bytearray]]" = OrderedDict()
+        jokes.subscribe(self._on_joke_changed)
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    async def load(self) -> None:
+        """
+        Numbers the jokes of the loaded joke index, a chunk at a time in "snapshot" mode, where it
+        runs after startup and no_repeat is ignored until it is done. Does nothing when no_repeat
+        is disabled.
+        """
+        if not self.jokes.loaded or self.max_bytes <= 0:
+            return
+        self._number([])
+        self._building = True
+        try:
+            async for chunk in self.jokes.chunks():
+                for joke_id, _ in chunk:
+                    # The listener may have numbered it while an earlier chunk was being built.
+                    if joke_id not in self._numbers:
+                        self._numbers[joke_id] = len(self._joke_ids)
+                        self._joke_ids.append(joke_id)
+        finally:
+            self._building = False
+        self.loaded = True
+
+    def pick(
+        self, client: str, draw: Callable[[], Optional[Tuple[str, str]]]
+    ) -> Optional[Tuple[str, str]]:
+        """
+        Returns an ``(id, content)`` pair the client has not been served since it last saw every
+        joke, preferring what ``draw`` picks, and records it as seen.
+        """
+        bitmap = self._touch(client)
+        for _ in range(NO_REPEAT_DRAWS):
+            picked = draw()
+            if picked is None:
+                return None
+            number = self._numbers.get(picked[0])
+            if number is None or not _is_set(bitmap, number):
+                break
+        else:
+            number = self._unseen(bitmap)
+            if number is None:
+                NO_REPEAT_CYCLES.inc()
+                self.bytes -= len(bitmap)
+                bitmap.clear()
+                picked = draw()
+                number = None if picked is None else self._numbers.get(picked[0])
+            else:
+                joke_id = self._joke_ids[number]
+                content = self.jokes.get(joke_id)  # type: ignore[arg-type]
+                picked = None if content is None else (joke_id, content)  # type: ignore[assignment]
+        if number is not None:
+            self._set(bitmap, number)
+            self._evict_over_budget()
+        return picked
+
+    def _touch(self, client: str) -> bytearray:
+        now = time.monotonic()
+        while self._clients:
+            oldest, (active_at, bitmap) = next(iter(self._clients.items()))
+            if now - active_at < self.idle_seconds:
+                break
+            self._drop(oldest, "idle")
+        entry = self._clients.get(client)
+        if entry is None:
+            bitmap = bytearray()
+            self.bytes += _CLIENT_BYTES
+        else:
+            bitmap = entry[1]
+        self._clients[client] = (now, bitmap)
+        self._clients.move_to_end(client)
+        return bitmap
+
+    def _unseen(self, bitmap: bytearray) -> Optional[int]:
+        """
+        Returns the first number at or after a random start, wrapping around, whose joke the client
+        has not seen. Numbers of removed jokes are marked as seen on the way.
+        """
+        total = len(self._joke_ids)
+        if not total:
+            return None
+        start = random.randrange(total)
+        for low, high in ((start, total), (0, start)):
+            number = _next_clear(bitmap, low)
+            while number < high:
+                if self._joke_ids[number] is not None:
+                    return number
+                self._set(bitmap, number)
+                number = _next_clear(bitmap, number + 1)
+        return None
+
+    def _set(self, bitmap: bytearray, number: int) -> None:
+        byte = number >> 3
+        if byte >= len(bitmap):
+            self.bytes += byte + 1 - len(bitmap)
+            bitmap.extend(bytes(byte + 1 - len(bitmap)))
+        bitmap[byte] |= 1 << (number & 7)
+
+    def _evict_over_budget(self) -> None:
+        while self.bytes > self.max_bytes and self._clients:
+            self._drop(next(iter(self._clients)), "memory")
+
+    def _drop(self, client: str, reason: str) -> None:
+        _, bitmap = self._clients.pop(client)
+        self.bytes -= _CLIENT_BYTES + len(bitmap)
+        NO_REPEAT_EVICTIONS.inc(reason)
+
+    def _number(self, joke_ids: List[str]) -> None:
+        self._joke_ids = list(joke_ids)
+        self._numbers = {joke_id: number for number, joke_id in enumerate(joke_ids)}
+        self._holes = 0
+        self._clients.clear()
+        self.bytes = 0
+
+    def _on_joke_changed(self, event: str, joke_id: str, content: Optional[str]) -> None:
+        if not self.loaded and not self._building:
+            return
+        if content is None:
+            number = self._numbers.pop(joke_id, None)
+            if number is None:
+                return
+            self._joke_ids[number] = None
+            self._holes += 1
+            if self._holes > max(_MIN_COMPACT_HOLES, len(self._numbers)):
+                logger.info(
+                    "Renumbering %d jokes for no_repeat; %d clients start over",
+                    len(self._numbers),
+                    len(self._clients),
+                )
+                self._number([joke_id for joke_id in self._joke_ids if joke_id is not None])
+        elif joke_id not in self._numbers:
+            self._numbers[joke_id] = len(self._joke_ids)
+            self._joke_ids.append(joke_id)
+
+
+def _is_set(bitmap: bytearray, number: int) -> bool:
+    byte = number >> 3
+    return byte < len(bitmap) and bool(bitmap[byte] >> (number & 7) & 1)
+
+
+def _next_clear(bitmap: bytearray, number: int) -> int:
+    """
+    Returns the first clear bit at or after ``number``; every bit past the bitmap's end is clear.
+    """
+    byte = number >> 3
+    if byte >= len(bitmap):
+        return number
+    value = bitmap[byte] | ((1 << (number & 7)) - 1)
+    if value != 0xFF:
+        return (byte << 3) + _lowest_clear(value)
+    match = _UNSEEN_BYTE.search(bitmap, byte + 1)
+    if match is None:
+        return len(bitmap) << 3
+    byte = match.start()
+    return (byte << 3) + _lowest_clear(bitmap[byte])
+
+
+def _lowest_clear(value: int) -> int:
+    return (~value & (value + 1)).bit_length() - 1
+
+
+seen_jokes = SeenJokes(joke_index)
+
+gauge(
+    "no_repeat_clients",
+    "Clients whose seen jokes are tracked for no_repeat.",
+    function=lambda: len(seen_jokes),
+)
+gauge(
+    "no_repeat_bytes",
+    "Estimated memory used by the no_repeat seen bitmaps.",
+    function=lambda: seen_jokes.bytes,
+)
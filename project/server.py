@@ -1,37 +1,301 @@
+import asyncio
 import logging
+import math
+import time
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Any, AsyncIterator, Optional
 
 import project.admin_add_joke_service
+import project.admin_bulk_jokes_service
 import project.admin_delete_joke_service
+import project.admin_localization_service
 import project.admin_update_joke_service
+import project.fetch_daily_joke_service
 import project.fetch_random_joke_service
+import project.fetch_random_jokes_service
+import project.fetch_top_jokes_service
 import project.fetch_user_profile_service
+import project.list_jokes_service
+import project.password_hashing
+import project.rate_joke_service
+import project.search_jokes_service
+import project.submit_joke_service
 import project.update_user_profile_service
 import project.user_login_service
 import project.user_registration_service
-from fastapi import FastAPI
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response
+from fastapi import FastAPI, Header, Query, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from prisma import Prisma
+from project.db import DatabaseUnavailableError, client_options, db_breaker
+from project.joke_dedupe import content_hashes
+from project.joke_errors import (
+    DuplicateJokeError,
+    JokeNotFoundError,
+    JokeVersionConflictError,
+    LocalizationNotFoundError,
+)
+from project.joke_index import joke_index
+from project.localization_index import localization_index
+from project.metrics import REGISTRY, MetricsMiddleware, metrics_authorized
+from project.rating_aggregates import LEADERBOARD_MAX_N, rating_aggregates
+from project.rate_limit import RateLimitMiddleware
+from project.rating_buffer import RatingBufferFullError, rating_buffer
+from project.responses import (
+    CompressionMiddleware,
+    FastJSONResponse,
+    dumps,
+    model_response,
+)
+from project.search_index import SEARCH_MAX_N, search_index
+from project.seen_jokes import seen_jokes
+from project.sessions import InvalidSessionError, session_signer
+from project.startup import open_connections, startup, warm_up
+from project.submission_queue import submission_queue
+from project.weighted_joke_sampler import weighted_joke_sampler
 
 logger = logging.getLogger(__name__)
 
-db_client = Prisma(auto_register=True)
+db_client = Prisma(auto_register=True, **client_options())
+
+
+async def build_derived_indexes() -> None:
+    """
+    Builds the structures derived from the shared joke snapshot once the worker serves requests,
+    each a chunk at a time, so that neither startup nor any request walks the corpus in one go.
+    Searches wait for the search index; no_repeat and weighted jokes are plain random picks until
+    theirs are built.
+    """
+    for name, build in (
+        ("search_index", search_index.ensure_loaded),
+        ("seen_jokes", seen_jokes.load),
+        ("weighted_joke_sampler", weighted_joke_sampler.rebuild),
+    ):
+        start = time.perf_counter()
+        try:
+            await build()
+        except Exception:
+            logger.exception("Failed to build %s", name)
+        else:
+            logger.info("Built %s in %.3fs", name, time.perf_counter() - start)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await db_client.connect()
+    startup.begin()
+    with startup.phase("connect"):
+        await db_client.connect()
+    with startup.phase("pool"):
+        await open_connections(db_client)
+    with startup.phase("warm_up"):
+        await warm_up()
+    with startup.phase("joke_index"):
+        await joke_index.load()
+        content_hashes.load()
+        # In "snapshot" mode these are built by build_derived_indexes once startup is done.
+        if not joke_index.shared:
+            await seen_jokes.load()
+    with startup.phase("localization_index"):
+        await localization_index.load()
+    if not joke_index.shared:
+        with startup.phase("search_index"):
+            await search_index.load()
+    with startup.phase("rating_aggregates"):
+        await rating_aggregates.reconcile()
+        if not joke_index.shared:
+            await weighted_joke_sampler.rebuild()
+    rating_aggregates.start()
+    rating_buffer.start()
+    submission_queue.start(db_client)
+    startup.finish()
+    derived = asyncio.create_task(build_derived_indexes()) if joke_index.shared else None
     yield
+    startup.stop()
+    if derived is not None:
+        derived.cancel()
+    await submission_queue.stop()
+    await rating_buffer.drain()
+    await rating_aggregates.stop()
+    weighted_joke_sampler.close()
+    await joke_index.close()
+    project.password_hashing.password_hasher.shutdown()
     await db_client.disconnect()
 
 
 app = FastAPI(
     title="joke-test",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
     description="To create a joke API with a single endpoint that returns one joke, leveraging the given tech stack, the steps are as follows: \n\n1. **Programming Language**: Use Python for its simplicity and extensive libraries.\n2. **API Framework**: Implement FastAPI for the API development. FastAPI is chosen for its high performance and ease of use for building APIs with Python.\n3. **Database**: Store the jokes in PostgreSQL. Although a simple API returning one joke might initially not require a database, using PostgreSQL allows for scalability, such as adding more jokes or functionalities in the future.\n4. **ORM (Object-Relational Mapping)**: Utilize Prisma with Python to interact with the PostgreSQL database. Prisma facilitates developing and querying the database schema more efficiently and securely.\n\n**API Development Steps**:\n- Initialize a new FastAPI project.\n- Set up Prisma with PostgreSQL to define the model for a joke. This model will include fields such as `id` and `content`.\n- Create a database migration to generate the jokes table, then populate it with a selection of jokes.\n- Implement an endpoint in FastAPI (e.g., `/joke`) that queries the PostgreSQL database via Prisma to randomly select and return one joke from the table.\n- Ensure proper testing and validation of the endpoint to return jokes correctly. Optionally, add rate limiting to manage request load.\n- Deploy the API to a cloud provider or a local server, depending on the use case and audience.\n\n**Additional Consideration**:\n- For enhancement, you could implement additional endpoints to add, update, or delete jokes, turning the API into a more interactive platform.\n\nThis outline provides a comprehensive approach to developing a joke API with the specified tech stack, focusing on a scalable and efficient deployment.",
 )
+# FastAPI releases before 0.93 ignore the lifespan argument, so install it on the router directly.
+app.router.lifespan_context = lifespan
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RateLimitMiddleware, routes_app=app)
+app.add_middleware(MetricsMiddleware, routes_app=app)
+
+
+def unauthorized(error: InvalidSessionError) -> FastJSONResponse:
+    return FastJSONResponse(
+        content={"error": str(error)},
+        status_code=401,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def unavailable(error: DatabaseUnavailableError) -> FastJSONResponse:
+    return FastJSONResponse(
+        content={"error": str(error)},
+        status_code=503,
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+
+async def ndjson_response(items: AsyncIterator[Any]) -> Response:
+    """
+    Streams items as NDJSON. The first item is read before the response starts, so that an error
+    raised up front still reaches the route's handlers and its status code. Once the status is
+    sent an error can only end the stream early, which it does with a final ``{"error": ...}``
+    line, so that clients can tell a cut stream from a complete one.
+    """
+    try:
+        first = await items.__anext__()
+    except StopAsyncIteration:
+        return Response(media_type="application/x-ndjson")
+
+    async def lines() -> AsyncIterator[bytes]:
+        yield dumps(first) + b"\n"
+        try:
+            async for item in items:
+                yield dumps(item) + b"\n"
+        except Exception as e:
+            logger.exception("Error streaming response")
+            yield dumps({"error": str(e)}) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# Routes are matched in the order they are declared, so the most requested one comes first.
+@app.get(
+    "/joke",
+    response_model=project.fetch_random_joke_service.FetchLocalizedJokeResponse,
+    response_model_exclude_none=True,
+)
+async def api_get_fetch_random_joke(
+    weighted: bool = False,
+    lang: Optional[str] = None,
+    no_repeat: bool = False,
+    client_id: Optional[str] = Query(None, min_length=1, max_length=128),
+    accept_language: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> project.fetch_random_joke_service.FetchLocalizedJokeResponse | Response:
+    """
+    Fetches a random joke from the database and returns it, translated into the language given by
+    lang or negotiated from Accept-Language when a translation exists. With no_repeat, the caller,
+    identified by its session or else by client_id, gets no joke twice until it has seen them all
+    """
+    try:
+        seen_by = None
+        if no_repeat:
+            if authorization:
+                seen_by = f"user:{session_signer.authenticate(authorization)}"
+            elif client_id:
+                seen_by = f"client:{client_id}"
+            else:
+                raise ValueError("no_repeat requires a session or a client_id")
+        language = localization_index.negotiate(lang, accept_language)
+        body, served_language = await project.fetch_random_joke_service.render_random_joke(
+            weighted, language, seen_by
+        )
+        headers = {"Vary": "Accept-Language"}
+        if served_language:
+            headers["Content-Language"] = served_language
+        return FastJSONResponse(body, headers=headers)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except InvalidSessionError as e:
+        return unauthorized(e)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.get(
+    "/joke/daily",
+    response_model=project.fetch_daily_joke_service.FetchDailyJokeResponse,
+    response_model_exclude_none=True,
+)
+async def api_get_fetch_daily_joke(
+    lang: Optional[str] = None,
+    accept_language: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+) -> project.fetch_daily_joke_service.FetchDailyJokeResponse | Response:
+    """
+    Fetches the joke of the day, the same for everyone in a language until midnight UTC. The
+    response may be cached until then, and is revalidated with If-None-Match
+    """
+    try:
+        language = localization_index.negotiate(lang, accept_language)
+        daily = await project.fetch_daily_joke_service.fetch_daily_joke(language)
+        if daily is None:
+            return FastJSONResponse(content={"error": "No jokes available."}, status_code=404)
+        headers = {
+            "ETag": daily.etag,
+            "Cache-Control": f"public, max-age={daily.expires_in}",
+            "Vary": "Accept-Language",
+        }
+        if daily.language:
+            headers["Content-Language"] = daily.language
+        if project.fetch_daily_joke_service.not_modified(if_none_match, daily.etag):
+            return Response(status_code=304, headers=headers)
+        return FastJSONResponse(daily.body, headers=headers)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def api_get_metrics(authorization: Optional[str] = Header(None)) -> PlainTextResponse:
+    """
+    Exposes request, database and serialization metrics in the Prometheus text format, to holders
+    of METRICS_TOKEN when it is set
+    """
+    if not metrics_authorized(authorization):
+        return PlainTextResponse(
+            "Unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"}
+        )
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+@app.get("/health", include_in_schema=False)
+async def api_get_health() -> FastJSONResponse:
+    """
+    Liveness probe: answers as long as the process serves requests, with the state of the
+    database circuit breaker
+    """
+    return FastJSONResponse(content={"status": "ok", "database": db_breaker.status()})
+
+
+@app.get("/ready", include_in_schema=False)
+async def api_get_ready() -> FastJSONResponse:
+    """
+    Readiness probe: 503 until startup has opened the connection pool, warmed up and loaded the
+    in-process indexes, except those built on first use in snapshot mode, and once shutdown
+    begins, so that a load balancer only sends traffic to instances ready to serve it. An open
+    database circuit breaker is reported but does not fail the probe: an outage opens it on every
+    instance at once, and they still serve stale jokes and profiles meanwhile
+    """
+    status = {"startup": startup.status(), "database": db_breaker.status()}
+    if not startup.ready:
+        return FastJSONResponse(content={"status": startup.state, **status}, status_code=503)
+    return FastJSONResponse(content={"status": "ok", **status})
 
 
 @app.delete(
@@ -39,23 +303,72 @@ app = FastAPI(
     response_model=project.admin_delete_joke_service.DeleteJokeResponse,
 )
 async def api_delete_admin_delete_joke(
-    jokeId: str,
+    jokeId: str, if_match: Optional[str] = Header(None)
 ) -> project.admin_delete_joke_service.DeleteJokeResponse | Response:
     """
     Allows admin to delete an existing joke
     """
     try:
-        res = await project.admin_delete_joke_service.admin_delete_joke(jokeId)
-        return res
+        res = await project.admin_delete_joke_service.admin_delete_joke(
+            jokeId, if_match
+        )
+        return model_response(res)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except JokeNotFoundError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=404)
+    except JokeVersionConflictError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=409)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.post(
+    "/admin/jokes/bulk",
+    response_model=project.admin_bulk_jokes_service.AdminBulkAddJokesResponse,
+)
+async def api_post_admin_bulk_add_jokes(
+    request: Request,
+) -> project.admin_bulk_jokes_service.AdminBulkAddJokesResponse | Response:
+    """
+    Allows admin to import jokes from a streamed NDJSON or CSV body
+    """
+    try:
+        res = await project.admin_bulk_jokes_service.admin_bulk_add_jokes(
+            request.stream(),
+            request.headers.get("content-type", "application/x-ndjson"),
         )
+        return model_response(res)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.delete(
+    "/admin/jokes/bulk",
+    response_model=project.admin_bulk_jokes_service.AdminBulkDeleteJokesResponse,
+)
+async def api_delete_admin_bulk_delete_jokes(
+    body: project.admin_bulk_jokes_service.AdminBulkDeleteJokesRequest,
+) -> project.admin_bulk_jokes_service.AdminBulkDeleteJokesResponse | Response:
+    """
+    Allows admin to delete many jokes by ID list or content filter
+    """
+    try:
+        res = await project.admin_bulk_jokes_service.admin_bulk_delete_jokes(body)
+        return model_response(res)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
 
 
 @app.post("/users/login", response_model=project.user_login_service.UserLoginResponse)
@@ -67,16 +380,19 @@ async def api_post_user_login(
     """
     try:
         res = await project.user_login_service.user_login(email, password)
-        return res
+        return model_response(res)
+    except project.password_hashing.PasswordHasherSaturatedError as e:
+        logger.warning("Password hashing pool saturated, shedding request")
+        return FastJSONResponse(
+            content={"error": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
 
 
 @app.put(
@@ -84,23 +400,33 @@ async def api_post_user_login(
     response_model=project.admin_update_joke_service.AdminUpdateJokeResponse,
 )
 async def api_put_admin_update_joke(
-    jokeId: str, content: str
+    jokeId: str,
+    content: str,
+    if_match: Optional[str] = Header(None),
 ) -> project.admin_update_joke_service.AdminUpdateJokeResponse | Response:
     """
     Allows admin to update an existing joke
     """
     try:
-        res = await project.admin_update_joke_service.admin_update_joke(jokeId, content)
-        return res
+        res = await project.admin_update_joke_service.admin_update_joke(
+            jokeId, content, if_match
+        )
+        return model_response(res, headers={"ETag": f'"{res.updatedJoke.updatedAt}"'})
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except JokeNotFoundError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=404)
+    except JokeVersionConflictError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=409)
+    except DuplicateJokeError as e:
+        return FastJSONResponse(
+            content={"error": str(e), "jokeId": e.jokeId}, status_code=409
+        )
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
 
 
 @app.post(
@@ -108,23 +434,75 @@ async def api_put_admin_update_joke(
     response_model=project.admin_add_joke_service.AdminAddJokeResponse,
 )
 async def api_post_admin_add_joke(
-    content: str,
+    content: str, on_duplicate: str = "reject"
 ) -> project.admin_add_joke_service.AdminAddJokeResponse | Response:
     """
-    Allows admin to add a new joke
+    Allows admin to add a new joke, rejecting or merging duplicates of an existing one
     """
     try:
-        res = await project.admin_add_joke_service.admin_add_joke(content)
-        return res
+        res = await project.admin_add_joke_service.admin_add_joke(content, on_duplicate)
+        return model_response(res)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except DuplicateJokeError as e:
+        return FastJSONResponse(
+            content={"error": str(e), "jokeId": e.jokeId}, status_code=409
+        )
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.put(
+    "/admin/jokes/{jokeId}/localizations/{language}",
+    response_model=project.admin_localization_service.AdminPutLocalizationResponse,
+)
+async def api_put_admin_localization(
+    jokeId: str, language: str, content: str
+) -> project.admin_localization_service.AdminPutLocalizationResponse | Response:
+    """
+    Allows admin to create or replace a joke's translation into one language
+    """
+    try:
+        res = await project.admin_localization_service.admin_put_localization(
+            jokeId, language, content
         )
+        return model_response(res)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except JokeNotFoundError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=404)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.delete(
+    "/admin/jokes/{jokeId}/localizations/{language}",
+    response_model=project.admin_localization_service.DeleteLocalizationResponse,
+)
+async def api_delete_admin_localization(
+    jokeId: str, language: str
+) -> project.admin_localization_service.DeleteLocalizationResponse | Response:
+    """
+    Allows admin to delete a joke's translation into one language
+    """
+    try:
+        res = await project.admin_localization_service.admin_delete_localization(
+            jokeId, language
+        )
+        return model_response(res)
+    except LocalizationNotFoundError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=404)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
 
 
 @app.post(
@@ -141,37 +519,178 @@ async def api_post_user_registration(
         res = await project.user_registration_service.user_registration(
             email, password, username, role
         )
-        return res
+        return model_response(res)
+    except project.password_hashing.PasswordHasherSaturatedError as e:
+        logger.warning("Password hashing pool saturated, shedding request")
+        return FastJSONResponse(
+            content={"error": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.get(
+    "/jokes",
+    response_model=project.list_jokes_service.ListJokesResponse,
+)
+async def api_get_list_jokes(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=project.list_jokes_service.JOKES_PAGE_MAX_LIMIT),
+    accept: Optional[str] = Header(None),
+) -> project.list_jokes_service.ListJokesResponse | Response:
+    """
+    Lists the joke catalogue page by page, or exports all of it as NDJSON
+    """
+    try:
+        if accept and "application/x-ndjson" in accept:
+            return await ndjson_response(project.list_jokes_service.iter_jokes(cursor))
+        res = await project.list_jokes_service.list_jokes(cursor, limit)
+        return model_response(res)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
 
 
 @app.get(
-    "/joke", response_model=project.fetch_random_joke_service.FetchRandomJokeResponse
+    "/jokes/random",
+    response_model=project.fetch_random_jokes_service.FetchRandomJokesResponse,
 )
-async def api_get_fetch_random_joke() -> project.fetch_random_joke_service.FetchRandomJokeResponse | Response:
+async def api_get_fetch_random_jokes(
+    n: int = Query(
+        1, ge=1, le=project.fetch_random_jokes_service.RANDOM_JOKES_MAX_N
+    ),
+    accept: Optional[str] = Header(None),
+) -> project.fetch_random_jokes_service.FetchRandomJokesResponse | Response:
     """
-    Fetches a random joke from the database and returns it
+    Fetches n distinct random jokes, optionally streamed as NDJSON
     """
     try:
-        res = await project.fetch_random_joke_service.fetch_random_joke()
-        return res
+        if accept and "application/x-ndjson" in accept:
+            return await ndjson_response(
+                project.fetch_random_jokes_service.iter_random_jokes(n)
+            )
+        res = await project.fetch_random_jokes_service.fetch_random_jokes(n)
+        return model_response(res)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.get(
+    "/jokes/top",
+    response_model=project.fetch_top_jokes_service.FetchTopJokesResponse,
+)
+async def api_get_fetch_top_jokes(
+    n: int = Query(10, ge=1, le=LEADERBOARD_MAX_N), window: str = "all"
+) -> project.fetch_top_jokes_service.FetchTopJokesResponse | Response:
+    """
+    Returns the best rated jokes for a time window
+    """
+    try:
+        res = await project.fetch_top_jokes_service.fetch_top_jokes(n, window)
+        return model_response(res)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.get(
+    "/jokes/search",
+    response_model=project.search_jokes_service.SearchJokesResponse,
+)
+async def api_get_search_jokes(
+    q: str = Query(..., min_length=1, max_length=200),
+    n: int = Query(10, ge=1, le=SEARCH_MAX_N),
+) -> project.search_jokes_service.SearchJokesResponse | Response:
+    """
+    Searches joke contents, matching the last word of the query as a prefix
+    """
+    try:
+        res = await project.search_jokes_service.search_jokes(q, n)
+        return model_response(res)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.post(
+    "/jokes/{jokeId}/rate",
+    response_model=project.rate_joke_service.RateJokeResponse,
+    status_code=202,
+)
+async def api_post_rate_joke(
+    jokeId: str, score: int, authorization: Optional[str] = Header(None)
+) -> project.rate_joke_service.RateJokeResponse | Response:
+    """
+    Rates a joke as the logged-in user; the rating is written to the database in the background
+    """
+    try:
+        user_id = session_signer.authenticate(authorization)
+        res = await project.rate_joke_service.rate_joke(jokeId, user_id, score)
+        return model_response(res, status_code=202)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except InvalidSessionError as e:
+        return unauthorized(e)
+    except JokeNotFoundError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=404)
+    except RatingBufferFullError as e:
+        logger.warning("Rating buffer full, shedding request")
+        return FastJSONResponse(
+            content={"error": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
         )
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
+
+
+@app.post(
+    "/jokes/submit",
+    response_model=project.submit_joke_service.SubmitJokeResponse,
+    status_code=202,
+)
+async def api_post_submit_joke(
+    content: str, authorization: Optional[str] = Header(None)
+) -> project.submit_joke_service.SubmitJokeResponse | Response:
+    """
+    Submits a joke for moderation; it is checked and published, or rejected, in the background
+    """
+    try:
+        user_id = session_signer.authenticate(authorization)
+        res = await project.submit_joke_service.submit_joke(user_id, content)
+        return model_response(res, status_code=202)
+    except ValueError as e:
+        return FastJSONResponse(content={"error": str(e)}, status_code=400)
+    except InvalidSessionError as e:
+        return unauthorized(e)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
 
 
 @app.put(
@@ -183,43 +702,44 @@ async def api_put_update_user_profile(
     email: Optional[str],
     profile_picture_url: Optional[str],
     bio: Optional[str],
+    authorization: Optional[str] = Header(None),
 ) -> project.update_user_profile_service.UpdateUserProfileResponse | Response:
     """
     Updates the profile information of a logged-in user
     """
     try:
+        user_id = session_signer.authenticate(authorization)
         res = await project.update_user_profile_service.update_user_profile(
-            name, email, profile_picture_url, bio
+            user_id, name, email, profile_picture_url, bio
         )
-        return res
+        return model_response(res)
+    except InvalidSessionError as e:
+        return unauthorized(e)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
 
 
 @app.get(
     "/users/me",
     response_model=project.fetch_user_profile_service.FetchUserProfileResponse,
 )
-async def api_get_fetch_user_profile() -> project.fetch_user_profile_service.FetchUserProfileResponse | Response:
+async def api_get_fetch_user_profile(
+    authorization: Optional[str] = Header(None),
+) -> project.fetch_user_profile_service.FetchUserProfileResponse | Response:
     """
     Retrieves the profile information of a logged-in user
     """
     try:
-        res = await project.fetch_user_profile_service.fetch_user_profile()
-        return res
+        user_id = session_signer.authenticate(authorization)
+        res = await project.fetch_user_profile_service.fetch_user_profile(user_id)
+        return model_response(res)
+    except InvalidSessionError as e:
+        return unauthorized(e)
+    except DatabaseUnavailableError as e:
+        return unavailable(e)
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+        return FastJSONResponse(content={"error": str(e)}, status_code=500)
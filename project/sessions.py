@@ -0,0 +1,98 @@
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Must be set, and shared, when more than one process serves requests; otherwise each process signs
+# with its own random key and tokens do not survive a restart.
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))
+
+
+class InvalidSessionError(Exception):
+    """
+    Raised when a request carries no session token, or one that is malformed, forged or expired.
+    """
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SessionSigner:
+    """
+    Issues and verifies stateless session tokens.
+
+    A token is ``<payload>.<signature>``, both base64url encoded, where the payload is a small JSON
+    object holding the user ID and expiry time and the signature is its HMAC-SHA256. Verifying a
+    token only needs the secret, so resolving the caller costs no database round trip.
+    """
+
+    def __init__(self, secret: str = SESSION_SECRET, ttl: int = SESSION_TTL_SECONDS) -> None:
+        if not secret:
+            logger.warning(
+                "SESSION_SECRET is not set; using a random key, so sessions end on restart"
+            )
+            secret = secrets.token_hex(32)
+        self._key = secret.encode("utf-8")
+        self.ttl = ttl
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(
+            hmac.new(self._key, payload.encode("utf-8"), hashlib.sha256).digest()
+        )
+
+    def issue(self, user_id: str, now: Optional[float] = None) -> str:
+        """
+        Returns a token identifying the user until the session TTL runs out.
+        """
+        issued_at = int(time.time() if now is None else now)
+        payload = _b64encode(
+            json.dumps(
+                {"sub": user_id, "iat": issued_at, "exp": issued_at + self.ttl},
+                separators=(",", ":"),
+            ).encode("utf-8")
+        )
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str, now: Optional[float] = None) -> str:
+        """
+        Checks a token's signature and expiry and returns the user ID it was issued for.
+        """
+        payload, _, signature = token.partition(".")
+        if not payload or not signature:
+            raise InvalidSessionError("Malformed session token")
+        expected = self._sign(payload)
+        if not hmac.compare_digest(signature.encode("utf-8"), expected.encode("ascii")):
+            raise InvalidSessionError("Invalid session token")
+        try:
+            claims = json.loads(_b64decode(payload))
+            user_id, expires_at = claims["sub"], claims["exp"]
+        except (ValueError, KeyError, TypeError):
+            raise InvalidSessionError("Malformed session token")
+        if (time.time() if now is None else now) >= expires_at:
+            raise InvalidSessionError("Session has expired")
+        return user_id
+
+    def authenticate(self, authorization: Optional[str]) -> str:
+        """
+        Resolves an ``Authorization: Bearer <token>`` header value to a user ID.
+        """
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not token.strip():
+            raise InvalidSessionError("Missing bearer session token")
+        return self.verify(token.strip())
+
+
+session_signer = SessionSigner()
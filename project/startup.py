@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+import prisma
+import prisma.models
+from project.db import DB_POOL_SIZE, query
+from project.metrics import gauge
+
+# Logged alongside uvicorn's own startup messages, the only ones its default logging config shows
+# at INFO, so that cold-start timings end up in every deploy's logs.
+logger = logging.getLogger("uvicorn.error")
+
+# Connections opened before the worker reports ready: all of DB_POOL_SIZE by default, or one when
+# the pool size is left to Prisma.
+DB_POOL_WARM_CONNECTIONS = int(os.getenv("DB_POOL_WARM_CONNECTIONS", str(DB_POOL_SIZE or 1)))
+# How long each warm-up connection is held, so that concurrent ones cannot share a connection.
+_WARM_CONNECTION_HOLD = "SELECT 1 FROM pg_sleep(0.05)"
+
+STARTUP_PHASE_SECONDS = gauge(
+    "startup_phase_duration_seconds",
+    "Time the last startup of this worker spent in each phase.",
+    ("phase",),
+)
+
+
+class Startup:
+    """
+    Tracks a worker's startup, from connecting to the database to serving its first request.
+
+    Each ``phase`` is timed, logged and exported, so that cold-start regressions show up in rolling
+    deploys. ``state`` goes from "starting" to "ready" once every phase has run, and to "stopping"
+    when shutdown begins; only a ready worker passes the readiness probe.
+    """
+
+    def __init__(self) -> None:
+        self.state = "starting"
+        self.phases: Dict[str, float] = {}
+        self._began = time.perf_counter()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        began = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - began
+        self.phases[name] = seconds
+        STARTUP_PHASE_SECONDS.set(seconds, name)
+        logger.info("Startup phase %s took %.3fs", name, seconds)
+
+    def begin(self) -> None:
+        self.state = "starting"
+        self.phases = {}
+        self._began = time.perf_counter()
+
+    def finish(self) -> None:
+        self.state = "ready"
+        logger.info("Ready to serve after %.3fs", time.perf_counter() - self._began)
+
+    def stop(self) -> None:
+        self.state = "stopping"
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "phaseSeconds": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+        }
+
+
+async def open_connections(client: prisma.Prisma, count: int = DB_POOL_WARM_CONNECTIONS) -> None:
+    """
+    Opens ``count`` pool connections up front by holding that many queries open at once, instead
+    of leaving the first requests after a deploy to pay for them.
+    """
+    await asyncio.gather(
+        *(
+            query("warm_up.connection", client.query_raw(_WARM_CONNECTION_HOLD))
+            for _ in range(count)
+        )
+    )
+
+
+async def warm_up() -> None:
+    """
+    Sends one of each query that requests run when nothing is cached, so that the query engine has
+    them ready and their first real use is not slower than the rest.
+    """
+    await query("Joke.count", prisma.models.Joke.prisma().count())
+    await query("Joke.find_first", prisma.models.Joke.prisma().find_first(order={"id": "asc"}))
+    await query(
+        "User.find_unique", prisma.models.User.prisma().find_unique(where={"id": "warm-up"})
+    )
+    await query(
+        "Localization.find_unique",
+        prisma.models.Localization.prisma().find_unique(
+            where={"jokeId_language": {"jokeId": "warm-up", "language": "en"}}
+        ),
+    )
+
+
+startup = Startup()
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import prisma
+import prisma.models
+from project.db import DB_LONG_QUERY_TIMEOUT_SECONDS, query
+from project.joke_dedupe import DUPLICATE_JOKES, content_hash, find_owners, normalize_content
+from project.joke_index import joke_index
+from project.metrics import counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+# Submissions claimed, checked and decided together in one transaction.
+SUBMISSION_BATCH_SIZE = int(os.getenv("SUBMISSION_BATCH_SIZE", "100"))
+# How often each worker process looks for submissions enqueued by other processes and refreshes
+# the queue metrics; submissions enqueued by the same process wake its worker straight away.
+SUBMISSION_POLL_INTERVAL_SECONDS = float(os.getenv("SUBMISSION_POLL_INTERVAL_SECONDS", "1"))
+
+# Locks the claimed rows until the transaction ends; rows another worker holds are skipped rather
+# than waited for, so several workers drain the queue without deciding a submission twice.
+_CLAIM = """
+SELECT id, "userId", content, extract(epoch FROM "createdAt")::float8 AS "submittedAt"
+FROM "Submission"
+WHERE status = 'PENDING'
+ORDER BY "createdAt"
+LIMIT $1
+FOR UPDATE SKIP LOCKED
+"""
+_DECIDE = """
+UPDATE "Submission" AS s
+SET status = d.status::"SubmissionStatus", "jokeId" = d."jokeId", reason = d.reason,
+    "updatedAt" = now()
+FROM unnest($1::text[], $2::text[], $3::text[], $4::text[]) AS d(id, status, "jokeId", reason)
+WHERE s.id = d.id
+"""
+
+SUBMISSIONS_ENQUEUED = counter(
+    "submissions_enqueued_total", "Joke submissions queued for moderation."
+)
+SUBMISSIONS_DECIDED = counter(
+    "submissions_decided_total",
+    "Moderated joke submissions, by decision: accepted, or the reason they were rejected.",
+    ("decision",),
+)
+SUBMISSION_QUEUE_DEPTH = gauge(
+    "submission_queue_depth", "Pending submissions, as of the last poll."
+)
+SUBMISSION_QUEUE_LAG = gauge(
+    "submission_queue_lag_seconds",
+    "Age of the oldest pending submission, as of the last poll.",
+)
+SUBMISSION_MODERATION_LAG = histogram(
+    "submission_moderation_lag_seconds",
+    "Time from a joke being submitted to its moderation decision.",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+SUBMISSION_BATCH_SECONDS = histogram(
+    "submission_batch_duration_seconds",
+    "Time taken to claim, check and decide one batch of submissions.",
+)
+
+
+class PendingSubmission(NamedTuple):
+    id: str
+    userId: str
+    content: str
+    # Unix time the submission was enqueued.
+    submittedAt: float
+    # ID the joke gets if the submission is accepted.
+    jokeId: str
+
+
+class Rejection(NamedTuple):
+    reason: str
+    # An existing joke the submission repeats, recorded on the submission.
+    jokeId: Optional[str] = None
+
+
+# A check looks at a whole batch at once, so that it can answer with one query, and returns the
+# submissions it rejects by ID. Submissions an earlier check rejected are not passed on.
+SubmissionCheck = Callable[[List[PendingSubmission]], Awaitable[Dict[str, Rejection]]]
+
+
+async def check_content(batch: List[PendingSubmission]) -> Dict[str, Rejection]:
+    """
+    Rejects submissions with no words in them, such as only punctuation.
+    """
+    return {
+        submission.id: Rejection("empty")
+        for submission in batch
+        if not normalize_content(submission.content)
+    }
+
+
+async def check_duplicates(batch: List[PendingSubmission]) -> Dict[str, Rejection]:
+    """
+    Rejects submissions whose content duplicates an existing joke, or an earlier submission of
+    the same batch, as ``contentHash`` defines it.
+    """
+    hashes = {submission.id: content_hash(submission.content) for submission in batch}
+    owners = await find_owners(list(set(hashes.values())))
+    rejected: Dict[str, Rejection] = {}
+    for submission in batch:
+        hashed = hashes[submission.id]
+        owner = owners.setdefault(hashed, submission.jokeId)
+        if owner != submission.jokeId:
+            rejected[submission.id] = Rejection("duplicate", owner)
+    DUPLICATE_JOKES.inc("rejected", amount=len(rejected))
+    return rejected
+
+
+class SubmissionQueue:
+    """
+    Background moderation of the Submission table.
+
+    ``POST /jokes/submit`` only inserts a PENDING row. The worker claims up to ``batch_size`` of
+    them with ``FOR UPDATE SKIP LOCKED``, runs ``checks`` over the batch, creates the jokes of
+    accepted submissions with one ``create_many`` and records every decision with one ``UPDATE``,
+    all in one transaction. A failed batch rolls back and its submissions stay pending for the next
+    attempt. Accepted jokes are added to the joke index once the transaction has committed.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = SUBMISSION_BATCH_SIZE,
+        poll_interval: float = SUBMISSION_POLL_INTERVAL_SECONDS,
+        checks: Optional[List[SubmissionCheck]] = None,
+    ) -> None:
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.checks: List[SubmissionCheck] = (
+            list(checks) if checks is not None else [check_content, check_duplicates]
+        )
+        self._client: Optional[prisma.Prisma] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add_check(self, check: SubmissionCheck) -> None:
+        self.checks.append(check)
+
+    def notify(self) -> None:
+        """
+        Wakes the worker for a submission this process just enqueued.
+        """
+        SUBMISSIONS_ENQUEUED.inc()
+        self._wake.set()
+
+    def start(self, client: prisma.Prisma) -> None:
+        self._client = client
+        self._task = asyncio.create_task(self._moderate_forever())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _moderate_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                while await self.moderate_batch() == self.batch_size:
+                    pass
+                await self.measure()
+            except Exception:
+                logger.exception("Failed to moderate joke submissions")
+
+    async def moderate_batch(self) -> int:
+        """
+        Claims, checks and decides one batch of pending submissions. Returns how many were claimed.
+        """
+        start = time.perf_counter()
+        async with self._client.tx() as tx:  # type: ignore[union-attr]
+            rows = await query(
+                "Submission.claim",
+                tx.query_raw(_CLAIM, self.batch_size),
+                timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+            )
+            if not rows:
+                return 0
+            batch = [
+                PendingSubmission(
+                    id=row["id"],
+                    userId=row["userId"],
+                    content=row["content"] or "",
+                    submittedAt=float(row["submittedAt"]),
+                    jokeId=str(uuid.uuid4()),
+                )
+                for row in rows
+            ]
+            rejected = await self._check(batch)
+            accepted = await self._create_jokes(
+                tx, [submission for submission in batch if submission.id not in rejected]
+            )
+            created = {submission.jokeId for submission in accepted}
+            planned = {submission.jokeId for submission in batch}
+            ids, statuses, joke_ids, reasons = [], [], [], []
+            for submission in batch:
+                rejection = rejected.get(submission.id)
+                if rejection is None and submission.jokeId not in created:
+                    # Its content was stored by another writer since the duplicate check ran.
+                    rejection = rejected[submission.id] = Rejection("duplicate")
+                ids.append(submission.id)
+                if rejection is None:
+                    statuses.append("ACCEPTED")
+                    joke_ids.append(submission.jokeId)
+                    reasons.append(None)
+                    continue
+                joke_id = rejection.jokeId
+                if joke_id in planned and joke_id not in created:
+                    # Repeats another submission of the batch whose joke was not created after all.
+                    joke_id = None
+                statuses.append("REJECTED")
+                joke_ids.append(joke_id)
+                reasons.append(rejection.reason)
+            await query(
+                "Submission.decide",
+                tx.execute_raw(_DECIDE, ids, statuses, joke_ids, reasons),
+                timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+            )
+        decided_at = time.time()
+        for submission in batch:
+            SUBMISSION_MODERATION_LAG.observe(max(0.0, decided_at - submission.submittedAt))
+            rejection = rejected.get(submission.id)
+            SUBMISSIONS_DECIDED.inc("accepted" if rejection is None else rejection.reason)
+        for submission in accepted:
+            joke_index.add(submission.jokeId, submission.content)
+        SUBMISSION_BATCH_SECONDS.observe(time.perf_counter() - start)
+        return len(batch)
+
+    async def _check(self, batch: List[PendingSubmission]) -> Dict[str, Rejection]:
+        rejected: Dict[str, Rejection] = {}
+        for check in self.checks:
+            remaining = [submission for submission in batch if submission.id not in rejected]
+            if not remaining:
+                break
+            rejected.update(await check(remaining))
+        return rejected
+
+    async def _create_jokes(
+        self, tx: prisma.Prisma, accepted: List[PendingSubmission]
+    ) -> List[PendingSubmission]:
+        """
+        Creates the jokes of accepted submissions and returns those that were created. A joke whose
+        content another writer stored since the checks ran is skipped rather than failing the
+        batch.
+        """
+        if not accepted:
+            return []
+        await query(
+            "Joke.create_many",
+            prisma.models.Joke.prisma(tx).create_many(
+                data=[
+                    {
+                        "id": submission.jokeId,
+                        "content": submission.content,
+                        "contentHash": content_hash(submission.content),
+                        "submittedBy": submission.userId,
+                    }
+                    for submission in accepted
+                ],
+                skip_duplicates=True,
+            ),
+            timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+        )
+        jokes = await query(
+            "Joke.find_many",
+            prisma.models.Joke.prisma(tx).find_many(
+                where={"id": {"in": [submission.jokeId for submission in accepted]}}
+            ),
+            timeout=DB_LONG_QUERY_TIMEOUT_SECONDS,
+        )
+        created = {joke.id for joke in jokes}
+        return [submission for submission in accepted if submission.jokeId in created]
+
+    async def measure(self) -> None:
+        """
+        Refreshes the queue depth and lag gauges.
+        """
+        depth = await query(
+            "Submission.count",
+            prisma.models.Submission.prisma().count(where={"status": "PENDING"}),
+        )
+        oldest = await query(
+            "Submission.find_first",
+            prisma.models.Submission.prisma().find_first(
+                where={"status": "PENDING"}, order={"createdAt": "asc"}
+            ),
+        )
+        SUBMISSION_QUEUE_DEPTH.set(depth)
+        SUBMISSION_QUEUE_LAG.set(
+            0 if oldest is None else max(0.0, time.time() - oldest.createdAt.timestamp())
+        )
+
+
+submission_queue = SubmissionQueue()
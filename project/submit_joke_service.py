@@ -0,0 +1,65 @@
+import os
+
+import prisma
+import prisma.enums
+import prisma.errors
+import prisma.models
+from project.db import query
+from project.metrics import time_serialization
+from project.sessions import InvalidSessionError
+from project.submission_queue import submission_queue
+from pydantic import BaseModel
+
+SUBMISSION_MAX_LENGTH = int(os.getenv("SUBMISSION_MAX_LENGTH", "2000"))
+
+
+class SubmitJokeResponse(BaseModel):
+    """
+    Acknowledgment that a joke was queued for moderation. It is published, or rejected, shortly
+    after.
+    """
+
+    submissionId: str
+    status: prisma.enums.SubmissionStatus
+
+
+async def submit_joke(user_id: str, content: str) -> SubmitJokeResponse:
+    """
+    Queues a user's joke for moderation.
+
+    Only the PENDING Submission row is written here. The submission queue checks it and creates
+    the joke in the background, in batches with other submissions.
+
+    Args:
+        user_id (str): The ID of the logged-in user, as resolved from their session token.
+        content (str): The text of the joke, at most SUBMISSION_MAX_LENGTH characters.
+
+    Returns:
+        SubmitJokeResponse: Acknowledgment that the joke was queued for moderation.
+
+    Raises:
+        InvalidSessionError: If the session's user no longer exists.
+    """
+    content = content.strip()
+    if not content:
+        raise ValueError("Joke content must not be empty")
+    if len(content) > SUBMISSION_MAX_LENGTH:
+        raise ValueError(f"Joke content must be at most {SUBMISSION_MAX_LENGTH} characters")
+    try:
+        submission = await query(
+            "Submission.create",
+            prisma.models.Submission.prisma().create(
+                data={
+                    "userId": user_id,
+                    "content": content,
+                    "status": prisma.enums.SubmissionStatus.PENDING,
+                }
+            ),
+        )
+    except prisma.errors.ForeignKeyViolationError:
+        raise InvalidSessionError("User no longer exists")
+    submission_queue.notify()
+    with time_serialization("SubmitJokeResponse"):
+        return SubmitJokeResponse(
+            submissionId=submission.id, status=prisma.enums.SubmissionStatus.PENDING
+        )
@@ -2,6 +2,10 @@ from typing import Dict, Optional
 
 import prisma
 import prisma.models
+from project.db import DatabaseUnavailableError, query
+from project.metrics import time_serialization
+from project.profile_cache import profile_cache
+from project.sessions import InvalidSessionError
 from pydantic import BaseModel
 
 
@@ -16,6 +20,7 @@ class UpdateUserProfileResponse(BaseModel):
 
 
 async def update_user_profile(
+    user_id: str,
     name: Optional[str],
     email: Optional[str],
     profile_picture_url: Optional[str],
@@ -27,7 +32,11 @@ async def update_user_profile(
     This function validates the input parameters and updates the user's profile information in the database accordingly.
     It uses Prisma as ORM to interact with the PostgreSQL database to perform update operations.
 
+    The user's cached profile is invalidated after the write, so the next read of /users/me sees
+    the update.
+
     Args:
+        user_id (str): The ID of the logged-in user, as resolved from their session token.
         name (Optional[str]): The updated name for the user. It's an optional field.
         email (Optional[str]): The updated email for the user. It must be a valid email format and unique across users.
         profile_picture_url (Optional[str]): A new URL pointing to the user's updated profile picture. It's optional and should be validated to ensure it's a valid URL format.
@@ -36,8 +45,12 @@ async def update_user_profile(
     Returns:
         UpdateUserProfileResponse: Communicates the success status of the user profile update operation, potentially echoing back the updated information.
 
+    Raises:
+        InvalidSessionError: If the session's user no longer exists.
+        DatabaseUnavailableError: If the database is unreachable or its circuit breaker is open.
+
     Example:
-        await update_user_profile(name="John Doe", email="john.doe@example.com", profile_picture_url="https://example.com/johndoe.jpg", bio="Just a regular person.")
+        await update_user_profile(user_id, name="John Doe", email="john.doe@example.com", profile_picture_url="https://example.com/johndoe.jpg", bio="Just a regular person.")
         > UpdateUserProfileResponse(status='success', updated_fields={'name': 'John Doe', 'email': 'john.doe@example.com', 'profile_picture_url': 'https://example.com/johndoe.jpg', 'bio': 'Just a regular person.'}, message='Profile updated successfully')
     """
     update_data = {}
@@ -50,21 +63,31 @@ async def update_user_profile(
     if bio:
         update_data["bio"] = bio
     try:
-        current_user_email = "example_user_email@example.com"
-        updated_user = await prisma.models.User.prisma().update(
-            where={"email": current_user_email}, data=update_data
-        )
-        response_updated_fields = {
-            key: val for key, val in update_data.items() if val is not None
-        }
-        return UpdateUserProfileResponse(
-            status="success",
-            updated_fields=response_updated_fields,
-            message="Profile updated successfully.",
+        updated_user = await query(
+            "User.update",
+            prisma.models.User.prisma().update(where={"id": user_id}, data=update_data),
         )
+    except DatabaseUnavailableError:
+        # A write abandoned at its deadline may still be applied.
+        profile_cache.invalidate(user_id)
+        raise
     except Exception as e:
+        # The write may have been applied before the error, so the cached profile is dropped anyway.
+        profile_cache.invalidate(user_id)
         return UpdateUserProfileResponse(
             status="failed",
             updated_fields={},
             message=f"Failed to update profile: {str(e)}",
         )
+    profile_cache.invalidate(user_id)
+    if updated_user is None:
+        raise InvalidSessionError("User no longer exists")
+    response_updated_fields = {
+        key: val for key, val in update_data.items() if val is not None
+    }
+    with time_serialization("UpdateUserProfileResponse"):
+        return UpdateUserProfileResponse(
+            status="success",
+            updated_fields=response_updated_fields,
+            message="Profile updated successfully.",
+        )
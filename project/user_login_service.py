@@ -1,8 +1,11 @@
 from typing import Optional
 
-import bcrypt
 import prisma
 import prisma.models
+from project.db import query
+from project.metrics import time_serialization
+from project.password_hashing import password_hasher
+from project.sessions import session_signer
 from pydantic import BaseModel
 
 
@@ -22,16 +25,22 @@ async def user_login(email: str, password: str) -> UserLoginResponse:
 
     Args:
         email (str): The email address supplied by the user for login.
-        password (str): The password supplied by the user for login. In a real application, this password
-            would need to be securely hashed and compared against a stored hash.
+        password (str): The password supplied by the user for login. It is checked against the stored bcrypt
+            hash on the password hashing pool, off the event loop.
 
     Returns:
-        UserLoginResponse: Response model for the login endpoint. Contains either the authentication token
-        for the session or an error message in case of a failed login attempt.
+        UserLoginResponse: Response model for the login endpoint. Contains either the signed session
+        token, to be sent back as ``Authorization: Bearer <token>``, or an error message in case of a
+        failed login attempt.
     """
-    user = await prisma.models.User.prisma().find_unique(where={"email": email})
-    if user and bcrypt.checkpw(password.encode("utf-8"), user.password.encode("utf-8")):
-        token = f"secure-token-for-{user.id}"
-        return UserLoginResponse(token=token)
+    user = await query(
+        "User.find_unique",
+        prisma.models.User.prisma().find_unique(where={"email": email}),
+    )
+    if user and await password_hasher.verify(password, user.password):
+        token = session_signer.issue(user.id)
+        with time_serialization("UserLoginResponse"):
+            return UserLoginResponse(token=token)
     else:
-        return UserLoginResponse(token="", error="Invalid email or password")
+        with time_serialization("UserLoginResponse"):
+            return UserLoginResponse(token="", error="Invalid email or password")
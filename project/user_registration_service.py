@@ -1,9 +1,11 @@
 from typing import Optional
 
-import bcrypt
 import prisma
 import prisma.enums
 import prisma.models
+from project.db import query
+from project.metrics import time_serialization
+from project.password_hashing import password_hasher
 from pydantic import BaseModel
 
 
@@ -29,25 +31,27 @@ async def user_registration(
 
     Args:
         email (str): The email address for the user. This must be unique across the userbase.
-        password (str): The user's chosen password. This will be hashed before storage for security.
+        password (str): The user's chosen password. This will be hashed on the password hashing pool before storage for security.
         username (Optional[str]): An optional username for the user. This can be used for display purposes across the platform.
         role (Optional[str]): The initial role of the user in the system. Typically defaults to 'USER' if not specified.
 
     Returns:
         UserRegistrationResponse: Response model for a successful user registration. It confirms the user has been registered but does not expose sensitive information.
     """
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode(
-        "utf-8"
-    )
+    hashed_password = await password_hasher.hash(password)
     final_role = (
         prisma.enums.Role.USER if role is None else prisma.enums.Role(role.upper())
     )
-    new_user = await prisma.models.User.prisma().create(
-        data={"email": email, "password": hashed_password, "role": final_role}
-    )
-    return UserRegistrationResponse(
-        message="User successfully registered.",
-        user_id=new_user.id,
-        email=new_user.email,
-        username=username,
+    new_user = await query(
+        "User.create",
+        prisma.models.User.prisma().create(
+            data={"email": email, "password": hashed_password, "role": final_role}
+        ),
     )
+    with time_serialization("UserRegistrationResponse"):
+        return UserRegistrationResponse(
+            message="User successfully registered.",
+            user_id=new_user.id,
+            email=new_user.email,
+            username=username,
+        )
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from project.alias_table import AliasTable
+from project.joke_index import JokeIndex, joke_index
+from project.rating_aggregates import RatingAggregates, rating_aggregates
+
+logger = logging.getLogger(__name__)
+
+WEIGHTED_REBUILD_DELAY_SECONDS = float(
+    os.getenv("WEIGHTED_REBUILD_DELAY_SECONDS", "5")
+)
+# Added to every joke's weight so that unrated jokes still get some exposure.
+WEIGHTED_BASE_WEIGHT = float(os.getenv("WEIGHTED_BASE_WEIGHT", "1"))
+
+
+class WeightedJokeSampler:
+    """
+    Samples jokes from the joke index in proportion to their aggregate rating.
+
+    A Walker alias table is built over the per-joke score totals kept by the rating aggregates, so
+    each draw is O(1). Rating and corpus changes only mark the table stale; a rebuild is then scheduled
+    ``rebuild_delay`` seconds later, so bursts of changes share one rebuild. The event loop only
+    copies the joke IDs and the score totals; the weights and the table are computed from those
+    copies in an executor.
+
+    The table is built at startup, or in the background after startup in "snapshot" mode, where
+    weighted draws are uniform until it is done.
+    """
+
+    def __init__(
+        self,
+        index: JokeIndex,
+        aggregates: RatingAggregates,
+        rebuild_delay: float = WEIGHTED_REBUILD_DELAY_SECONDS,
+        base_weight: float = WEIGHTED_BASE_WEIGHT,
+    ) -> None:
+        self.index = index
+        self.aggregates = aggregates
+        self.rebuild_delay = rebuild_delay
+        self.base_weight = base_weight
+        self._ids: List[str] = []
+        self._table: Optional[AliasTable] = None
+        self._pending_rebuild: Optional[asyncio.TimerHandle] = None
+        self._rebuild_task: Optional[asyncio.Future] = None
+        index.subscribe(self._on_joke_changed)
+        aggregates.subscribe(self._on_rating_changed)
+
+    def _on_rating_changed(self, joke_id: str) -> None:
+        self.schedule_rebuild()
+
+    def _on_joke_changed(self, event: str, joke_id: str, content: Optional[str]) -> None:
+        if event != "update":
+            self.schedule_rebuild()
+
+    def schedule_rebuild(self) -> None:
+        if self._pending_rebuild is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._pending_rebuild = loop.call_later(
+            self.rebuild_delay, self._start_rebuild
+        )
+
+    def _start_rebuild(self) -> None:
+        self._rebuild_task = asyncio.ensure_future(self.rebuild())
+
+    def close(self) -> None:
+        if self._pending_rebuild is not None:
+            self._pending_rebuild.cancel()
+            self._pending_rebuild = None
+
+    async def rebuild(self) -> None:
+        self._pending_rebuild = None
+        if not self.index.loaded:
+            return
+        if self.index.shared:
+            # Walking the mapped snapshot takes long enough to be done a chunk at a time.
+            ids = [joke_id async for chunk in self.index.chunks() for joke_id, _ in chunk]
+        else:
+            ids = self.index.ids()
+        # The weights are read from a copy of the aggregates, which keep changing on the loop.
+        table = await asyncio.get_running_loop().run_in_executor(
+            None, _build_table, ids, self.aggregates.totals(), self.base_weight
+        )
+        if table is None:
+            self._ids, self._table = [], None
+            return
+        self._ids, self._table = ids, table
+        logger.info("Rebuilt weighted joke alias table over %d jokes", len(ids))
+
+    def random(self) -> Optional[Tuple[str, str]]:
+        """
+        Returns a rating-weighted random ``(id, content)`` pair, or None if no table is built.
+
+        A joke removed since the last rebuild is replaced by a uniform pick from the index.
+        """
+        if self._table is None:
+            return None
+        joke_id = self._ids[self._table.draw()]
+        content = self.index.get(joke_id)
+        if content is None:
+            return self.index.random()
+        return joke_id, content
+
+
+def _build_table(
+    ids: List[str], totals: Dict[str, List[int]], base_weight: float
+) -> Optional[AliasTable]:
+    weights = [
+        base_weight + max(totals[joke_id][1] if joke_id in totals else 0, 0) for joke_id in ids
+    ]
+    if not ids or sum(weights) <= 0:
+        return None
+    return AliasTable(weights)
+
+
+weighted_joke_sampler = WeightedJokeSampler(joke_index, rating_aggregates)
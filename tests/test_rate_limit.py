@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from project.rate_limit import (
+    LocalBuckets,
+    RateLimitMiddleware,
+    RateLimitPolicy,
+    SharedBuckets,
+    parse_policies,
+)
+
+POLICY = RateLimitPolicy(3, 1.0)
+
+
+def _app() -> Starlette:
+    return Starlette(routes=[Route("/joke", lambda request: PlainTextResponse("ok"))])
+
+
+def _statuses(middleware: RateLimitMiddleware, client: str, count: int) -> list:
+    async def run() -> list:
+        transport = httpx.ASGITransport(app=middleware, client=(client, 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            return [(await http.get("/joke")).status_code for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_parse_policies():
+    policies = parse_policies("GET /joke=100/1, post /users/login=10/60,GET /metrics=0,*=50/1")
+    assert policies == {
+        "GET /joke": RateLimitPolicy(100, 1.0),
+        "POST /users/login": RateLimitPolicy(10, 60.0),
+        "GET /metrics": None,
+        "*": RateLimitPolicy(50, 1.0),
+    }
+    assert parse_policies("") == {}
+
+
+def test_local_and_shared_buckets_agree(tmp_path):
+    # The shared backend against a file of its own stands in for the workers of one host.
+    shared = SharedBuckets(str(tmp_path / "buckets"), max_keys=64, shards=4)
+    try:
+        for backend in (LocalBuckets(max_keys=64, shards=4), shared):
+            decisions = [backend.take("client", POLICY, 1000.0) for _ in range(4)]
+            assert [decision.allowed for decision in decisions] == [True, True, True, False]
+            assert [decision.remaining for decision in decisions] == [2, 1, 0, 0]
+            assert decisions[-1].retry_after > 0
+            # One token back after a third of the window, and other keys are untouched.
+            assert backend.take("client", POLICY, 1000.0 + 1 / 3).allowed
+            assert backend.take("other", POLICY, 1000.0).allowed
+    finally:
+        shared.close()
+
+
+def test_shared_buckets_are_seen_by_every_mapping(tmp_path):
+    path = str(tmp_path / "buckets")
+    first = SharedBuckets(path, max_keys=64, shards=4)
+    second = SharedBuckets(path, max_keys=64, shards=4)
+    try:
+        for _ in range(3):
+            assert first.take("client", POLICY, 1000.0).allowed
+        assert not second.take("client", POLICY, 1000.0).allowed
+    finally:
+        first.close()
+        second.close()
+
+
+def test_middleware_refuses_with_headers(tmp_path):
+    app = _app()
+    for backend in (LocalBuckets(), SharedBuckets(str(tmp_path / "buckets"), max_keys=64)):
+        middleware = RateLimitMiddleware(app, app, policies={"*": POLICY}, backend=backend)
+        assert _statuses(middleware, "10.0.0.1", 4) == [200, 200, 200, 429]
+        # Clients are told apart by address.
+        assert _statuses(middleware, "10.0.0.2", 1) == [200]
+
+        async def refused() -> httpx.Response:
+            transport = httpx.ASGITransport(app=middleware, client=("10.0.0.1", 1234))
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await http.get("/joke")
+
+        response = asyncio.run(refused())
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+        assert response.headers["ratelimit-limit"] == "3"
+        assert response.headers["ratelimit-remaining"] == "0"
+        assert response.headers["ratelimit-policy"] == "3;w=1"
+
+
+def test_middleware_is_off_without_policies():
+    app = _app()
+    middleware = RateLimitMiddleware(app, app, policies={}, backend=LocalBuckets())
+    assert _statuses(middleware, "10.0.0.1", 10) == [200] * 10